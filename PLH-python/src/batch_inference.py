@@ -0,0 +1,348 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+import json
+import os
+import secrets
+import threading
+import time
+from langchain_core.messages import AIMessage, convert_to_messages, convert_to_openai_messages
+from openai import OpenAI
+from src.conversation_tracer import ConversationTracer
+from src.load_test import SilentUI
+from src.main import play_turn
+from src.session import Session
+
+DEFAULT_BATCH_DIRECTORY = "batches"
+DEFAULT_PROVIDER_BASE_URL = "https://api.together.xyz/v1"
+CHAT_COMPLETIONS_ENDPOINT = "/v1/chat/completions"
+
+
+class BatchError(Exception):
+    """A batch, or one request in it, failed at the provider"""
+
+
+def read_jsonl(path: str) -> List[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def write_jsonl(path: str, records: List[dict]):
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class ProviderBatchClient:
+    """Submits batch files to an OpenAI-compatible batch API, Together's by default.
+
+    The input file is uploaded, a batch is created for the chat completions
+    endpoint, and the output and error files are downloaded once it completes.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        completion_window: str = "24h",
+        purpose: str = "batch",
+    ):
+        self.client = OpenAI(
+            base_url=base_url or os.getenv("TOGETHER_API_BASE") or DEFAULT_PROVIDER_BASE_URL,
+            api_key=api_key or os.getenv("TOGETHER_API_KEY"),
+        )
+        self.completion_window = completion_window
+        self.purpose = purpose
+
+    def submit(self, path: str) -> str:
+        with open(path, "rb") as f:
+            uploaded = self.client.files.create(file=f, purpose=self.purpose)
+        batch = self.client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint=CHAT_COMPLETIONS_ENDPOINT,
+            completion_window=self.completion_window,
+        )
+        return batch.id
+
+    def poll(self, batch_id: str) -> Optional[List[dict]]:
+        """The output records once the batch has completed, otherwise None"""
+        batch = self.client.batches.retrieve(batch_id)
+        if batch.status in ("failed", "expired", "cancelled"):
+            raise BatchError(f"Batch {batch_id} {batch.status}")
+        if batch.status != "completed":
+            return None
+
+        records = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                text = self.client.files.content(file_id).text
+                records.extend(json.loads(line) for line in text.splitlines() if line.strip())
+        return records
+
+
+class LocalBatchClient:
+    """Stand-in for a provider batch API that works on local files.
+
+    A submitted batch is copied into its own folder and answered in the
+    background, one interactive call per line, through `llm_factory`. Status
+    and output are files in the same format the provider returns, so the
+    whole batch path can be tested without a batch endpoint (or, with
+    TOGETHER_API_BASE pointing at the `load-test` stub, without any API).
+    """
+
+    def __init__(self, directory: str, llm_factory: Callable, concurrency: int = 8):
+        self.directory = directory
+        self.llm_factory = llm_factory
+        self.concurrency = concurrency
+
+    def _batch_path(self, batch_id: str, name: str) -> str:
+        return os.path.join(self.directory, batch_id, name)
+
+    def _write_status(self, batch_id: str, status: str):
+        with open(self._batch_path(batch_id, "status.json"), "w", encoding="utf-8") as f:
+            json.dump({"id": batch_id, "status": status}, f)
+
+    def _answer(self, record: dict) -> dict:
+        body = record["body"]
+        try:
+            llm = self.llm_factory(body["model"], body.get("temperature"))
+            response = llm.invoke(convert_to_messages(body["messages"]))
+        except Exception as e:
+            return {
+                "custom_id": record["custom_id"],
+                "response": None,
+                "error": {"message": f"{type(e).__name__}: {e}"},
+            }
+        usage = getattr(response, "usage_metadata", None) or {}
+        return {
+            "custom_id": record["custom_id"],
+            "response": {
+                "status_code": 200,
+                "body": {
+                    "model": body["model"],
+                    "choices": [
+                        {"message": {"role": "assistant", "content": response.content}}
+                    ],
+                    "usage": {
+                        "prompt_tokens": usage.get("input_tokens", 0),
+                        "completion_tokens": usage.get("output_tokens", 0),
+                    },
+                },
+            },
+            "error": None,
+        }
+
+    def _process(self, batch_id: str):
+        records = read_jsonl(self._batch_path(batch_id, "input.jsonl"))
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            output = list(executor.map(self._answer, records))
+        write_jsonl(self._batch_path(batch_id, "output.jsonl"), output)
+        self._write_status(batch_id, "completed")
+
+    def submit(self, path: str) -> str:
+        batch_id = f"batch_{secrets.token_hex(6)}"
+        os.makedirs(os.path.join(self.directory, batch_id))
+        write_jsonl(self._batch_path(batch_id, "input.jsonl"), read_jsonl(path))
+        self._write_status(batch_id, "in_progress")
+        threading.Thread(
+            target=self._process, args=(batch_id,), name=batch_id, daemon=True
+        ).start()
+        return batch_id
+
+    def poll(self, batch_id: str) -> Optional[List[dict]]:
+        with open(self._batch_path(batch_id, "status.json"), "r", encoding="utf-8") as f:
+            status = json.load(f)["status"]
+        if status != "completed":
+            return None
+        return read_jsonl(self._batch_path(batch_id, "output.jsonl"))
+
+
+class BatchBackend:
+    """Sends Framework model calls as batch jobs instead of one request at a time.
+
+    `run` plays many sessions, each in its own thread. A model call made by a
+    session blocks until the next batch round: once every running session is
+    waiting on a call, the calls are written to one JSONL batch file,
+    submitted, polled until the batch completes, and each session gets its
+    reply. Every multi-turn session therefore advances one step per round.
+    """
+
+    def __init__(
+        self,
+        client,
+        directory: str = DEFAULT_BATCH_DIRECTORY,
+        poll_seconds: float = 30.0,
+        max_sessions: int = 1000,
+    ):
+        self.client = client
+        self.directory = os.path.join(
+            directory, datetime.now().strftime("%Y%m%d_%H%M%S")
+        )
+        self.poll_seconds = poll_seconds
+        self.max_sessions = max_sessions
+        self.rounds = 0
+        self.requests = 0
+        self._pending: List[Tuple[dict, Future]] = []
+        self._remaining = 0
+        self._condition = threading.Condition()
+
+    @classmethod
+    def from_config(
+        cls,
+        config_data: dict,
+        llm_factory: Callable,
+        provider: Optional[str] = None,
+        directory: Optional[str] = None,
+    ) -> "BatchBackend":
+        """Build a backend from the optional `batch` config section"""
+        settings = config_data.get("batch") or {}
+        provider = provider or settings.get("provider", "local")
+        directory = directory or settings.get("directory", DEFAULT_BATCH_DIRECTORY)
+        if provider == "local":
+            client = LocalBatchClient(
+                os.path.join(directory, "local"),
+                llm_factory,
+                settings.get("local_concurrency", 8),
+            )
+            default_poll_seconds = 0.2
+        else:
+            client = ProviderBatchClient(
+                settings.get("base_url"),
+                completion_window=settings.get("completion_window", "24h"),
+                purpose=settings.get("purpose", "batch"),
+            )
+            default_poll_seconds = 30.0
+        return cls(
+            client,
+            directory,
+            poll_seconds=settings.get("poll_seconds", default_poll_seconds),
+            max_sessions=settings.get("max_sessions", 1000),
+        )
+
+    def call(self, llm, messages) -> AIMessage:
+        """Queue one chat completion for the next round and wait for its reply"""
+        future = Future()
+        body = {
+            "model": llm.model_name,
+            "temperature": llm.temperature,
+            "messages": convert_to_openai_messages(messages),
+        }
+        with self._condition:
+            self._pending.append((body, future))
+            self._condition.notify_all()
+        return future.result()
+
+    def _session(self, job: Callable):
+        try:
+            return job()
+        finally:
+            with self._condition:
+                self._remaining -= 1
+                self._condition.notify_all()
+
+    def _round_ready(self) -> bool:
+        # Sessions that are running, or about to start in a free worker, must all be waiting
+        running = min(self.max_sessions, self._remaining)
+        return self._remaining == 0 or (
+            bool(self._pending) and len(self._pending) >= running
+        )
+
+    def run(self, jobs: List[Callable], on_result: Optional[Callable] = None) -> List[Future]:
+        """Run every job (a function playing one session) to completion in batch rounds.
+
+        Returns one future per job, in order.
+        """
+        with self._condition:
+            self._remaining = len(jobs)
+        futures = []
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(self.max_sessions, len(jobs))),
+            thread_name_prefix="batch-session",
+        ) as executor:
+            for job in jobs:
+                future = executor.submit(self._session, job)
+                if on_result is not None:
+                    future.add_done_callback(on_result)
+                futures.append(future)
+
+            while True:
+                with self._condition:
+                    self._condition.wait_for(self._round_ready)
+                    if self._remaining == 0:
+                        break
+                    requests, self._pending = self._pending, []
+                self._run_round(requests)
+        return futures
+
+    def _run_round(self, requests: List[Tuple[dict, Future]]):
+        self.rounds += 1
+        self.requests += len(requests)
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"round_{self.rounds:05d}.jsonl")
+        write_jsonl(
+            path,
+            [
+                {
+                    "custom_id": f"request-{index}",
+                    "method": "POST",
+                    "url": CHAT_COMPLETIONS_ENDPOINT,
+                    "body": body,
+                }
+                for index, (body, _) in enumerate(requests)
+            ],
+        )
+
+        try:
+            batch_id = self.client.submit(path)
+            records = self.client.poll(batch_id)
+            while records is None:
+                time.sleep(self.poll_seconds)
+                records = self.client.poll(batch_id)
+        except Exception as e:
+            for _, future in requests:
+                future.set_exception(e)
+            return
+
+        by_id: Dict[str, dict] = {record["custom_id"]: record for record in records}
+        for index, (_, future) in enumerate(requests):
+            record = by_id.get(f"request-{index}")
+            try:
+                future.set_result(self._reply(record))
+            except BatchError as e:
+                future.set_exception(e)
+
+    @staticmethod
+    def _reply(record: Optional[dict]) -> AIMessage:
+        if record is None:
+            raise BatchError("No result for this request in the batch output")
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            error = record.get("error") or response.get("body")
+            raise BatchError(f"Batch request failed: {error}")
+        body = response["body"]
+        usage = body.get("usage") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+        return AIMessage(
+            content=body["choices"][0]["message"]["content"],
+            usage_metadata={
+                "input_tokens": prompt_tokens,
+                "output_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        )
+
+
+def play_scripted_session(
+    framework, script: List[str], retry_message: str, initiator: Optional[str] = None
+) -> ConversationTracer:
+    """Play one synthetic parent's messages until the conversation ends, then summarise it"""
+    session = Session(priority="batch")
+    if initiator:
+        session.conversation_trace.add_conversation_initiator(initiator)
+    ui = SilentUI()
+    for parent_input in script:
+        if play_turn(framework, session, ui, parent_input, retry_message):
+            break
+    session.conversation_trace.set_summary(framework.generate_summary(session, "", ""))
+    return session.conversation_trace
@@ -0,0 +1,1286 @@
+from rich.console import Console
+from rich.markup import escape
+from rich.progress import Progress
+from rich.table import Table
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+import argparse
+import os
+import sys
+import yaml
+from src.batch_inference import BatchBackend, play_scripted_session
+from src.config import Config, ConfigValidationError
+from src.conversation_tracer import ConversationTracer, new_session_id
+from src.decision_classifier import DecisionClassifier
+from src.decision_types import DecisionType
+from src.experiment import Experiment, arm_stats, compare_arms, load_turn_records
+from src.formatter import ConversationUI
+from src.framework import Framework
+from src.load_test import LatencyDistribution, StubSettings, run_load_test
+from src.main import play_turn
+from src.opening_pool import OpeningPool, build_opening_pool, common_openers
+from src.prescore import prescore_file
+from src.profiler import SessionProfiler
+from src.replay import (
+    AgreementMatrix,
+    find_trace_files,
+    load_replay_turns,
+    run_replay,
+)
+from src.response_cache import ResponseCache
+from src.session import Session
+from src.session_manager import SessionManager
+from src.spans import (
+    DEFAULT_SPANS_PATH,
+    load_spans,
+    run_collector,
+    span_stats,
+)
+from src.token_counter import TokenCounter, config_static_sizes
+from src.trace_csv_exporter import TraceExporter
+from src.trace_store import TraceStore
+from src.turn_engine import (
+    TURN_COMPLETE,
+    TURN_ERROR,
+    TurnEngine,
+    TurnRecorder,
+    TurnResult,
+    run_turn_server,
+)
+from src.warmup import WarmUp
+
+console = Console()
+
+
+def replay_command(args) -> None:
+    """Re-run recorded parent turns through generate_decision with a new config"""
+    ui = ConversationUI(console)
+
+    trace_files = find_trace_files(args.traces)
+    turns = load_replay_turns(trace_files)
+    if not turns:
+        ui.display_error_message("No recorded parent turns found in the given traces")
+        sys.exit(1)
+    ui.display_system_message(
+        f"Replaying {len(turns)} turns from {len(trace_files)} traces "
+        f"with concurrency {args.concurrency}"
+    )
+
+    config = Config(config_path=args.config)
+    response_cache = None if args.no_cache else ResponseCache(args.cache)
+    framework = Framework(config=config, response_cache=response_cache)
+    if args.batch:
+        framework.batch_backend = BatchBackend.from_config(
+            config.get(), Framework._create_llm, provider=args.batch, directory=args.batch_dir
+        )
+
+    with Progress(console=console) as progress:
+        task = progress.add_task("Replaying", total=len(turns))
+        results = run_replay(
+            framework,
+            turns,
+            concurrency=args.concurrency,
+            on_result=lambda result: progress.advance(task),
+        )
+
+    matrix = AgreementMatrix(results)
+    console.print(matrix.to_table())
+    ui.display_system_message(
+        f"Agreement: {matrix.agreement:.1%} over {matrix.total} turns "
+        f"({matrix.errors} errors)"
+    )
+    if response_cache is not None:
+        ui.display_system_message(
+            f"Response cache: {response_cache.hits} hits, {response_cache.misses} misses"
+        )
+
+    if args.output:
+        report = matrix.to_dict()
+        report["disagreements"] = [
+            {
+                "trace_file": result.turn.trace_file,
+                "turn_index": result.turn.turn_index,
+                "parent": result.turn.parent,
+                "recorded": result.turn.expected_decision,
+                "replayed": result.decision,
+                "reasoning": result.reasoning,
+                "error": result.error,
+            }
+            for result in results
+            if not result.agrees
+        ]
+        with open(args.output, "w", encoding="utf-8") as f:
+            yaml.safe_dump(report, f, sort_keys=False, width=10000)
+        ui.display_system_message(f"Replay report saved to: {args.output}")
+
+
+def branch_command(args) -> None:
+    """Fork a recorded conversation at one turn and play alternative parent replies"""
+    ui = ConversationUI(console)
+    replies = list(args.reply or [])
+    if args.replies:
+        replies.extend(read_script(ui, args.replies))
+    if not replies:
+        ui.display_error_message("Give at least one alternative with --reply or --replies")
+        sys.exit(1)
+
+    with open(args.trace, "r", encoding="utf-8") as f:
+        recorded = Session(
+            session_id=os.path.splitext(os.path.basename(args.trace))[0].removeprefix(
+                "trace_"
+            ),
+            conversation_trace=ConversationTracer.from_dict(yaml.safe_load(f) or {}),
+            priority="batch",
+        )
+    try:
+        branches = [recorded.fork(args.turn) for _ in replies]
+    except ValueError as e:
+        ui.display_error_message(str(e))
+        sys.exit(1)
+
+    config = Config(config_path=args.config)
+    response_cache = None if args.no_cache else ResponseCache(args.cache)
+    framework = Framework(config=config, response_cache=response_cache)
+    retry_message = config.get("static_messages", "retry_message")
+
+    def play(branch: Session, reply: str) -> TurnResult:
+        result = TurnResult(session_id=branch.session_id, sequence=args.turn, parent=reply)
+        try:
+            result.conversation_ended = play_turn(
+                framework, branch, TurnRecorder(result), reply, retry_message
+            )
+            result.status = TURN_COMPLETE
+            branch.conversation_trace.save_trace(
+                "full", f"trace_{branch.session_id}.yaml"
+            )
+        except Exception as e:
+            result.status = TURN_ERROR
+            result.error = f"{type(e).__name__}: {e}"
+        return result
+
+    ui.display_system_message(
+        f"Playing {len(replies)} alternatives at turn {args.turn} of {args.trace}"
+    )
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(play, branches, replies))
+
+    table = Table(title=f"Alternatives at turn {args.turn}")
+    for column in ["Session", "Parent", "Decision", "Coaching", "Child"]:
+        table.add_column(column)
+    for result in results:
+        table.add_row(
+            result.session_id,
+            escape(result.parent),
+            str(result.decision) if result.error is None else "error",
+            escape(result.coaching or result.error or ""),
+            escape(result.child or ""),
+        )
+    console.print(table)
+    ui.display_system_message("Branch traces saved to traces/")
+    if response_cache is not None:
+        ui.display_system_message(
+            f"Response cache: {response_cache.hits} hits, {response_cache.misses} misses"
+        )
+
+
+def config_size_command(args) -> None:
+    """Report the static token cost of every pipeline prompt in each config"""
+    counter = TokenCounter()
+    for config_path in args.configs:
+        with open(config_path, "r", encoding="utf-8") as f:
+            config_data = yaml.safe_load(f) or {}
+
+        table = Table(title=f"{config_path} ({counter.method} tokens)")
+        table.add_column("Pipeline")
+        for column in ["Instructions", "Objectives", "Description", "Conditions"]:
+            table.add_column(column, justify="right")
+        table.add_column("Static total", justify="right")
+
+        sizes = config_static_sizes(config_data, counter)
+        for pipeline, size in sizes.items():
+            table.add_row(
+                pipeline,
+                str(size["instructions"]),
+                str(size["objectives"]),
+                str(size["description"]),
+                str(size["conditions"]),
+                str(size["total"]),
+            )
+        table.add_row(
+            "[bold]All pipelines[/bold]",
+            "",
+            "",
+            "",
+            "",
+            f"[bold]{sum(size['total'] for size in sizes.values())}[/bold]",
+        )
+        console.print(table)
+
+
+def warm_cache_command(args) -> None:
+    """Precompute a pool of first turns for the common opening messages of a config"""
+    ui = ConversationUI(console)
+    config = Config(config_path=args.config)
+
+    openers = list(config.get("warm_cache", "openers", default=[]) or [])
+    if args.from_traces:
+        openers += common_openers(find_trace_files(args.from_traces), args.top)
+    unique_openers = {}
+    for opener in openers:
+        unique_openers.setdefault(OpeningPool.normalize(opener), opener)
+    openers = list(unique_openers.values())
+    if not openers:
+        ui.display_error_message(
+            "No opening messages found. Set warm_cache.openers or use --from-traces"
+        )
+        sys.exit(1)
+
+    pool_size = args.pool_size or config.get("warm_cache", "pool_size", default=3)
+    framework = Framework(config=config)
+    # Always generate fresh turns rather than serving an older pool
+    framework.opening_pool = None
+
+    ui.display_system_message(
+        f"Generating {pool_size} first turns for each of {len(openers)} opening messages"
+    )
+    pool = build_opening_pool(
+        framework, openers, pool_size=pool_size, concurrency=args.concurrency
+    )
+    pool_file = pool.save(config.get(), config.get("warm_cache", "directory"))
+    ui.display_system_message(f"Opening pool saved to: {pool_file}")
+
+
+def build_classifier_command(args) -> None:
+    """Build the nearest-neighbour decision index from the decisions in saved traces"""
+    ui = ConversationUI(console)
+    config = Config(config_path=args.config)
+    turns = load_replay_turns(find_trace_files(args.traces))
+    if not turns:
+        ui.display_error_message("No recorded parent turns found in the given traces")
+        sys.exit(1)
+
+    classifier = DecisionClassifier.build(
+        [
+            {
+                "parent": turn.parent,
+                "turn_count": turn.turn_count,
+                "decision": turn.expected_decision,
+                "reasoning": turn.recorded_reasoning,
+            }
+            for turn in turns
+        ],
+        n_features=args.features,
+        fingerprint=DecisionClassifier.config_fingerprint(config.get()),
+    )
+    index_file = classifier.save(args.output)
+    ui.display_system_message(
+        f"Decision index with {len(turns)} examples saved to: {index_file}"
+    )
+
+
+def span_report_command(args) -> None:
+    """Summarise span latencies per stage, optionally against a baseline"""
+    ui = ConversationUI(console)
+    stats = span_stats(load_spans(args.spans))
+    if not stats:
+        ui.display_error_message("No spans found in the given files")
+        sys.exit(1)
+    baseline = span_stats(load_spans(args.baseline)) if args.baseline else {}
+
+    table = Table(title="Span latency per stage (ms)")
+    table.add_column("Span")
+    for column in ["Count", "p50", "p95", "Max"]:
+        table.add_column(column, justify="right")
+    if baseline:
+        table.add_column("p95 vs baseline", justify="right")
+
+    for name, stat in stats.items():
+        row = [
+            name,
+            str(stat["count"]),
+            f"{stat['p50'] * 1000:.1f}",
+            f"{stat['p95'] * 1000:.1f}",
+            f"{stat['max'] * 1000:.1f}",
+        ]
+        if baseline:
+            if name in baseline:
+                change = (stat["p95"] - baseline[name]["p95"]) * 1000
+                colour = "red" if change > 0 else "green"
+                row.append(f"[{colour}]{change:+.1f}[/{colour}]")
+            else:
+                row.append("")
+        table.add_row(*row)
+    console.print(table)
+
+
+def collect_spans_command(args) -> None:
+    """Run a local stand-in for an OpenTelemetry collector"""
+    ui = ConversationUI(console)
+    ui.display_system_message(
+        f"Collecting OTLP/JSON spans on http://{args.host}:{args.port}/v1/traces "
+        f"into {args.output} (Ctrl+C to stop)"
+    )
+    try:
+        run_collector(args.host, args.port, args.output)
+    except KeyboardInterrupt:
+        ui.display_system_message("Collector stopped")
+
+
+def import_traces_command(args) -> None:
+    """Load saved YAML traces into the trace store, in batched transactions"""
+    ui = ConversationUI(console)
+    trace_files = find_trace_files(args.traces)
+    store = TraceStore(args.store)
+
+    def sessions():
+        for trace_file in trace_files:
+            with open(trace_file, "r", encoding="utf-8") as f:
+                data = yaml.safe_load(f) or {}
+            session_id = os.path.splitext(os.path.basename(trace_file))[0]
+            if session_id.startswith("trace_"):
+                session_id = session_id[len("trace_"):]
+            yield session_id, ConversationTracer.from_dict(data), args.scenario
+
+    imported = 0
+    batch = []
+    for session in sessions():
+        batch.append(session)
+        if len(batch) >= args.batch_size:
+            imported += store.save_many(batch)
+            batch = []
+    imported += store.save_many(batch)
+    ui.display_system_message(f"Imported {imported} traces into {store.path}")
+
+
+def search_traces_command(args) -> None:
+    """Full-text search over the parent, child and coaching text of stored turns"""
+    ui = ConversationUI(console)
+    store = TraceStore(args.store)
+    try:
+        hits = store.search(
+            args.query, decision=args.decision, scenario=args.scenario, limit=args.limit
+        )
+    except ValueError as e:
+        ui.display_error_message(str(e))
+        sys.exit(1)
+    table = Table(title=f"{len(hits)} turns matching {args.query!r}")
+    table.add_column("Session")
+    table.add_column("Scenario")
+    table.add_column("Turn", justify="right")
+    table.add_column("Decision", justify="right")
+    table.add_column("Match")
+    for hit in hits:
+        table.add_row(
+            hit.session_id,
+            hit.scenario or "",
+            str(hit.turn_index),
+            "" if hit.decision is None else str(hit.decision),
+            escape(hit.snippet or ""),
+        )
+    console.print(table)
+
+
+def export_trace_command(args) -> None:
+    """Write a stored session out as a YAML trace or an annotation CSV"""
+    ui = ConversationUI(console)
+    store = TraceStore(args.store)
+    tracer = store.load(args.session_id)
+    if tracer is None:
+        ui.display_error_message(f"No stored session {args.session_id}")
+        sys.exit(1)
+
+    if args.format == "csv":
+        csv_file = TraceExporter(tracer).export_to_csv(
+            f"full_unfiltered_trace_{args.session_id}.csv"
+        )
+        ui.display_export_confirmation(csv_file)
+    else:
+        trace_file = tracer.save_trace("full", f"trace_{args.session_id}.yaml")
+        ui.display_save_confirmation(trace_file)
+
+
+def prescore_command(args) -> None:
+    """Pre-score the Facilitator and Reasoning rows of annotation CSVs with the judge prompt"""
+    ui = ConversationUI(console)
+    config = Config(config_path=args.config)
+    if not config.get("judge", "prompt"):
+        ui.display_error_message("No judge prompt configured. Add judge.prompt to the config.")
+        sys.exit(1)
+
+    response_cache = None if args.no_cache else ResponseCache(args.cache)
+    framework = Framework(config=config, response_cache=response_cache)
+    concurrency = args.concurrency or config.get("judge", "concurrency", default=8)
+    flag_below = args.flag_below or config.get("judge", "flag_below", default=3)
+
+    csv_files = []
+    for path in args.csv_files:
+        if os.path.isdir(path):
+            csv_files.extend(
+                sorted(
+                    os.path.join(path, name)
+                    for name in os.listdir(path)
+                    if name.endswith(".csv") and not name.endswith("_prescored.csv")
+                )
+            )
+        else:
+            csv_files.append(path)
+
+    for csv_file in csv_files:
+        with Progress(console=console, transient=True) as progress:
+            task = progress.add_task(f"Scoring {os.path.basename(csv_file)}", total=None)
+            summary = prescore_file(
+                framework,
+                csv_file,
+                concurrency=concurrency,
+                batch_size=args.batch_size,
+                flag_below=flag_below,
+                resume=not args.no_resume,
+                on_row=lambda: progress.advance(task),
+            )
+        ui.display_system_message(
+            f"{summary.output_path}: {summary.scored} rows scored, "
+            f"{summary.resumed} kept from an earlier run, {summary.flagged} flagged "
+            f"for review ({summary.errors} errors)"
+        )
+    if response_cache is not None:
+        ui.display_system_message(
+            f"Response cache: {response_cache.hits} hits, {response_cache.misses} misses"
+        )
+
+
+def parse_decision_weights(text: str) -> dict:
+    """Parse `0=2,1=3,5=0.5` into {decision: weight}"""
+    weights = {}
+    for item in text.split(","):
+        decision, _, weight = item.partition("=")
+        weights[int(decision)] = float(weight)
+    return weights
+
+
+def read_script(ui, path: str) -> List[str]:
+    """A YAML list of parent messages, played in order by a scripted session"""
+    with open(path, "r", encoding="utf-8") as f:
+        script = yaml.safe_load(f)
+    if not isinstance(script, list) or not all(
+        isinstance(message, str) for message in script
+    ):
+        ui.display_error_message("The script must be a YAML list of parent messages")
+        sys.exit(1)
+    return script
+
+
+def load_test_command(args) -> None:
+    """Drive concurrent scripted sessions against a local stub model server"""
+    ui = ConversationUI(console)
+    config = Config(config_path=args.config)
+
+    script = read_script(ui, args.script) if args.script else None
+
+    try:
+        settings = StubSettings(
+            latency=LatencyDistribution(args.latency),
+            decision_latency=(
+                LatencyDistribution(args.decision_latency)
+                if args.decision_latency
+                else None
+            ),
+            error_rate=args.error_rate,
+            rate_limit_rate=args.rate_limit_rate,
+            capacity=args.capacity,
+            seed=args.seed,
+        )
+        if args.decisions:
+            settings.decision_weights = parse_decision_weights(args.decisions)
+    except ValueError as e:
+        ui.display_error_message(str(e))
+        sys.exit(1)
+
+    ui.display_system_message(
+        f"Running {args.sessions} concurrent sessions against a stub server "
+        f"(latency {args.latency}, errors {args.error_rate:.0%}, "
+        f"429s {args.rate_limit_rate:.0%})"
+    )
+    with Progress(console=console) as progress:
+        task = progress.add_task("Sessions", total=args.sessions)
+        result = run_load_test(
+            config,
+            args.sessions,
+            settings,
+            script=script,
+            think_time=args.think_time,
+            on_session=lambda: progress.advance(task),
+        )
+
+    for table in result.to_tables():
+        console.print(table)
+    server = result.server
+    ui.display_system_message(
+        f"{result.turns} turns in {result.wall_seconds:.1f}s "
+        f"({result.throughput:.2f} turns/s); "
+        f"{result.completed_sessions}/{result.sessions} sessions completed"
+    )
+    ui.display_system_message(
+        f"Stub server: {server['requests']} requests, {server['errors']} errors, "
+        f"{server['rate_limited']} rate limited; queue p95 "
+        f"{server['queue_p95'] * 1000:.1f}ms, service p95 {server['service_p95'] * 1000:.1f}ms"
+    )
+    for error in result.errors[:5]:
+        ui.display_error_message(error)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            yaml.safe_dump(result.to_dict(), f, sort_keys=False, width=10000)
+        ui.display_system_message(f"Load test report saved to: {args.output}")
+
+
+def batch_simulate_command(args) -> None:
+    """Play scripted sessions through the batch backend and save their traces"""
+    ui = ConversationUI(console)
+    config = Config(config_path=args.config)
+    script = read_script(ui, args.script)
+
+    framework = Framework(config=config, track_daily_usage=not args.no_daily_usage)
+    framework.batch_backend = BatchBackend.from_config(
+        config.get(), Framework._create_llm, provider=args.provider, directory=args.batch_dir
+    )
+    retry_message = config.get("static_messages", "retry_message")
+    initiator = config.get("scenario", "conversation_initiator")
+
+    def session():
+        trace = play_scripted_session(framework, script, retry_message, initiator)
+        return trace.save_trace("full", f"trace_{new_session_id()}.yaml")
+
+    ui.display_system_message(
+        f"Simulating {args.sessions} sessions in batch rounds "
+        f"(batch files in {framework.batch_backend.directory})"
+    )
+    with Progress(console=console) as progress:
+        task = progress.add_task("Sessions", total=args.sessions)
+        futures = framework.batch_backend.run(
+            [session] * args.sessions, on_result=lambda done: progress.advance(task)
+        )
+
+    errors = [future.exception() for future in futures if future.exception()]
+    ui.display_system_message(
+        f"{args.sessions - len(errors)}/{args.sessions} sessions completed in "
+        f"{framework.batch_backend.rounds} batch rounds "
+        f"({framework.batch_backend.requests} requests); traces saved to traces/"
+    )
+    for error in errors[:5]:
+        ui.display_error_message(f"{type(error).__name__}: {error}")
+
+
+def serve_turns_command(args) -> None:
+    """Serve conversation turns over HTTP, answering each request by its deadline"""
+    ui = ConversationUI(console)
+    config = Config(config_path=args.config)
+    framework = Framework(config=config)
+    initiator = config.get("scenario", "conversation_initiator")
+
+    def new_session():
+        session = Session()
+        if initiator:
+            session.conversation_trace.add_conversation_initiator(initiator)
+        return session
+
+    experiment = Experiment.from_config(config, framework)
+    engine = TurnEngine.from_config(
+        framework, SessionManager(new_session, config), config, experiment
+    )
+    warm_up = WarmUp.from_config(config.get())
+    for arm_framework in experiment.frameworks() if experiment else [framework]:
+        warm_up.start(arm_framework)
+    if experiment is not None:
+        ui.display_system_message(
+            f"Experiment {experiment.name}: sessions split between "
+            f"{', '.join(arm.name for arm in experiment.arms)}, turns recorded in "
+            f"{experiment.path}"
+        )
+    ui.display_system_message(
+        f"Serving turns on http://{args.host}:{args.port} "
+        f"(deadline {engine.deadline_seconds:g}s, Ctrl+C to stop)"
+    )
+    try:
+        run_turn_server(engine, args.host, args.port)
+    except KeyboardInterrupt:
+        ui.display_system_message("Turn server stopped")
+
+
+def experiment_report_command(args) -> None:
+    """Compare the latency, tokens and outcomes of the arms of an experiment"""
+    ui = ConversationUI(console)
+    experiment = Experiment.from_config(Config(config_path=args.config))
+    paths = args.records
+    if not paths:
+        if experiment is None:
+            ui.display_error_message(
+                "No experiment in the config; pass the turn record files instead"
+            )
+            sys.exit(1)
+        paths = [experiment.path]
+    try:
+        records = load_turn_records(paths)
+    except FileNotFoundError as e:
+        ui.display_error_message(str(e))
+        sys.exit(1)
+    if not records:
+        ui.display_error_message("No turns recorded yet")
+        sys.exit(1)
+
+    stats = arm_stats(records)
+    baseline = args.baseline
+    if baseline is None:
+        # The first arm of the configured experiment, usually the current config
+        arms = [arm.name for arm in experiment.arms] if experiment else []
+        baseline = next((arm for arm in arms if arm in stats), sorted(stats)[0])
+    if baseline not in stats:
+        ui.display_error_message(
+            f"No turns recorded for arm {baseline}; arms are {', '.join(stats)}"
+        )
+        sys.exit(1)
+
+    def number(value, digits=1, scale=1.0):
+        return "-" if value is None else f"{value * scale:.{digits}f}"
+
+    table = Table(title="Arms")
+    table.add_column("Arm")
+    for column in [
+        "Sessions",
+        "Turns",
+        "Mean (ms)",
+        "p50 (ms)",
+        "p95 (ms)",
+        "Tokens/turn",
+        "Cost/session",
+        "Errors",
+        "Completed",
+        "Turns to end",
+    ]:
+        table.add_column(column, justify="right")
+    for arm, stat in stats.items():
+        table.add_row(
+            f"{arm} (baseline)" if arm == baseline else arm,
+            str(stat["sessions"]),
+            str(stat["turns"]),
+            number(stat["mean_seconds"], scale=1000),
+            number(stat["p50_seconds"], scale=1000),
+            number(stat["p95_seconds"], scale=1000),
+            number(stat["tokens_per_turn"], 0),
+            f"${stat['cost_per_session']:.4f}",
+            f"{stat['error_rate']:.0%}",
+            f"{stat['completion_rate']:.0%}",
+            number(stat["turns_to_completion"]),
+        )
+    console.print(table)
+
+    decisions = [
+        decision.name
+        for decision in DecisionType
+        if any(decision.name in stat["decisions"] for stat in stats.values())
+    ]
+    table = Table(title="Decision distribution")
+    table.add_column("Arm")
+    for decision in decisions:
+        table.add_column(decision.replace("_", " ").lower(), justify="right")
+    for arm, stat in stats.items():
+        table.add_row(
+            arm,
+            *(f"{stat['decisions'].get(decision, 0.0):.0%}" for decision in decisions),
+        )
+    console.print(table)
+
+    comparisons = compare_arms(
+        stats,
+        baseline,
+        args.max_completion_drop,
+        args.max_extra_turns,
+        args.max_error_increase,
+    )
+    if comparisons:
+        table = Table(title=f"Against {baseline}")
+        table.add_column("Arm")
+        for column in [
+            "Mean (ms)",
+            "95% interval (ms)",
+            "p95 (ms)",
+            "Tokens/turn",
+            "Errors",
+            "Completed",
+            "Turns to end",
+            "Decision shift",
+        ]:
+            table.add_column(column, justify="right")
+        table.add_column("Verdict")
+
+        def change(value, digits=1, scale=1.0, suffix=""):
+            return "-" if value is None else f"{value * scale:+.{digits}f}{suffix}"
+
+        for arm, comparison in comparisons.items():
+            low, high = comparison["mean_seconds_interval"]
+            colour = "green" if comparison["outcomes_held"] else "red"
+            table.add_row(
+                arm,
+                change(comparison["mean_seconds_change"], scale=1000),
+                "-"
+                if low is None
+                else f"{low * 1000:+.1f} to {high * 1000:+.1f}",
+                change(comparison["p95_seconds_change"], scale=1000),
+                f"{comparison['tokens_per_turn_change']:+.0f}",
+                f"{comparison['error_rate_change']:+.0%}",
+                f"{comparison['completion_rate_change']:+.0%}",
+                "-"
+                if comparison["extra_turns_to_completion"] is None
+                else f"{comparison['extra_turns_to_completion']:+.1f}",
+                f"{comparison['decision_shift']:.0%}",
+                f"[{colour}]{comparison['verdict']}[/{colour}]",
+            )
+        console.print(table)
+
+    if args.output:
+        for stat in stats.values():
+            del stat["latencies"]
+        with open(args.output, "w", encoding="utf-8") as f:
+            yaml.safe_dump(
+                {"baseline": baseline, "arms": stats, "comparisons": comparisons},
+                f,
+                sort_keys=False,
+                width=10000,
+            )
+        ui.display_system_message(f"Experiment report saved to: {args.output}")
+
+
+def main() -> None:
+    """Run one of the offline tools"""
+    parser = argparse.ArgumentParser(
+        description="Offline tools for the parenting simulation."
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Profile the command and write pstats, collapsed stacks and timings "
+        "to the profiles folder",
+        default=False,
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    replay_parser = subparsers.add_parser(
+        "replay",
+        help="Re-run recorded traces against a config and compare decisions",
+    )
+    replay_parser.add_argument(
+        "traces",
+        nargs="+",
+        help="Trace YAML files, directories or glob patterns (e.g. traces/)",
+    )
+    replay_parser.add_argument(
+        "--config",
+        "-c",
+        type=str,
+        help="Path to the config YAML file to evaluate. Defaults to config/config.yaml",
+        default=None,
+    )
+    replay_parser.add_argument(
+        "--concurrency",
+        "-j",
+        type=int,
+        help="Maximum number of decisions requested at once",
+        default=8,
+    )
+    replay_parser.add_argument(
+        "--cache",
+        type=str,
+        help=f"Response cache file. Defaults to {ResponseCache.DEFAULT_PATH}",
+        default=None,
+    )
+    replay_parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always call the model, even for prompts seen before",
+        default=False,
+    )
+    replay_parser.add_argument(
+        "--output",
+        "-o",
+        type=str,
+        help="Write the agreement matrix and disagreements to this YAML file",
+        default=None,
+    )
+    replay_parser.add_argument(
+        "--batch",
+        choices=["local", "provider"],
+        help="Send the decisions as batch jobs: 'provider' uses the provider's batch "
+        "API, 'local' a file-based stand-in",
+        default=None,
+    )
+    replay_parser.add_argument(
+        "--batch-dir",
+        type=str,
+        help="Where batch files are written. Defaults to batch.directory or batches",
+        default=None,
+    )
+    replay_parser.set_defaults(handler=replay_command)
+
+    branch_parser = subparsers.add_parser(
+        "branch",
+        help="Fork a recorded conversation at a turn and try alternative parent replies",
+    )
+    branch_parser.add_argument("trace", help="Trace YAML file to branch from")
+    branch_parser.add_argument(
+        "--turn",
+        "-t",
+        type=int,
+        required=True,
+        help="Trace entry (from 1) the alternatives replace; earlier entries are kept",
+    )
+    branch_parser.add_argument(
+        "--reply",
+        "-r",
+        action="append",
+        help="An alternative parent reply. Can be given several times",
+        default=None,
+    )
+    branch_parser.add_argument(
+        "--replies",
+        type=str,
+        help="YAML file with a list of alternative parent replies",
+        default=None,
+    )
+    branch_parser.add_argument(
+        "--config",
+        "-c",
+        type=str,
+        help="Path to the config YAML file. Defaults to config/config.yaml",
+        default=None,
+    )
+    branch_parser.add_argument(
+        "--concurrency",
+        "-j",
+        type=int,
+        help="Maximum number of alternatives played at once",
+        default=8,
+    )
+    branch_parser.add_argument(
+        "--cache",
+        type=str,
+        help=f"Response cache file. Defaults to {ResponseCache.DEFAULT_PATH}",
+        default=None,
+    )
+    branch_parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always call the model, even for prompts seen before",
+        default=False,
+    )
+    branch_parser.set_defaults(handler=branch_command)
+
+    config_size_parser = subparsers.add_parser(
+        "config-size",
+        help="Report the static token cost of each config's prompts",
+    )
+    config_size_parser.add_argument(
+        "configs", nargs="+", help="Config YAML files to measure"
+    )
+    config_size_parser.set_defaults(handler=config_size_command)
+
+    warm_cache_parser = subparsers.add_parser(
+        "warm-cache",
+        help="Precompute first turns for the common opening messages of a config",
+    )
+    warm_cache_parser.add_argument(
+        "--config",
+        "-c",
+        type=str,
+        help="Path to the config YAML file. Defaults to config/config.yaml",
+        default=None,
+    )
+    warm_cache_parser.add_argument(
+        "--from-traces",
+        nargs="+",
+        help="Also use the most common first parent messages of these traces",
+        default=None,
+    )
+    warm_cache_parser.add_argument(
+        "--top",
+        type=int,
+        help="How many opening messages to take from the traces",
+        default=20,
+    )
+    warm_cache_parser.add_argument(
+        "--pool-size",
+        type=int,
+        help="First turns generated per opening message. Defaults to warm_cache.pool_size or 3",
+        default=None,
+    )
+    warm_cache_parser.add_argument(
+        "--concurrency",
+        "-j",
+        type=int,
+        help="Maximum number of first turns generated at once",
+        default=4,
+    )
+    warm_cache_parser.set_defaults(handler=warm_cache_command)
+
+    build_classifier_parser = subparsers.add_parser(
+        "build-classifier",
+        help="Build the local decision pre-classifier index from saved traces",
+    )
+    build_classifier_parser.add_argument(
+        "traces",
+        nargs="+",
+        help="Trace YAML files, directories or glob patterns (e.g. traces/)",
+    )
+    build_classifier_parser.add_argument(
+        "--config",
+        "-c",
+        type=str,
+        help="Config the index is built for; other configs ignore it. Defaults to "
+        "config/config.yaml",
+        default=None,
+    )
+    build_classifier_parser.add_argument(
+        "--output",
+        "-o",
+        type=str,
+        help=f"Index file to write. Defaults to {DecisionClassifier.DEFAULT_INDEX_PATH}",
+        default=None,
+    )
+    build_classifier_parser.add_argument(
+        "--features",
+        type=int,
+        help="Number of hashed features per message",
+        default=4096,
+    )
+    build_classifier_parser.set_defaults(handler=build_classifier_command)
+
+    span_report_parser = subparsers.add_parser(
+        "span-report",
+        help="Summarise span latencies per stage from exported span files",
+    )
+    span_report_parser.add_argument(
+        "spans", nargs="+", help=f"OTLP/JSON lines files (e.g. {DEFAULT_SPANS_PATH})"
+    )
+    span_report_parser.add_argument(
+        "--baseline",
+        nargs="+",
+        help="Span files to compare against, to see which stage regressed",
+        default=None,
+    )
+    span_report_parser.set_defaults(handler=span_report_command)
+
+    collect_spans_parser = subparsers.add_parser(
+        "collect-spans",
+        help="Receive OTLP/JSON spans over HTTP and write them to a file",
+    )
+    collect_spans_parser.add_argument("--host", type=str, default="localhost")
+    collect_spans_parser.add_argument("--port", type=int, default=4318)
+    collect_spans_parser.add_argument(
+        "--output",
+        "-o",
+        type=str,
+        help="File to append the received spans to",
+        default="spans/collected.jsonl",
+    )
+    collect_spans_parser.set_defaults(handler=collect_spans_command)
+
+    serve_turns_parser = subparsers.add_parser(
+        "serve-turns",
+        help="Serve conversation turns over HTTP with deadlines and long-polling",
+    )
+    serve_turns_parser.add_argument(
+        "--config",
+        "-c",
+        type=str,
+        help="Path to the config YAML file. Defaults to config/config.yaml",
+        default=None,
+    )
+    serve_turns_parser.add_argument("--host", type=str, default="localhost")
+    serve_turns_parser.add_argument("--port", type=int, default=8765)
+    serve_turns_parser.set_defaults(handler=serve_turns_command)
+
+    experiment_report_parser = subparsers.add_parser(
+        "experiment-report",
+        help="Compare the latency, tokens and outcomes of the arms of an experiment",
+    )
+    experiment_report_parser.add_argument(
+        "records",
+        type=str,
+        nargs="*",
+        help="Turn record files. Defaults to those of the experiment in the config",
+    )
+    experiment_report_parser.add_argument(
+        "--config",
+        "-c",
+        type=str,
+        help="Path to the config YAML file. Defaults to config/config.yaml",
+        default=None,
+    )
+    experiment_report_parser.add_argument(
+        "--baseline",
+        "-b",
+        type=str,
+        help="Arm the others are compared with. Defaults to the experiment's first arm",
+        default=None,
+    )
+    experiment_report_parser.add_argument(
+        "--max-completion-drop",
+        type=float,
+        help="Largest drop in the share of completed sessions that still counts "
+        "as outcomes held",
+        default=0.05,
+    )
+    experiment_report_parser.add_argument(
+        "--max-extra-turns",
+        type=float,
+        help="Most extra turns to complete a session that still count as outcomes held",
+        default=1.0,
+    )
+    experiment_report_parser.add_argument(
+        "--max-error-increase",
+        type=float,
+        help="Largest rise in the share of failed turns that still counts as outcomes held",
+        default=0.01,
+    )
+    experiment_report_parser.add_argument(
+        "--output", "-o", type=str, help="Write the full report as YAML", default=None
+    )
+    experiment_report_parser.set_defaults(handler=experiment_report_command)
+
+    load_test_parser = subparsers.add_parser(
+        "load-test",
+        help="Run concurrent scripted sessions against a local stub model server",
+    )
+    load_test_parser.add_argument(
+        "--config",
+        "-c",
+        type=str,
+        help="Path to the config YAML file. Defaults to config/config.yaml",
+        default=None,
+    )
+    load_test_parser.add_argument(
+        "--sessions", "-n", type=int, help="Concurrent sessions", default=10
+    )
+    load_test_parser.add_argument(
+        "--script",
+        type=str,
+        help="YAML list of parent messages played by every session",
+        default=None,
+    )
+    load_test_parser.add_argument(
+        "--latency",
+        type=str,
+        help="Model latency distribution: fixed:<s>, uniform:<low>,<high>, "
+        "exponential:<mean> or lognormal:<median>,<sigma>",
+        default="lognormal:0.2,0.5",
+    )
+    load_test_parser.add_argument(
+        "--decision-latency",
+        type=str,
+        help="Latency distribution for decision prompts. Defaults to --latency",
+        default=None,
+    )
+    load_test_parser.add_argument(
+        "--error-rate",
+        type=float,
+        help="Share of requests answered with a 500",
+        default=0.0,
+    )
+    load_test_parser.add_argument(
+        "--rate-limit-rate",
+        type=float,
+        help="Share of requests answered with a 429",
+        default=0.0,
+    )
+    load_test_parser.add_argument(
+        "--capacity",
+        type=int,
+        help="Requests the stub serves at once; the rest queue. Unlimited by default",
+        default=None,
+    )
+    load_test_parser.add_argument(
+        "--decisions",
+        type=str,
+        help="Weights of the decisions the stub returns, e.g. 0=2,1=3,2=2,3=2,4=1,5=0.5",
+        default=None,
+    )
+    load_test_parser.add_argument(
+        "--think-time",
+        type=float,
+        help="Seconds each session waits between turns",
+        default=0.0,
+    )
+    load_test_parser.add_argument(
+        "--seed", type=int, help="Seed for the stub's random draws", default=None
+    )
+    load_test_parser.add_argument(
+        "--output", "-o", type=str, help="Write the full report as YAML", default=None
+    )
+    load_test_parser.set_defaults(handler=load_test_command)
+
+    batch_simulate_parser = subparsers.add_parser(
+        "batch-simulate",
+        help="Play scripted parent sessions as batch jobs and save their traces",
+    )
+    batch_simulate_parser.add_argument(
+        "script", type=str, help="YAML list of parent messages played by every session"
+    )
+    batch_simulate_parser.add_argument(
+        "--config",
+        "-c",
+        type=str,
+        help="Path to the config YAML file. Defaults to config/config.yaml",
+        default=None,
+    )
+    batch_simulate_parser.add_argument(
+        "--sessions", "-n", type=int, help="Number of sessions", default=10
+    )
+    batch_simulate_parser.add_argument(
+        "--provider",
+        choices=["local", "provider"],
+        help="'provider' uses the provider's batch API, 'local' a file-based "
+        "stand-in. Defaults to batch.provider or local",
+        default=None,
+    )
+    batch_simulate_parser.add_argument(
+        "--batch-dir",
+        type=str,
+        help="Where batch files are written. Defaults to batch.directory or batches",
+        default=None,
+    )
+    batch_simulate_parser.add_argument(
+        "--no-daily-usage",
+        action="store_true",
+        help="Keep this run out of the daily budget totals, e.g. when the models are "
+        "the load-test stub",
+    )
+    batch_simulate_parser.set_defaults(handler=batch_simulate_command)
+
+    prescore_parser = subparsers.add_parser(
+        "prescore",
+        help="Score the Facilitator and Reasoning rows of annotation CSVs with an LLM judge",
+    )
+    prescore_parser.add_argument(
+        "csv_files", nargs="+", help="Annotation CSV files or directories (e.g. csv/)"
+    )
+    prescore_parser.add_argument(
+        "--config",
+        "-c",
+        type=str,
+        help="Path to the config YAML file with the judge section. Defaults to config/config.yaml",
+        default=None,
+    )
+    prescore_parser.add_argument(
+        "--concurrency",
+        "-j",
+        type=int,
+        help="Maximum number of rows scored at once. Defaults to judge.concurrency or 8",
+        default=None,
+    )
+    prescore_parser.add_argument(
+        "--batch-size",
+        type=int,
+        help="Rows scored between writes of the output file",
+        default=50,
+    )
+    prescore_parser.add_argument(
+        "--flag-below",
+        type=int,
+        help="Flag rows scored at or below this. Defaults to judge.flag_below or 3",
+        default=None,
+    )
+    prescore_parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="Score every row again instead of keeping scores from an earlier output file",
+        default=False,
+    )
+    prescore_parser.add_argument(
+        "--cache",
+        type=str,
+        help=f"Response cache file. Defaults to {ResponseCache.DEFAULT_PATH}",
+        default=None,
+    )
+    prescore_parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always call the model, even for rows judged before",
+        default=False,
+    )
+    prescore_parser.set_defaults(handler=prescore_command)
+
+    store_help = f"Trace store database. Defaults to {TraceStore.DEFAULT_PATH}"
+
+    import_traces_parser = subparsers.add_parser(
+        "import-traces", help="Load saved YAML traces into the trace store"
+    )
+    import_traces_parser.add_argument(
+        "traces",
+        nargs="+",
+        help="Trace YAML files, directories or glob patterns (e.g. traces/)",
+    )
+    import_traces_parser.add_argument("--store", type=str, help=store_help, default=None)
+    import_traces_parser.add_argument(
+        "--scenario",
+        type=str,
+        help="Scenario name to record for the imported traces",
+        default=None,
+    )
+    import_traces_parser.add_argument(
+        "--batch-size",
+        type=int,
+        help="Traces written per transaction",
+        default=500,
+    )
+    import_traces_parser.set_defaults(handler=import_traces_command)
+
+    search_traces_parser = subparsers.add_parser(
+        "search-traces",
+        help="Search the text of stored turns (FTS5 syntax, e.g. 'coaching: siblings')",
+    )
+    search_traces_parser.add_argument("query", type=str)
+    search_traces_parser.add_argument("--store", type=str, help=store_help, default=None)
+    search_traces_parser.add_argument(
+        "--decision", type=int, help="Only turns with this decision", default=None
+    )
+    search_traces_parser.add_argument(
+        "--scenario", type=str, help="Only sessions of this scenario", default=None
+    )
+    search_traces_parser.add_argument("--limit", type=int, default=50)
+    search_traces_parser.set_defaults(handler=search_traces_command)
+
+    export_trace_parser = subparsers.add_parser(
+        "export-trace", help="Write a stored session as a YAML trace or a CSV"
+    )
+    export_trace_parser.add_argument("session_id", type=str)
+    export_trace_parser.add_argument("--store", type=str, help=store_help, default=None)
+    export_trace_parser.add_argument(
+        "--format", choices=["yaml", "csv"], default="yaml"
+    )
+    export_trace_parser.set_defaults(handler=export_trace_command)
+
+    args = parser.parse_args()
+    ui = ConversationUI(console)
+
+    try:
+        if not args.profile:
+            args.handler(args)
+            return
+
+        profiler = SessionProfiler()
+        profiler.start()
+        try:
+            args.handler(args)
+        finally:
+            profiler.stop()
+            profiler.print_summary(console)
+            ui.display_system_message(f"Profile saved to: {profiler.output_dir}")
+    except FileNotFoundError as e:
+        ui.display_error_message(str(e))
+        sys.exit(1)
+    except ConfigValidationError as e:
+        ui.display_error_message("Configuration Error:")
+        ui.display_error_message(str(e))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
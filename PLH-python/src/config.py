@@ -9,10 +9,11 @@ class ConfigValidationError(Exception):
 
 
 class Config:
-    """Singleton class for loading and accessing the config file"""
+    """Loads, validates and gives access to one config file.
 
-    _instance = None
-    _config = None
+    Every instance holds its own config, so a process can serve several
+    configs side by side, each with its own Framework.
+    """
 
     REQUIRED_FIELDS = {
         "models": ["child", "facilitator"],
@@ -35,14 +36,11 @@ class Config:
         ],
     }
 
-    def __new__(cls, config_path=None):
-        if cls._instance is None:
-            cls._instance = super(Config, cls).__new__(cls)
-            cls._load_config(config_path)
-        return cls._instance
+    def __init__(self, config_path=None):
+        self._config = None
+        self._load_config(config_path)
 
-    @classmethod
-    def _load_config(cls, config_path=None):
+    def _load_config(self, config_path=None):
         if config_path is None:
             config_path = Path(__file__).parent.parent / "config" / "config.yaml"
         else:
@@ -53,38 +51,37 @@ class Config:
 
         try:
             with open(config_path, "r", encoding="utf-8") as file:
-                cls._config = yaml.safe_load(file)
-                if cls._config is None:
+                self._config = yaml.safe_load(file)
+                if self._config is None:
                     raise ConfigValidationError("Config file is empty")
-                cls._validate_config()
+                self._validate_config()
         except yaml.YAMLError as e:
             raise ConfigValidationError(f"Invalid YAML format: {str(e)}")
         except Exception as e:
             raise ConfigValidationError(f"Error loading config: {str(e)}")
 
-    @classmethod
-    def _validate_config(cls):
+    def _validate_config(self):
         """Validate that all required fields are present in the config"""
-        if not isinstance(cls._config, dict):
+        if not isinstance(self._config, dict):
             raise ConfigValidationError("Config must be a dictionary")
 
         missing_fields = []
 
-        for section, fields in cls.REQUIRED_FIELDS.items():
-            if section not in cls._config:
+        for section, fields in self.REQUIRED_FIELDS.items():
+            if section not in self._config:
                 missing_fields.append(f"Missing section: {section}")
                 continue
 
-            if not isinstance(cls._config[section], dict):
+            if not isinstance(self._config[section], dict):
                 missing_fields.append(f"Section {section} must be a dictionary")
                 continue
 
             for field in fields:
-                if field not in cls._config[section]:
+                if field not in self._config[section]:
                     missing_fields.append(f"Missing field: {section}.{field}")
                 elif (
-                    cls._config[section][field] is None
-                    or cls._config[section][field] == ""
+                    self._config[section][field] is None
+                    or self._config[section][field] == ""
                 ):
                     missing_fields.append(f"Empty field: {section}.{field}")
 
@@ -93,12 +90,8 @@ class Config:
                 "Config validation failed:\n" + "\n".join(missing_fields)
             )
 
-    @classmethod
-    def get(cls, *keys, default=None):
-        if cls._config is None:
-            cls._load_config()
-
-        current = cls._config
+    def get(self, *keys, default=None):
+        current = self._config
         for key in keys:
             if isinstance(current, dict) and key in current:
                 current = current[key]
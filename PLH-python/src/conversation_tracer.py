@@ -1,9 +1,17 @@
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Dict, List, Optional
 import os
+import uuid
 import yaml
 from datetime import datetime
 from src.decision_types import DecisionType
+from src.spans import traced
+from src.token_ledger import TokenLedger
+
+
+def new_session_id() -> str:
+    """A sortable id for a conversation that stays unique within the same second"""
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
 
 
 @dataclass
@@ -13,6 +21,7 @@ class TraceEntry:
     decision: int
     decision_reasoning: str
     coaching: Optional[str] = None
+    models: Optional[Dict[str, str]] = None  # Model used by each pipeline this turn
 
     def get_decision_name(self) -> str:
         """Get the name of the decision from its value"""
@@ -30,6 +39,12 @@ class ConversationTracer:
         self.conversation_initiator: Optional[str] = None
         self.parent_feedback_positive: Optional[str] = None
         self.parent_feedback_negative: Optional[str] = None
+        # Tokens and estimated cost of the model calls made for this conversation
+        self.ledger = TokenLedger()
+        # Session id and turn of the conversation this one was forked from
+        self.forked_from: Optional[dict] = None
+        # True while the entry lists are shared with a checkpoint
+        self._shared = False
 
     def add_conversation_initiator(self, initiator: str):
         self.conversation_initiator = initiator
@@ -59,10 +74,38 @@ class ConversationTracer:
         return "\n".join(conversation)
 
     def add_entry(self, entry: TraceEntry):
+        if self._shared:
+            self.full_trace = list(self.full_trace)
+            self.filtered_trace = list(self.filtered_trace)
+            self._shared = False
         self.full_trace.append(entry)
         if entry.decision != DecisionType.FACILITATOR_ONLY_HELP.value:
             self.filtered_trace.append(entry)
 
+    def checkpoint(self, entries: Optional[int] = None) -> "ConversationTracer":
+        """A copy-on-write snapshot of the conversation after its first `entries` entries.
+
+        Entries are never changed once added, so the snapshot shares them with
+        this tracer. A snapshot of the whole conversation (the default) also
+        shares the entry lists, and whichever side adds an entry next copies
+        them first. The summary and parent feedback are not carried over, and
+        the snapshot's ledger starts empty so it only counts its own calls.
+        """
+        snapshot = ConversationTracer()
+        snapshot.conversation_initiator = self.conversation_initiator
+        if entries is None or entries >= len(self.full_trace):
+            snapshot.full_trace = self.full_trace
+            snapshot.filtered_trace = self.filtered_trace
+            snapshot._shared = self._shared = True
+        else:
+            snapshot.full_trace = self.full_trace[:entries]
+            snapshot.filtered_trace = [
+                entry
+                for entry in snapshot.full_trace
+                if entry.decision != DecisionType.FACILITATOR_ONLY_HELP.value
+            ]
+        return snapshot
+
     def set_summary(self, summary: str):
         self.summary = summary
 
@@ -148,6 +191,7 @@ class ConversationTracer:
 
         return "\n\n".join(trace_entries)
 
+    @traced("trace.save")
     def save_trace(
         self, trace_type: str = "full", filename: Optional[str] = None
     ) -> str:
@@ -155,16 +199,32 @@ class ConversationTracer:
 
         Parameters:
           trace_type: 'full' or 'filtered' trace.
-          filename: Optional custom filename. If not provided, uses a timestamp.
+          filename: Optional custom filename. If not provided, uses a timestamp
+            and a random suffix.
 
         Returns:
           The file path of the saved trace.
         """
 
         if not filename:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"trace_{timestamp}.yaml"
+            filename = f"trace_{new_session_id()}.yaml"
+
+        data_to_save = self.to_dict(trace_type)
+
+        os.makedirs("traces", exist_ok=True)
+        file_path = os.path.join("traces", filename)
+
+        with open(file_path, "w") as f:
+            yaml.safe_dump(data_to_save, f, sort_keys=False, width=10000)
+
+        return file_path
+
+    def to_dict(self, trace_type: str = "full") -> dict:
+        """Return the conversation trace as a plain, YAML-serialisable dict.
 
+        Parameters:
+          trace_type: 'full' or 'filtered' trace.
+        """
         if trace_type == "full":
             trace_list = self.get_full_trace()
         elif trace_type == "filtered":
@@ -172,9 +232,6 @@ class ConversationTracer:
         else:
             raise ValueError("Invalid trace_type. Use 'full' or 'filtered'.")
 
-        os.makedirs("traces", exist_ok=True)
-        file_path = os.path.join("traces", filename)
-
         serializable_trace = []
         for entry in trace_list:
             decision_name = entry.get_decision_name()
@@ -185,21 +242,44 @@ class ConversationTracer:
                 "decision": entry.decision,
                 "decision_name": decision_name,
                 "decision_reasoning": entry.decision_reasoning,
+                "models": entry.models,
             }
             serializable_trace.append(ordered_entry)
 
-        data_to_save = {
+        data = {
             "conversation_initiator": self.conversation_initiator,
             "trace": serializable_trace,
             "parent_feedback_positive": self.parent_feedback_positive,
             "parent_feedback_negative": self.parent_feedback_negative,
             "summary": self.summary,
+            "usage": self.ledger.to_dict(),
         }
-
-        with open(file_path, "w") as f:
-            yaml.safe_dump(data_to_save, f, sort_keys=False, width=10000)
-
-        return file_path
+        if self.forked_from is not None:
+            data["forked_from"] = self.forked_from
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ConversationTracer":
+        """Rebuild a tracer from the output of to_dict() or a saved full trace."""
+        tracer = cls()
+        tracer.conversation_initiator = data.get("conversation_initiator")
+        for item in data.get("trace") or []:
+            tracer.add_entry(
+                TraceEntry(
+                    parent=item.get("parent"),
+                    child=item.get("child"),
+                    decision=item.get("decision"),
+                    decision_reasoning=item.get("decision_reasoning"),
+                    coaching=item.get("coaching"),
+                    models=item.get("models"),
+                )
+            )
+        tracer.parent_feedback_positive = data.get("parent_feedback_positive")
+        tracer.parent_feedback_negative = data.get("parent_feedback_negative")
+        tracer.summary = data.get("summary")
+        tracer.ledger = TokenLedger.from_dict(data.get("usage"))
+        tracer.forked_from = data.get("forked_from")
+        return tracer
 
     def set_parent_feedback(self, positive: str, negative: str):
         self.parent_feedback_positive = positive
@@ -0,0 +1,218 @@
+from datetime import datetime
+from typing import Dict, Optional
+import atexit
+import json
+import os
+import queue
+import sys
+import threading
+import zlib
+
+DEFAULT_DEBUG_DIRECTORY = "debug"
+DEFAULT_MAX_FILE_BYTES = 50 * 1024 * 1024
+
+
+class DebugLog:
+    """Structured debug records, written as JSON lines by a background thread.
+
+    `record` only puts the record on a queue, so rendered prompts and raw
+    replies can be logged on every turn without slowing it down; when the
+    queue is full the record is dropped and counted. The writer appends to
+    `<directory>/debug.jsonl` and rotates it to `debug.1.jsonl` and so on
+    once it reaches `max_file_bytes`, keeping `backup_count` old files.
+
+    Whole turns are sampled: a turn id is kept for a pipeline when its hash
+    falls under the pipeline's sample rate, so a prompt and its reply are
+    always kept or dropped together, and a turn kept at a low rate is kept by
+    every pipeline with a higher one. Text longer than the pipeline's
+    `max_chars` is cut when the record is written. With `echo`, records are
+    also printed to stderr in the old `=== name ===` layout. Configured by the
+    optional `debug_log` section.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        directory: str = DEFAULT_DEBUG_DIRECTORY,
+        sample_rate: float = 1.0,
+        max_chars: Optional[int] = None,
+        pipelines: Optional[Dict[str, dict]] = None,
+        max_file_bytes: int = DEFAULT_MAX_FILE_BYTES,
+        backup_count: int = 5,
+        queue_size: int = 10000,
+        echo: bool = False,
+    ):
+        self.enabled = enabled
+        self.directory = directory
+        self.path = os.path.join(directory, "debug.jsonl")
+        self.sample_rate = sample_rate
+        self.max_chars = max_chars
+        self.pipelines = pipelines or {}
+        self.max_file_bytes = max_file_bytes
+        self.backup_count = backup_count
+        self.echo = echo
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._writer = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config_data: dict, enabled: bool = False) -> "DebugLog":
+        """Build a debug log from the optional `debug_log` section. `enabled`
+        turns it on whatever the section says, as `--debug` does."""
+        settings = config_data.get("debug_log") or {}
+        return cls(
+            enabled=enabled or settings.get("enabled", False),
+            directory=settings.get("directory", DEFAULT_DEBUG_DIRECTORY),
+            sample_rate=settings.get("sample_rate", 1.0),
+            max_chars=settings.get("max_chars"),
+            pipelines=settings.get("pipelines"),
+            max_file_bytes=int(
+                settings.get("max_file_mb", DEFAULT_MAX_FILE_BYTES / 1024 / 1024)
+                * 1024
+                * 1024
+            ),
+            backup_count=settings.get("backup_count", 5),
+            queue_size=settings.get("queue_size", 10000),
+            echo=settings.get("echo", False),
+        )
+
+    def _setting(self, pipeline: Optional[str], name: str):
+        return (self.pipelines.get(pipeline) or {}).get(name, getattr(self, name))
+
+    def sampled(self, pipeline: Optional[str] = None, turn_id: Optional[str] = None) -> bool:
+        """Whether records of this pipeline and turn are kept"""
+        if not self.enabled:
+            return False
+        rate = self._setting(pipeline, "sample_rate")
+        if rate >= 1:
+            return True
+        if rate <= 0:
+            return False
+        if turn_id is None:
+            return True
+        return zlib.crc32(turn_id.encode("utf-8")) / 2**32 < rate
+
+    def record(
+        self,
+        kind: str,
+        pipeline: Optional[str] = None,
+        turn_id: Optional[str] = None,
+        **fields,
+    ):
+        """Queue a record for the writer if its pipeline and turn are sampled"""
+        if not self.sampled(pipeline, turn_id):
+            return
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(
+                dict(
+                    time=datetime.now().isoformat(),
+                    kind=kind,
+                    pipeline=pipeline,
+                    turn_id=turn_id,
+                    **fields,
+                )
+            )
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_writer(self):
+        if self._writer is not None:
+            return
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(
+                    target=self._write_loop, name="debug-log", daemon=True
+                )
+                self._writer.start()
+                atexit.register(self.shutdown)
+
+    def _cut(self, value, max_chars: int):
+        if isinstance(value, str) and len(value) > max_chars:
+            return f"{value[:max_chars]}... [{len(value) - max_chars} more characters]"
+        if isinstance(value, list):
+            return [self._cut(item, max_chars) for item in value]
+        if isinstance(value, dict):
+            return {key: self._cut(item, max_chars) for key, item in value.items()}
+        return value
+
+    def _rotate(self):
+        for index in range(self.backup_count - 1, 0, -1):
+            source = os.path.join(self.directory, f"debug.{index}.jsonl")
+            if os.path.exists(source):
+                os.replace(source, os.path.join(self.directory, f"debug.{index + 1}.jsonl"))
+        if self.backup_count > 0:
+            os.replace(self.path, os.path.join(self.directory, "debug.1.jsonl"))
+        else:
+            os.remove(self.path)
+
+    def _write(self, record: dict):
+        max_chars = self._setting(record["pipeline"], "max_chars")
+        if max_chars is not None:
+            record = self._cut(record, max_chars)
+        if self.echo:
+            body = record.get("text")
+            if body is None:
+                body = "\n\n".join(
+                    f"[{message['role']}]\n{message['content']}"
+                    for message in record.get("messages") or []
+                )
+            title = " ".join(
+                part for part in (record["kind"], record["pipeline"], record["turn_id"]) if part
+            )
+            print(f"\n=== {title} ===\n{body}\n===========================\n", file=sys.stderr)
+
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        os.makedirs(self.directory, exist_ok=True)
+        if (
+            os.path.exists(self.path)
+            and os.path.getsize(self.path) + len(line) > self.max_file_bytes
+        ):
+            self._rotate()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+        self.written += 1
+
+    def _write_loop(self):
+        while True:
+            record = self._queue.get()
+            try:
+                if record is None:
+                    return
+                self._write(record)
+            except Exception:
+                # A debug record is never worth interrupting a conversation for
+                self.dropped += 1
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Wait until every queued record is written"""
+        if self._writer is not None:
+            self._queue.join()
+
+    def shutdown(self):
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout=5)
+
+
+_debug_log: Optional[DebugLog] = None
+_debug_log_lock = threading.Lock()
+
+
+def get_debug_log(config_data: Optional[dict] = None, enabled: bool = False) -> DebugLog:
+    """Return the debug log shared by every Framework in this process.
+
+    The first call that passes a config, or that enables it, decides where
+    and how records are written.
+    """
+    global _debug_log
+    with _debug_log_lock:
+        if _debug_log is None or (
+            (config_data is not None or enabled) and not _debug_log.enabled
+        ):
+            _debug_log = DebugLog.from_config(config_data or {}, enabled)
+        return _debug_log
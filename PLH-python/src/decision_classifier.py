@@ -0,0 +1,263 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import List, Optional
+import hashlib
+import json
+import os
+import re
+import threading
+import zlib
+import numpy as np
+from src.decision_types import DecisionType
+
+
+class HashingVectorizer:
+    """Turns a parent message into an L2-normalised vector of hashed n-gram counts.
+
+    Uses word unigrams and bigrams, character trigrams (which tolerate typos)
+    and a token for the turn count, since the end-of-conversation conditions
+    depend on it. Hashing uses crc32 so vectors are stable across processes.
+    """
+
+    def __init__(self, n_features: int = 4096):
+        self.n_features = n_features
+
+    @staticmethod
+    def features(text: str, turn_count: Optional[int] = None) -> List[str]:
+        words = re.findall(r"\w+", text.lower())
+        features = [f"w:{word}" for word in words]
+        features += [f"b:{a} {b}" for a, b in zip(words, words[1:])]
+        for word in words:
+            padded = f" {word} "
+            features += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+        if turn_count is not None:
+            features += [f"turn:{turn_count}"] * 3
+        return features
+
+    def transform(self, text: str, turn_count: Optional[int] = None) -> np.ndarray:
+        vector = np.zeros(self.n_features, dtype=np.float32)
+        for feature in self.features(text, turn_count):
+            digest = zlib.crc32(feature.encode("utf-8"))
+            sign = 1.0 if digest & 0x80000000 else -1.0
+            vector[digest % self.n_features] += sign
+        return vector
+
+
+@dataclass
+class DecisionPrediction:
+    decision: int
+    reasoning: str
+    confidence: float
+    similarity: float
+
+
+class DecisionClassifier:
+    """Nearest-neighbour classifier over labelled parent messages from saved traces.
+
+    Predicts a decision only when the similarity-weighted vote of the `k`
+    nearest examples is at least `threshold` and the closest example is at
+    least `min_similarity` away; otherwise returns None and the caller falls
+    through to the model. By default it never predicts END_CONVERSATION,
+    which depends on the whole history rather than the last message, nor
+    FACILITATOR_ONLY_HELP, which blocks the parent's message and is left to
+    the model. An index is tied to the fingerprint of the config it was
+    built for and is ignored by any other config.
+    """
+
+    DEFAULT_INDEX_PATH = os.path.join("classifier", "decision_index.npz")
+    DEFAULT_REASONING_TEMPLATE = (
+        "The parent's message closely matches earlier messages classified as "
+        "{decision_name}."
+    )
+    DEFAULT_EXCLUDED_DECISIONS = [
+        DecisionType.END_CONVERSATION,
+        DecisionType.FACILITATOR_ONLY_HELP,
+    ]
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        labels: np.ndarray,
+        reasonings: List[str],
+        idf: np.ndarray,
+        n_features: int,
+        k: int = 7,
+        threshold: float = 0.8,
+        min_similarity: float = 0.5,
+        allowed_decisions: Optional[List[int]] = None,
+        reasoning_template: Optional[str] = None,
+        fingerprint: Optional[str] = None,
+    ):
+        self.vectorizer = HashingVectorizer(n_features)
+        self.vectors = vectors
+        self.labels = labels
+        self.reasonings = reasonings
+        self.idf = idf
+        self.k = k
+        self.threshold = threshold
+        self.min_similarity = min_similarity
+        if allowed_decisions is None:
+            allowed_decisions = [
+                decision.value
+                for decision in DecisionType
+                if decision not in self.DEFAULT_EXCLUDED_DECISIONS
+            ]
+        self.allowed_decisions = set(allowed_decisions)
+        self.reasoning_template = reasoning_template or self.DEFAULT_REASONING_TEMPLATE
+        self.fingerprint = fingerprint
+
+        self.predictions = 0
+        self.fallthroughs = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def config_fingerprint(config_data: dict) -> str:
+        """Hash of everything in a config that decides what a decision means"""
+        relevant = {
+            "scenario": config_data.get("scenario"),
+            "conditions": config_data.get("conditions"),
+            "facilitator_decision": (config_data.get("system_prompts") or {}).get(
+                "facilitator_decision"
+            ),
+        }
+        payload = json.dumps(relevant, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def build(
+        cls, examples: List[dict], n_features: int = 4096, **kwargs
+    ) -> "DecisionClassifier":
+        """Build an index from dicts with `parent`, `turn_count`, `decision` and `reasoning`"""
+        vectorizer = HashingVectorizer(n_features)
+        counts = np.stack(
+            [
+                vectorizer.transform(example["parent"], example.get("turn_count"))
+                for example in examples
+            ]
+        )
+        document_frequency = np.count_nonzero(counts, axis=0)
+        idf = (
+            np.log((1 + len(examples)) / (1 + document_frequency)) + 1
+        ).astype(np.float32)
+        vectors = cls._normalise(counts * idf)
+        return cls(
+            vectors=vectors,
+            labels=np.array([example["decision"] for example in examples], dtype=np.int8),
+            reasonings=[example.get("reasoning") or "" for example in examples],
+            idf=idf,
+            n_features=n_features,
+            **kwargs,
+        )
+
+    @staticmethod
+    def _normalise(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def save(self, path: Optional[str] = None) -> str:
+        path = path or self.DEFAULT_INDEX_PATH
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.savez_compressed(
+            path,
+            vectors=self.vectors,
+            labels=self.labels,
+            idf=self.idf,
+            reasonings=np.array(json.dumps(self.reasonings)),
+            n_features=np.array(self.vectorizer.n_features),
+            fingerprint=np.array(self.fingerprint or ""),
+        )
+        return path
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "DecisionClassifier":
+        with np.load(path) as data:
+            return cls(
+                vectors=data["vectors"],
+                labels=data["labels"],
+                reasonings=json.loads(str(data["reasonings"])),
+                idf=data["idf"],
+                n_features=int(data["n_features"]),
+                fingerprint=str(data["fingerprint"]) if "fingerprint" in data else None,
+                **kwargs,
+            )
+
+    @classmethod
+    def from_config(cls, config_data: dict) -> Optional["DecisionClassifier"]:
+        """Load the index named in the optional `decision_classifier` section, if enabled.
+
+        Returns None when the index was built for a different config.
+        """
+        settings = config_data.get("decision_classifier") or {}
+        if not settings.get("enabled"):
+            return None
+        path = settings.get("index_path", cls.DEFAULT_INDEX_PATH)
+        if not os.path.exists(path):
+            return None
+        options = {
+            name: settings[name]
+            for name in [
+                "k",
+                "threshold",
+                "min_similarity",
+                "allowed_decisions",
+                "reasoning_template",
+            ]
+            if name in settings
+        }
+        classifier = cls.load(path, **options)
+        if classifier.fingerprint != cls.config_fingerprint(config_data):
+            return None
+        return classifier
+
+    def predict(
+        self, parent_input: str, turn_count: Optional[int] = None
+    ) -> Optional[DecisionPrediction]:
+        """Decide locally, or return None when the neighbours are not confident enough"""
+        query = self.vectorizer.transform(parent_input, turn_count) * self.idf
+        query = self._normalise(query)
+        similarities = self.vectors @ query
+
+        k = min(self.k, len(similarities))
+        nearest = np.argpartition(-similarities, k - 1)[:k]
+        nearest = nearest[np.argsort(-similarities[nearest])]
+
+        votes = defaultdict(float)
+        for index in nearest:
+            votes[int(self.labels[index])] += max(0.0, float(similarities[index]))
+        total = sum(votes.values())
+
+        decision, weight = max(votes.items(), key=lambda item: item[1])
+        confidence = weight / total if total else 0.0
+        best_similarity = float(similarities[nearest[0]])
+
+        if (
+            decision not in self.allowed_decisions
+            or confidence < self.threshold
+            or best_similarity < self.min_similarity
+        ):
+            with self._lock:
+                self.fallthroughs += 1
+            return None
+
+        neighbour = next(
+            index for index in nearest if int(self.labels[index]) == decision
+        )
+        reasoning = self.reasoning_template.format(
+            decision=decision,
+            decision_name=DecisionType(decision).name,
+            confidence=confidence,
+            similarity=best_similarity,
+            neighbours=k,
+            neighbour_reasoning=self.reasonings[neighbour],
+        )
+        with self._lock:
+            self.predictions += 1
+        return DecisionPrediction(
+            decision=decision,
+            reasoning=reasoning,
+            confidence=confidence,
+            similarity=best_similarity,
+        )
@@ -0,0 +1,320 @@
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from src.config import Config
+from src.decision_types import DecisionType
+from src.framework import Framework
+from src.session import Session
+from src.spans import percentile
+
+DEFAULT_EXPERIMENT_DIRECTORY = "experiments"
+
+
+@dataclass
+class Arm:
+    name: str
+    # Config file of the arm, None for the config the experiment is defined in
+    config_path: Optional[str] = None
+    weight: float = 1.0
+
+
+class Experiment:
+    """Splits sessions between config arms and records how each arm does.
+
+    A session's arm is picked by hashing the experiment name with the session
+    id, so a session keeps its arm across turns, processes and restarts, and
+    renaming the experiment reshuffles the split. Each arm gets a Framework
+    built from its config on first use. Frameworks in one process already
+    share the HTTP connection pool, rate limiter, scheduler and caches, so
+    arms run side by side without extra clients.
+
+    Every turn played under `measure` is appended to `<directory>/<name>.jsonl`
+    with its arm, latency, tokens and decision, or the error it failed with,
+    which the `experiment-report` command summarises. Configured by the
+    optional `experiment` section.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        arms: List[Arm],
+        base_config,
+        directory: str = DEFAULT_EXPERIMENT_DIRECTORY,
+        framework: Optional[Framework] = None,
+    ):
+        if not arms:
+            raise ValueError("An experiment needs at least one arm")
+        if any(arm.weight <= 0 for arm in arms):
+            raise ValueError("Arm weights must be positive")
+        self.name = name
+        self.arms = arms
+        self.base_config = base_config
+        self.path = os.path.join(directory, f"{name}.jsonl")
+        self._frameworks: Dict[Optional[str], Framework] = {}
+        if framework is not None:
+            self._frameworks[None] = framework
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    @classmethod
+    def from_config(
+        cls, config, framework: Optional[Framework] = None
+    ) -> Optional["Experiment"]:
+        """Build the experiment of the optional `experiment` section, or None without one.
+
+        `framework`, if given, is an already built Framework for `config`,
+        reused by arms without a config of their own.
+        """
+        settings = config.get().get("experiment") or {}
+        if not settings.get("arms"):
+            return None
+        arms = [
+            Arm(name, (arm or {}).get("config"), (arm or {}).get("weight", 1.0))
+            for name, arm in settings["arms"].items()
+        ]
+        return cls(
+            settings.get("name", "experiment"),
+            arms,
+            config,
+            settings.get("directory", DEFAULT_EXPERIMENT_DIRECTORY),
+            framework,
+        )
+
+    def assign(self, session_id: str) -> Arm:
+        """The arm of a session, the same every time for the same session id"""
+        digest = hashlib.sha256(f"{self.name}:{session_id}".encode("utf-8")).digest()
+        point = int.from_bytes(digest[:8], "big") / 2**64 * sum(
+            arm.weight for arm in self.arms
+        )
+        for arm in self.arms:
+            point -= arm.weight
+            if point < 0:
+                return arm
+        return self.arms[-1]
+
+    def _framework(self, arm: Arm) -> Framework:
+        with self._lock:
+            if arm.config_path not in self._frameworks:
+                config = (
+                    self.base_config
+                    if arm.config_path is None
+                    else Config(config_path=arm.config_path)
+                )
+                self._frameworks[arm.config_path] = Framework(config=config)
+            return self._frameworks[arm.config_path]
+
+    def framework(self, session_id: str) -> Framework:
+        """The Framework that plays a session, that of its arm"""
+        return self._framework(self.assign(session_id))
+
+    def frameworks(self) -> List[Framework]:
+        """Build the Framework of every arm, e.g. to warm them all up"""
+        return [self._framework(arm) for arm in self.arms]
+
+    @contextmanager
+    def measure(self, session: Session):
+        """Record the turn played inside the block under the session's arm.
+
+        A turn that raises is recorded with its `error` before the exception
+        propagates.
+        """
+        trace = session.conversation_trace
+        entries = len(trace.get_full_trace())
+        tokens = trace.ledger.total_tokens
+        cost = trace.ledger.total_cost
+        error = None
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            logged = trace.get_full_trace()[entries:]
+            decision = logged[-1].decision if logged and error is None else None
+            self.record(
+                {
+                    "time": datetime.now().isoformat(),
+                    "arm": self.assign(session.session_id).name,
+                    "session_id": session.session_id,
+                    "turn": entries + 1,
+                    "seconds": round(seconds, 4),
+                    "tokens": trace.ledger.total_tokens - tokens,
+                    "cost": round(trace.ledger.total_cost - cost, 6),
+                    "decision": decision,
+                    "ended": decision == DecisionType.END_CONVERSATION.value,
+                    "error": error,
+                }
+            )
+
+    def record(self, record: dict):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._write_lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+def load_turn_records(paths: List[str]) -> List[dict]:
+    records = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    return records
+
+
+def _mean(values: List[float]) -> Optional[float]:
+    return sum(values) / len(values) if values else None
+
+
+def arm_stats(records: List[dict]) -> Dict[str, dict]:
+    """Latency, tokens, errors, turns to completion and decision shares of every arm.
+
+    Latencies only cover turns that completed; failed turns count towards
+    `errors` and `error_rate`.
+    """
+    by_arm: Dict[str, List[dict]] = {}
+    for record in records:
+        by_arm.setdefault(record["arm"], []).append(record)
+
+    stats = {}
+    for arm, turns in by_arm.items():
+        sessions: Dict[str, List[dict]] = {}
+        for turn in turns:
+            sessions.setdefault(turn["session_id"], []).append(turn)
+        completed = [
+            session_turns
+            for session_turns in sessions.values()
+            if any(turn["ended"] for turn in session_turns)
+        ]
+        failed = [turn for turn in turns if turn.get("error")]
+        latencies = [turn["seconds"] for turn in turns if not turn.get("error")]
+        decisions: Dict[str, int] = {}
+        for turn in turns:
+            if turn["decision"] is not None:
+                name = DecisionType(turn["decision"]).name
+                decisions[name] = decisions.get(name, 0) + 1
+        decided = sum(decisions.values())
+
+        stats[arm] = {
+            "sessions": len(sessions),
+            "turns": len(turns),
+            "latencies": latencies,
+            "mean_seconds": _mean(latencies),
+            "p50_seconds": percentile(latencies, 50) if latencies else None,
+            "p95_seconds": percentile(latencies, 95) if latencies else None,
+            "errors": len(failed),
+            "error_rate": len(failed) / len(turns),
+            "tokens_per_turn": _mean([turn["tokens"] for turn in turns]),
+            "tokens_per_session": _mean(
+                [
+                    sum(turn["tokens"] for turn in session_turns)
+                    for session_turns in sessions.values()
+                ]
+            ),
+            "cost_per_session": _mean(
+                [
+                    sum(turn["cost"] for turn in session_turns)
+                    for session_turns in sessions.values()
+                ]
+            ),
+            "completed_sessions": len(completed),
+            "completion_rate": len(completed) / len(sessions),
+            "turns_to_completion": _mean([len(session_turns) for session_turns in completed]),
+            "decisions": {
+                name: count / decided for name, count in sorted(decisions.items())
+            },
+        }
+    return stats
+
+
+def _change(value: Optional[float], baseline: Optional[float]) -> Optional[float]:
+    return None if value is None or baseline is None else value - baseline
+
+
+def _bootstrap_mean_difference(
+    values: List[float], baseline: List[float], resamples: int = 2000
+) -> tuple:
+    """95% interval of mean(values) - mean(baseline), resampling both"""
+    generator = random.Random(0)
+    differences = sorted(
+        _mean(generator.choices(values, k=len(values)))
+        - _mean(generator.choices(baseline, k=len(baseline)))
+        for _ in range(resamples)
+    )
+    return percentile(differences, 2.5), percentile(differences, 97.5)
+
+
+def compare_arms(
+    stats: Dict[str, dict],
+    baseline: str,
+    max_completion_drop: float = 0.05,
+    max_extra_turns: float = 1.0,
+    max_error_increase: float = 0.01,
+) -> Dict[str, dict]:
+    """Compare every arm with the baseline arm.
+
+    An arm is faster or slower when the 95% bootstrap interval of its mean
+    turn latency difference excludes zero. Its outcomes hold when its
+    completion rate is at most `max_completion_drop` below the baseline's,
+    completed sessions take at most `max_extra_turns` more turns and its
+    share of failed turns is at most `max_error_increase` above the baseline's.
+    """
+    base = stats[baseline]
+    comparisons = {}
+    for arm, stat in stats.items():
+        if arm == baseline:
+            continue
+        if stat["latencies"] and base["latencies"]:
+            low, high = _bootstrap_mean_difference(stat["latencies"], base["latencies"])
+        else:
+            low = high = None
+        if high is not None and high < 0:
+            speed = "faster"
+        elif low is not None and low > 0:
+            speed = "slower"
+        else:
+            speed = "no clear difference"
+
+        extra_turns = (
+            stat["turns_to_completion"] - base["turns_to_completion"]
+            if stat["turns_to_completion"] is not None
+            and base["turns_to_completion"] is not None
+            else None
+        )
+        completion_change = stat["completion_rate"] - base["completion_rate"]
+        error_rate_change = stat["error_rate"] - base["error_rate"]
+        outcomes_held = (
+            completion_change >= -max_completion_drop
+            and (extra_turns is None or extra_turns <= max_extra_turns)
+            and error_rate_change <= max_error_increase
+        )
+        names = set(stat["decisions"]) | set(base["decisions"])
+        decision_shift = sum(
+            abs(stat["decisions"].get(name, 0.0) - base["decisions"].get(name, 0.0))
+            for name in names
+        ) / 2
+
+        comparisons[arm] = {
+            "mean_seconds_change": _change(stat["mean_seconds"], base["mean_seconds"]),
+            "mean_seconds_interval": [low, high],
+            "p95_seconds_change": _change(stat["p95_seconds"], base["p95_seconds"]),
+            "tokens_per_turn_change": stat["tokens_per_turn"] - base["tokens_per_turn"],
+            "completion_rate_change": completion_change,
+            "error_rate_change": error_rate_change,
+            "extra_turns_to_completion": extra_turns,
+            "decision_shift": decision_shift,
+            "speed": speed,
+            "outcomes_held": outcomes_held,
+            "verdict": f"{speed}, outcomes {'held' if outcomes_held else 'worse'}",
+        }
+    return comparisons
@@ -1,4 +1,5 @@
 from rich.console import Console
+from rich.live import Live
 from rich.panel import Panel
 from rich.style import Style
 from rich.text import Text
@@ -106,6 +107,9 @@ class ConversationFormatter:
 
 class ConversationUI:
     """Handles all UI and formatting aspects of the conversation"""
+
+    # Renders child and facilitator replies token by token
+    streams = True
     
     def __init__(self, console: Console):
         self.console = console
@@ -135,10 +139,25 @@ class ConversationUI:
         """Display the initial message from the child"""
         self.console.print(ConversationFormatter.child(message, self.child_label))
         
+    def display_decision(self, decision, reasoning):
+        """Decisions are internal to the facilitator and not shown to the parent"""
+        pass
+        
     def display_trace(self, trace):
         """Display the conversation trace"""
         self.console.print(ConversationFormatter.debug_panel(trace))
         
+    def display_prompt_sizes(self, prompt_sizes):
+        """Display the token count of every prompt sent so far"""
+        if not prompt_sizes:
+            self.console.print(ConversationFormatter.debug_panel("No prompts sent yet"))
+            return
+        self.console.print(
+            ConversationFormatter.debug_panel(
+                "\n".join(prompt_size.describe() for prompt_size in prompt_sizes)
+            )
+        )
+        
     def display_save_confirmation(self, file_path):
         """Display confirmation of saved trace"""
         self.console.print(
@@ -173,6 +192,32 @@ class ConversationUI:
         """Display facilitator's message"""
         self.console.print(ConversationFormatter.facilitator(message, self.facilitator_label))
         self.console.print()
+
+    def _display_streaming(self, tokens, render) -> str:
+        """Render a panel that grows as tokens arrive. Returns the complete text."""
+        tokens = iter(tokens)
+        # Nothing is drawn until the first token, so earlier output is not interleaved
+        text = next(tokens, "")
+        with Live(render(text), console=self.console, refresh_per_second=12) as live:
+            for token in tokens:
+                text += token
+                live.update(render(text))
+        return text
+
+    def stream_child_response(self, tokens):
+        """Display child's response as it is generated. Returns the complete text."""
+        return self._display_streaming(
+            tokens, lambda text: ConversationFormatter.child(text, self.child_label)
+        )
+
+    def stream_facilitator_message(self, tokens):
+        """Display facilitator's message as it is generated. Returns the complete text."""
+        message = self._display_streaming(
+            tokens,
+            lambda text: ConversationFormatter.facilitator(text, self.facilitator_label),
+        )
+        self.console.print()
+        return message
         
     def display_end_separator(self):
         """Display a separator at the end of conversation"""
@@ -5,37 +5,98 @@ from langchain.prompts import (
     PromptTemplate,
 )
 from langchain_openai import ChatOpenAI
-from src.conversation_tracer import ConversationTracer, TraceEntry
+from langchain_core.messages import AIMessage
+from src.conversation_tracer import TraceEntry
 from src.config import Config
 from src.decision_types import DecisionType
+from src.debug_log import get_debug_log
+from src.decision_classifier import DecisionClassifier
+from src.token_counter import PromptSizeTracker
+from src.model_router import PIPELINE_ROLES, ModelRouter
+from src.opening_pool import OpeningPool
+from src.profiler import SessionProfiler
+from src.response_cache import ResponseCache
+from src.single_flight import get_single_flight
+from src.spans import current_span, get_span_tracer, traced
+from src.rate_limiter import get_rate_limiter, is_rate_limit_error, retry_after_seconds
+from src.scheduler import get_scheduler
+from src.session import Session
+from src.token_ledger import BUDGET_HARD, BUDGET_OK, BudgetPolicy, compress_history
+from src.warmup import get_http_client
 from dotenv import load_dotenv
+import contextvars
 import os
+import queue
+import secrets
+import threading
+import time
 import yaml
 import json
-from typing import List, Optional, Tuple
+from typing import Callable, Iterator, List, Optional, Tuple
 from datetime import datetime
+from functools import partial
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Receives the reply text of model calls as it streams in, set by Framework._stream
+_token_sink: contextvars.ContextVar[Optional[Callable[[str], None]]] = (
+    contextvars.ContextVar("token_sink", default=None)
+)
+
 
 class Framework:
-    def __init__(self, config, debug_mode=False):
-        if not os.getenv("TOGETHER_API_KEY"):
+    """Models, prompts and shared services for one config.
+
+    Holds no conversation state: every generate_* call takes the Session it
+    works on, so one Framework is built per config and shared by all
+    concurrent sessions and threads.
+    """
+
+    def __init__(
+        self,
+        config,
+        debug_mode=False,
+        response_cache=None,
+        track_daily_usage=True,
+        api_base=None,
+        api_key=None,
+    ):
+        if not (api_key or os.getenv("TOGETHER_API_KEY")):
             raise ValueError(
                 "TOGETHER_API_KEY environment variable is not set. Please check your .env file."
             )
 
         self.config = config
         self.debug_mode = debug_mode
-        self.child_llm = ChatTogether(
-            model=config.get("models", "child"),
-            temperature=config.get("models", "child_temperature"),
+        # Rendered prompts and raw replies, written in the background when enabled
+        self.debug_log = get_debug_log(config.get(), enabled=debug_mode)
+        # Every model client shares one keep-alive connection pool
+        get_http_client(config.get())
+        # An explicit endpoint, such as the load test stub, instead of the
+        # TOGETHER_API_BASE and TOGETHER_API_KEY environment
+        provider = {
+            name: value
+            for name, value in (("base_url", api_base), ("api_key", api_key))
+            if value is not None
+        }
+        self._llm_factory = (
+            partial(self._create_llm, **provider) if provider else self._create_llm
         )
-        self.facilitator_llm = ChatTogether(
-            model=config.get("models", "facilitator"),
-            temperature=config.get("models", "facilitator_temperature"),
+        self.child_llm = self._llm_factory(
+            config.get("models", "child"), config.get("models", "child_temperature")
         )
+        self.facilitator_llm = self._llm_factory(
+            config.get("models", "facilitator"),
+            config.get("models", "facilitator_temperature"),
+        )
+
+        # Per-role models and latency fallbacks from the optional `routing` section
+        self.router = ModelRouter(config.get(), self._llm_factory)
+        self.child_llm = self.router.primary_llm("child", self.child_llm)
+        self.decision_llm = self.router.primary_llm("decision", self.facilitator_llm)
+        self.coaching_llm = self.router.primary_llm("coaching", self.facilitator_llm)
+        self.summary_llm = self.router.primary_llm("summary", self.facilitator_llm)
 
         self.child_system_prompt = config.get("system_prompts", "child")
         self.facilitator_decision_system_prompt = config.get(
@@ -54,138 +115,626 @@ class Framework:
             "system_prompts", "facilitator_summary"
         )
 
-        self.child_pipeline = (
-            ChatPromptTemplate.from_messages(
-                [SystemMessagePromptTemplate.from_template(self.child_system_prompt)]
-            ).partial(
-                scenario_description=self.config.get("scenario", "description"),
-                # scenario_objectives=self.config.get("scenario", "objectives"),
-            )
-            | self.child_llm
+        self.child_prompt = ChatPromptTemplate.from_messages(
+            [SystemMessagePromptTemplate.from_template(self.child_system_prompt)]
+        ).partial(
+            scenario_description=self.config.get("scenario", "description"),
+            # scenario_objectives=self.config.get("scenario", "objectives"),
         )
 
-        self.facilitator_decision_pipeline = (
-            ChatPromptTemplate.from_messages(
-                [
-                    SystemMessagePromptTemplate.from_template(
-                        self.facilitator_decision_system_prompt
-                    )
-                ]
-            ).partial(
-                scenario_description=self.config.get("scenario", "description"),
-                scenario_objectives=self.config.get("scenario", "objectives"),
-                end_conversation=self.config.get("conditions", "end_conversation"),
-                child_only_neutral=self.config.get("conditions", "child_only_neutral"),
-                child_only_positive=self.config.get(
-                    "conditions", "child_only_positive"
-                ),
-                child_and_facilitator_positive_reinforcement=self.config.get(
-                    "conditions", "child_and_facilitator_positive_reinforcement"
-                ),
-                child_and_facilitator_help=self.config.get(
-                    "conditions", "child_and_facilitator_help"
-                ),
-                facilitator_only_help=self.config.get(
-                    "conditions", "facilitator_only_help"
-                ),
-            )
-            | self.facilitator_llm
+        self.facilitator_decision_prompt = ChatPromptTemplate.from_messages(
+            [
+                SystemMessagePromptTemplate.from_template(
+                    self.facilitator_decision_system_prompt
+                )
+            ]
+        ).partial(
+            scenario_description=self.config.get("scenario", "description"),
+            scenario_objectives=self.config.get("scenario", "objectives"),
+            end_conversation=self.config.get("conditions", "end_conversation"),
+            child_only_neutral=self.config.get("conditions", "child_only_neutral"),
+            child_only_positive=self.config.get(
+                "conditions", "child_only_positive"
+            ),
+            child_and_facilitator_positive_reinforcement=self.config.get(
+                "conditions", "child_and_facilitator_positive_reinforcement"
+            ),
+            child_and_facilitator_help=self.config.get(
+                "conditions", "child_and_facilitator_help"
+            ),
+            facilitator_only_help=self.config.get(
+                "conditions", "facilitator_only_help"
+            ),
         )
 
-        self.facilitator_positive_reinforcement_pipeline = (
-            ChatPromptTemplate.from_messages(
-                [
-                    SystemMessagePromptTemplate.from_template(
-                        self.facilitator_positive_reinforcement_system_prompt
-                    )
-                ]
-            ).partial(
-                scenario_description=self.config.get("scenario", "description"),
-                scenario_objectives=self.config.get("scenario", "objectives"),
-            )
-            | self.facilitator_llm
+        self.facilitator_positive_reinforcement_prompt = ChatPromptTemplate.from_messages(
+            [
+                SystemMessagePromptTemplate.from_template(
+                    self.facilitator_positive_reinforcement_system_prompt
+                )
+            ]
+        ).partial(
+            scenario_description=self.config.get("scenario", "description"),
+            scenario_objectives=self.config.get("scenario", "objectives"),
         )
 
-        self.facilitator_help_pipeline = (
-            ChatPromptTemplate.from_messages(
-                [
-                    SystemMessagePromptTemplate.from_template(
-                        self.facilitator_help_system_prompt
-                    )
-                ]
+        self.facilitator_help_prompt = ChatPromptTemplate.from_messages(
+            [
+                SystemMessagePromptTemplate.from_template(
+                    self.facilitator_help_system_prompt
+                )
+            ]
+        ).partial(
+            scenario_description=self.config.get("scenario", "description"),
+            scenario_objectives=self.config.get("scenario", "objectives"),
+        )
+
+        self.facilitator_end_coaching_prompt = ChatPromptTemplate.from_messages(
+            [
+                SystemMessagePromptTemplate.from_template(
+                    self.facilitator_end_coaching_system_prompt
+                )
+            ]
+        ).partial(
+            scenario_description=self.config.get("scenario", "description"),
+            scenario_objectives=self.config.get("scenario", "objectives"),
+        )
+
+        self.facilitator_summary_prompt = ChatPromptTemplate.from_messages(
+            [
+                SystemMessagePromptTemplate.from_template(
+                    self.facilitator_summary_system_prompt
+                )
+            ]
+        ).partial(
+            scenario_description=self.config.get("scenario", "description"),
+            scenario_objectives=self.config.get("scenario", "objectives"),
+        )
+
+        # Prompt and model used by each pipeline, keyed by pipeline name
+        self.pipelines = {
+            "child": (self.child_prompt, self.child_llm),
+            "facilitator_decision": (
+                self.facilitator_decision_prompt,
+                self.decision_llm,
+            ),
+            "facilitator_positive_reinforcement": (
+                self.facilitator_positive_reinforcement_prompt,
+                self.coaching_llm,
+            ),
+            "facilitator_help": (self.facilitator_help_prompt, self.coaching_llm),
+            "facilitator_end_coaching": (
+                self.facilitator_end_coaching_prompt,
+                self.coaching_llm,
+            ),
+            "facilitator_summary": (
+                self.facilitator_summary_prompt,
+                self.summary_llm,
+            ),
+        }
+
+        # Optional judge that pre-scores annotation CSVs for the `prescore` command
+        self.judge_system_prompt = config.get("judge", "prompt")
+        if self.judge_system_prompt:
+            judge_model = config.get(
+                "judge", "model", default=config.get("models", "facilitator")
+            )
+            self.judge_llm = self.router.primary_llm(
+                "judge",
+                self._llm_factory(
+                    judge_model, config.get("judge", "temperature", default=0.0)
+                ),
+            )
+            self.judge_prompt = ChatPromptTemplate.from_messages(
+                [SystemMessagePromptTemplate.from_template(self.judge_system_prompt)]
             ).partial(
                 scenario_description=self.config.get("scenario", "description"),
                 scenario_objectives=self.config.get("scenario", "objectives"),
             )
-            | self.facilitator_llm
+            self.pipelines["judge"] = (self.judge_prompt, self.judge_llm)
+
+        self.response_cache = response_cache
+        self.prompt_sizes = PromptSizeTracker(config.get())
+        self.rate_limiter = get_rate_limiter(config.get())
+        self.completion_tokens_estimate = config.get(
+            "rate_limits", "completion_tokens_estimate", default=300
+        )
+        # Identical requests in flight at the same time are only sent once. This
+        # is limited to deterministic temperatures so sampled replies stay varied.
+        self.single_flight = get_single_flight()
+        self.single_flight_max_temperature = config.get(
+            "single_flight", "max_temperature", default=0.0
+        )
+
+        # Every model call is admitted by the priority class of its session
+        self.scheduler = get_scheduler(config.get())
+        # Set by batch tools to send model calls as provider batch jobs instead
+        self.batch_backend = None
+
+        # Token and cost budgets per session and per day, from the optional
+        # `budgets` section. Usage is recorded on the conversation's ledger.
+        self.budgets = BudgetPolicy(config.get(), track_daily=track_daily_usage)
+
+        # Precomputed first turns for this exact config, built with `warm-cache`
+        self.opening_pool = OpeningPool.load(
+            config.get(), config.get("warm_cache", "directory")
+        )
+        self.decision_classifier = DecisionClassifier.from_config(config.get())
+
+        # Timed spans per turn, exported by the optional `tracing` section
+        self.spans = get_span_tracer(config.get())
+
+    @staticmethod
+    def _create_llm(model: str, temperature: float, **provider):
+        return ChatTogether(
+            model=model,
+            temperature=temperature,
+            http_client=get_http_client(),
+            **provider,
         )
 
-        self.facilitator_end_coaching_pipeline = (
-            ChatPromptTemplate.from_messages(
-                [
-                    SystemMessagePromptTemplate.from_template(
-                        self.facilitator_end_coaching_system_prompt
+    def should_skip_optional_coaching(self) -> bool:
+        """True while positive reinforcement coaching should be skipped to hold the latency SLO"""
+        _, coaching_llm = self.pipelines["facilitator_positive_reinforcement"]
+        return self.router.skip_optional_coaching(coaching_llm.model_name)
+
+    @staticmethod
+    def _priority(session: Session, pipeline_name: str) -> str:
+        """Scheduler class of a pipeline's model calls"""
+        if session.priority == "batch" or pipeline_name == "judge":
+            return "batch"
+        if pipeline_name == "facilitator_summary":
+            return "summary"
+        return session.priority
+
+    @traced("llm")
+    def _invoke(
+        self,
+        session: Session,
+        pipeline_name: str,
+        prompt_inputs: dict,
+        validate: Optional[Callable[[str], bool]] = None,
+    ) -> AIMessage:
+        """Render a pipeline's prompt and send it to the pipeline's model.
+
+        When a response cache is configured, identical rendered prompts sent to the
+        same model and temperature are answered from the cache. With `validate`,
+        only replies it accepts are cached or served from the cache, so a retry
+        after an unusable reply asks the model again. Identical requests
+        already in flight are coalesced when the temperature allows it, unless
+        the reply is being streamed.
+        """
+        on_token = _token_sink.get()
+        turn_id = session.turn_id
+        prompt, primary_llm = self.pipelines[pipeline_name]
+        # Past a soft budget limit, prefer the cheaper fallback models and trim the history
+        over_budget = self.budgets.state(session.conversation_trace.ledger) != BUDGET_OK
+        llm = self.router.route(
+            pipeline_name,
+            primary_llm,
+            prefer_fallback=over_budget and self.budgets.use_fallback_models,
+        )
+        if llm is not primary_llm:
+            reason = "over budget" if over_budget else "over its latency SLO"
+            self._debug_event(
+                "Model Router",
+                f"{primary_llm.model_name} is {reason}, "
+                f"using {llm.model_name} for {pipeline_name}",
+                pipeline_name,
+                turn_id,
+            )
+        session.turn_models[pipeline_name] = llm.model_name
+        if over_budget and self.budgets.history_tokens and prompt_inputs.get(
+            "interaction_history"
+        ):
+            prompt_inputs = dict(
+                prompt_inputs,
+                interaction_history=compress_history(
+                    prompt_inputs["interaction_history"],
+                    self.budgets.history_tokens,
+                    self.prompt_sizes.counter,
+                ),
+            )
+        messages = prompt.format_messages(**prompt_inputs)
+
+        prompt_size = self.prompt_sizes.measure(pipeline_name, messages, prompt_inputs)
+        session.prompt_sizes.append(prompt_size)
+        if prompt_size.over_budget:
+            current_span().add_event(
+                "prompt.over_budget", tokens=prompt_size.total, budget=prompt_size.budget
+            )
+            self._debug_event(
+                "Prompt Over Budget",
+                f"{prompt_size.total} tokens, over the budget of {prompt_size.budget} "
+                f"({prompt_size.describe()})",
+                pipeline_name,
+                turn_id,
+            )
+        # Prompt and reply share an id, so a sampled call is always logged whole
+        call_id = None
+        if self.debug_log.sampled(pipeline_name, turn_id):
+            call_id = secrets.token_hex(4)
+            self.debug_log.record(
+                "prompt",
+                pipeline_name,
+                turn_id,
+                call_id=call_id,
+                model=llm.model_name,
+                prompt_tokens=prompt_size.total,
+                prompt_size=prompt_size.describe(),
+                messages=[
+                    {"role": message.type, "content": message.content}
+                    for message in messages
+                ],
+            )
+
+        span = current_span()
+        span.set_attribute("llm.pipeline", pipeline_name)
+        span.set_attribute("llm.model", llm.model_name)
+        span.set_attribute("llm.fallback", llm is not primary_llm)
+        span.set_attribute("llm.prompt_tokens", prompt_size.total)
+        priority = self._priority(session, pipeline_name)
+        span.set_attribute("llm.priority", priority)
+        span.set_attribute("llm.over_budget", over_budget)
+
+        if self.response_cache is not None:
+            cached = self.response_cache.get(
+                llm.model_name, llm.temperature, messages
+            )
+            if cached is not None and validate is not None and not validate(cached):
+                cached = None
+            span.set_attribute("llm.cache_hit", cached is not None)
+            if cached is not None:
+                if on_token is not None:
+                    on_token(cached)
+                if call_id is not None:
+                    self.debug_log.record(
+                        "response",
+                        pipeline_name,
+                        turn_id,
+                        call_id=call_id,
+                        model=llm.model_name,
+                        cached=True,
+                        text=cached,
                     )
-                ]
-            ).partial(
-                scenario_description=self.config.get("scenario", "description"),
-                scenario_objectives=self.config.get("scenario", "objectives"),
+                return AIMessage(content=cached)
+
+        def call_model():
+            response = self._call_model(
+                llm, messages, prompt_size.total, priority, session.session_id, on_token
+            )
+            # Only the session that actually sent the request pays for it
+            self._record_usage(
+                session, pipeline_name, llm.model_name, prompt_size.total, response
+            )
+            return response
+
+        start = time.perf_counter()
+        # A batch round only starts once every session is waiting on a call of
+        # its own, so batch calls are never coalesced behind another session's
+        if (
+            on_token is None
+            and self.batch_backend is None
+            and self.single_flight_max_temperature is not None
+            and llm.temperature is not None
+            and llm.temperature <= self.single_flight_max_temperature
+        ):
+            response = self.single_flight.do(
+                ResponseCache.make_key(llm.model_name, llm.temperature, messages),
+                call_model,
             )
-            | self.facilitator_llm
+        else:
+            response = call_model()
+
+        usage = getattr(response, "usage_metadata", None) or {}
+        span.set_attribute("llm.completion_tokens", usage.get("output_tokens"))
+        if call_id is not None:
+            self.debug_log.record(
+                "response",
+                pipeline_name,
+                turn_id,
+                call_id=call_id,
+                model=llm.model_name,
+                cached=False,
+                seconds=round(time.perf_counter() - start, 3),
+                usage=usage,
+                text=response.content,
+            )
+
+        if self.response_cache is not None and (
+            validate is None or validate(response.content)
+        ):
+            self.response_cache.put(
+                llm.model_name, llm.temperature, messages, response.content
+            )
+        return response
+
+    def _record_usage(
+        self,
+        session: Session,
+        pipeline_name: str,
+        model: str,
+        prompt_tokens: int,
+        response: AIMessage,
+    ):
+        """Add a call's tokens and cost to the conversation's ledger.
+
+        Uses the provider's usage metadata, or local counts when it has none.
+        """
+        usage = getattr(response, "usage_metadata", None) or {}
+        self.budgets.record(
+            session.conversation_trace.ledger,
+            PIPELINE_ROLES[pipeline_name],
+            model,
+            usage.get("input_tokens") or prompt_tokens,
+            usage.get("output_tokens") or self.prompt_sizes.counter.count(response.content),
         )
 
-        self.facilitator_summary_pipeline = (
-            ChatPromptTemplate.from_messages(
-                [
-                    SystemMessagePromptTemplate.from_template(
-                        self.facilitator_summary_system_prompt
+    def _call_model(
+        self,
+        llm,
+        messages,
+        prompt_tokens: int,
+        priority: str = "interactive",
+        session_id: Optional[str] = None,
+        on_token: Optional[Callable[[str], None]] = None,
+    ) -> AIMessage:
+        """Send messages to a model once the scheduler admits the call.
+
+        Goes through the shared rate limiter and retries on 429s. A batch call
+        preempted while waiting for the rate limiter queues again. With
+        `on_token`, the reply is streamed and passed to it piece by piece.
+        """
+        if self.batch_backend is not None:
+            response = self.batch_backend.call(llm, messages)
+            if on_token is not None:
+                on_token(response.content)
+            return response
+
+        rate_limited_attempts = 0
+        span = current_span()
+        while True:
+            queued = time.perf_counter()
+            with self.scheduler.slot(priority, session_id, prompt_tokens) as ticket:
+                queued = time.perf_counter() - queued
+                if queued > 0.001:
+                    span.add_event("scheduler.wait", seconds=queued, priority=priority)
+
+                wait = self.rate_limiter.acquire(
+                    llm.model_name, prompt_tokens + self.completion_tokens_estimate
+                )
+                if wait > 0:
+                    span.add_event("rate_limiter.wait", seconds=wait)
+                    self._debug_event(
+                        "Rate Limiter", f"Waited {wait:.2f}s for {llm.model_name}"
                     )
-                ]
-            ).partial(
-                scenario_description=self.config.get("scenario", "description"),
-                scenario_objectives=self.config.get("scenario", "objectives"),
-            )
-            | self.facilitator_llm
+                if not self.scheduler.start(ticket):
+                    span.add_event("scheduler.preempted")
+                    continue
+
+                try:
+                    start = time.perf_counter()
+                    if on_token is None:
+                        response = llm.invoke(messages)
+                    else:
+                        response = self._stream_model(llm, messages, on_token)
+                    elapsed = time.perf_counter() - start
+                    self.router.record_latency(llm.model_name, elapsed)
+                    SessionProfiler.record_model_wait(elapsed)
+                except Exception as e:
+                    if (
+                        not is_rate_limit_error(e)
+                        or rate_limited_attempts >= self.rate_limiter.max_retries
+                    ):
+                        raise
+                    rate_limited_attempts += 1
+                    span.add_event("rate_limited", attempt=rate_limited_attempts)
+                    self.rate_limiter.record_rate_limited(
+                        llm.model_name, retry_after_seconds(e)
+                    )
+                    continue
+
+                self.rate_limiter.record_success(llm.model_name)
+                return response
+
+    def _stream_model(self, llm, messages, on_token: Callable[[str], None]) -> AIMessage:
+        """Send messages with streaming on. Returns the whole reply once it is complete."""
+        span = current_span()
+        start = time.perf_counter()
+        response = None
+        for chunk in llm.stream(messages, stream_usage=True):
+            if response is None:
+                span.set_attribute("llm.first_token_seconds", time.perf_counter() - start)
+                response = chunk
+            else:
+                response = response + chunk
+            if chunk.content:
+                on_token(chunk.content)
+        return response if response is not None else AIMessage(content="")
+
+    def _stream(self, generate: Callable, *args, **kwargs) -> Iterator[str]:
+        """Run a generate_* method on its own thread and yield its reply as it is generated.
+
+        Replies that do not come from a model call, such as a precomputed
+        opening, are yielded in one piece once the method returns.
+        """
+        tokens = queue.Queue()
+        context = contextvars.copy_context()
+        context.run(_token_sink.set, tokens.put)
+        outcome = {}
+
+        def generate_in_turn():
+            # The model call runs here, so the turn's profile must cover this thread
+            with SessionProfiler.helper_thread():
+                return generate(*args, **kwargs)
+
+        def run():
+            try:
+                outcome["text"] = context.run(generate_in_turn)
+            except Exception as e:
+                outcome["error"] = e
+            finally:
+                tokens.put(None)
+
+        threading.Thread(target=run, name="stream", daemon=True).start()
+        streamed = ""
+        while (token := tokens.get()) is not None:
+            streamed += token
+            yield token
+
+        if "error" in outcome:
+            raise outcome["error"]
+        if outcome["text"].startswith(streamed) and outcome["text"] != streamed:
+            yield outcome["text"][len(streamed):]
+
+    def stream_child_response(self, session: Session, parent_input) -> Iterator[str]:
+        """Like generate_child_response, but yields the reply as it is generated"""
+        return self._stream(self.generate_child_response, session, parent_input)
+
+    def stream_positive_coaching(
+        self,
+        session: Session,
+        parent_input,
+        child_response=None,
+        reasoning=None,
+        facilitator_only_response=False,
+    ) -> Iterator[str]:
+        """Like generate_positive_coaching, but yields the coaching as it is generated"""
+        if facilitator_only_response:
+            yield self.config.get("static_messages", "retry_message") + " "
+        yield from self._stream(
+            self.generate_positive_coaching, session, parent_input, child_response, reasoning
+        )
+
+    def stream_negative_coaching(
+        self, session: Session, parent_input, reasoning, facilitator_only_response=False
+    ) -> Iterator[str]:
+        """Like generate_negative_coaching, but yields the coaching as it is generated"""
+        if facilitator_only_response:
+            yield self.config.get("static_messages", "retry_message") + " "
+        yield from self._stream(
+            self.generate_negative_coaching, session, parent_input, reasoning
         )
 
-        self.conversation_trace = ConversationTracer()
-        self.turn_count = 1
+    def stream_end_coaching(self, session: Session, parent_input, reasoning) -> Iterator[str]:
+        """Like generate_end_coaching, but yields the coaching as it is generated"""
+        return self._stream(self.generate_end_coaching, session, parent_input, reasoning)
 
-    def _debug_print(self, prompt_name: str, prompt_content: str):
-        """Helper method to print debug information if debug mode is enabled."""
-        if self.debug_mode:
-            print(f"\n=== {prompt_name} ===")
-            print(prompt_content)
-            print("===========================\n")
+    def _debug_event(
+        self,
+        name: str,
+        text: str,
+        pipeline: Optional[str] = None,
+        turn_id: Optional[str] = None,
+    ):
+        """Queue a debug note for the debug log, if it is enabled and the turn is sampled"""
+        self.debug_log.record("event", pipeline, turn_id, name=name, text=text)
+
+    def _lookup_opening(self, session: Session, parent_input) -> Optional[dict]:
+        """Pick a precomputed first turn while the conversation is still in its initial state."""
+        session.opening = None
+        if (
+            self.opening_pool is None
+            or session.turn_count != 1
+            or session.conversation_trace.get_full_trace()
+        ):
+            return None
+
+        opening = self.opening_pool.lookup(parent_input)
+        if opening is not None:
+            session.opening = dict(opening, parent=parent_input)
+            self._debug_event(
+                "Opening Pool",
+                f"Serving a precomputed first turn for: {parent_input}",
+                "facilitator_decision",
+                session.turn_id,
+            )
+        return session.opening
+
+    @traced("child")
+    def generate_child_response(self, session: Session, parent_input):
+        # Serve the child reply of the precomputed first turn picked by generate_decision
+        if (
+            session.opening is not None
+            and session.opening.get("child")
+            and session.opening["parent"] == parent_input
+        ):
+            child_response = session.opening["child"]
+            session.opening = None
+            session.turn_models["child"] = "opening_pool"
+            current_span().set_attribute("llm.model", "opening_pool")
+            return child_response
 
-    def generate_child_response(self, parent_input):
         prompt_inputs = {
             "parent_response": parent_input,
-            "interaction_history": self.conversation_trace.get_pretty_conversation(),
+            "interaction_history": session.conversation_trace.get_pretty_conversation(),
             "scenario_description": self.config.get("scenario", "description"),
             # "scenario_objectives": self.config.get("scenario", "objectives"),
-            "turn_count": self.turn_count,
+            "turn_count": session.turn_count,
         }
 
-        if self.debug_mode:
-            constructed_prompt = self.child_system_prompt.format(**prompt_inputs)
-            self._debug_print("Child Response Prompt", constructed_prompt)
-
-        child_response = self.child_pipeline.invoke(prompt_inputs)
+        child_response = self._invoke(session, "child", prompt_inputs)
         return child_response.content
 
-    def log_interaction(self, parent, child, decision, decision_reasoning, coaching):
-        entry = TraceEntry(parent, child, decision, decision_reasoning, coaching)
-        self.conversation_trace.add_entry(entry)
+    @traced("trace.log")
+    def log_interaction(
+        self, session: Session, parent, child, decision, decision_reasoning, coaching
+    ):
+        entry = TraceEntry(
+            parent,
+            child,
+            decision,
+            decision_reasoning,
+            coaching,
+            models=session.turn_models or None,
+        )
+        session.conversation_trace.add_entry(entry)
+        session.turn_models = {}
+
+    @traced("decision")
+    def generate_decision(
+        self, session: Session, parent_input, child_response=None
+    ) -> tuple[int, str]:
+        span = current_span()
+        span.set_attribute("turn.count", session.turn_count)
+        # Past the hard budget limit the conversation ends with end coaching and the summary
+        if self.budgets.state(session.conversation_trace.ledger) == BUDGET_HARD:
+            decision = DecisionType.END_CONVERSATION.value
+            session.turn_models["facilitator_decision"] = "budget"
+            span.set_attribute("decision.source", "budget")
+            span.set_attribute("decision.value", decision)
+            return (decision, "The token budget for this conversation has been used up.")
+
+        opening = self._lookup_opening(session, parent_input)
+        if opening is not None:
+            session.turn_models["facilitator_decision"] = "opening_pool"
+            span.set_attribute("decision.source", "opening_pool")
+            span.set_attribute("decision.value", opening["decision"])
+            return (opening["decision"], opening["decision_reasoning"])
+
+        # Decide locally when the nearest labelled examples agree confidently
+        if self.decision_classifier is not None:
+            prediction = self.decision_classifier.predict(parent_input, session.turn_count)
+            if prediction is not None:
+                self._debug_event(
+                    "Decision Classifier",
+                    f"Decision {prediction.decision} with confidence "
+                    f"{prediction.confidence:.2f} (similarity {prediction.similarity:.2f})",
+                    "facilitator_decision",
+                    session.turn_id,
+                )
+                session.turn_models["facilitator_decision"] = "decision_classifier"
+                span.set_attribute("decision.source", "decision_classifier")
+                span.set_attribute("decision.value", prediction.decision)
+                return (prediction.decision, prediction.reasoning)
 
-    def generate_decision(self, parent_input, child_response=None) -> tuple[int, str]:
         prompt_inputs = {
             "parent_response": parent_input,
-            "child_response": self.conversation_trace.get_latest_child_message(),
-            "interaction_history": self.conversation_trace.get_pretty_trace_full(
+            "child_response": session.conversation_trace.get_latest_child_message(),
+            "interaction_history": session.conversation_trace.get_pretty_trace_full(
                 exclude_latest_child=True
             ),
-            "turn_count": self.turn_count,
+            "turn_count": session.turn_count,
             "scenario_description": self.config.get("scenario", "description"),
             "scenario_objectives": self.config.get("scenario", "objectives"),
             "end_conversation": self.config.get("conditions", "end_conversation"),
@@ -202,53 +751,34 @@ class Framework:
             ),
         }
 
-        if self.debug_mode:
-            constructed_prompt = self.facilitator_decision_system_prompt.format(
-                **prompt_inputs
-            )
-            self._debug_print("Facilitator Decision Prompt", constructed_prompt)
-
         max_retries = 3
         attempts = 0
 
+        span.set_attribute("decision.source", "model")
         while attempts < max_retries:
             attempts += 1
+            span.set_attribute("decision.attempts", attempts)
 
-            facilitator_response = self.facilitator_decision_pipeline.invoke(
-                prompt_inputs
+            facilitator_response = self._invoke(
+                session,
+                "facilitator_decision",
+                prompt_inputs,
+                validate=self._is_valid_decision,
             )
 
-            decision = None
-            feedback = ""
-            decision_found = False
-            reasoning_found = False
-
-            for line in facilitator_response.content.split("\n"):
-                if line.startswith("DECISION:"):
-                    decision_found = True
-                    try:
-                        decision = int(line.split(":")[1].strip())
-                    except (ValueError, IndexError):
-                        if self.debug_mode:
-                            print(f"Invalid decision format: {line}")
-                        continue
-                elif line.startswith("REASONING:"):
-                    reasoning_found = True
-                    feedback = line.replace("REASONING:", "", 1).strip()
-
             try:
-                if not decision_found or decision is None:
-                    raise ValueError("Decision not found in the response")
-                if not reasoning_found or not feedback:
-                    raise ValueError("Reasoning not found in the response")
-
-                DecisionType(decision)
-
+                decision, feedback = self.parse_decision(facilitator_response.content)
+                span.set_attribute("decision.value", decision)
                 return (decision, feedback)
 
             except ValueError as e:
-                if self.debug_mode:
-                    print(f"Validation error (attempt {attempts}/{max_retries}): {e}")
+                span.add_event("decision.invalid", attempt=attempts, error=str(e))
+                self._debug_event(
+                    "Validation Error",
+                    f"Attempt {attempts}/{max_retries}: {e}",
+                    "facilitator_decision",
+                    session.turn_id,
+                )
 
                 if attempts >= max_retries:
                     valid_values = [e.value for e in DecisionType]
@@ -259,8 +789,45 @@ class Framework:
 
                 continue
 
+    @staticmethod
+    def parse_decision(content: str) -> Tuple[int, str]:
+        """The decision and reasoning of a decision reply.
+
+        Raises ValueError when either is missing or the decision is not valid.
+        """
+        decision = None
+        feedback = ""
+        invalid_line = None
+        for line in content.split("\n"):
+            if line.startswith("DECISION:"):
+                try:
+                    decision = int(line.split(":")[1].strip())
+                except (ValueError, IndexError):
+                    invalid_line = line
+            elif line.startswith("REASONING:"):
+                feedback = line.replace("REASONING:", "", 1).strip()
+
+        if decision is None:
+            if invalid_line is not None:
+                raise ValueError(f"Invalid decision format: {invalid_line}")
+            raise ValueError("Decision not found in the response")
+        if not feedback:
+            raise ValueError("Reasoning not found in the response")
+        DecisionType(decision)
+        return decision, feedback
+
+    @classmethod
+    def _is_valid_decision(cls, content: str) -> bool:
+        try:
+            cls.parse_decision(content)
+        except ValueError:
+            return False
+        return True
+
+    @traced("coaching.positive")
     def generate_positive_coaching(
         self,
+        session: Session,
         parent_input,
         child_response=None,
         reasoning=None,
@@ -268,29 +835,19 @@ class Framework:
     ):
         prompt_inputs = {
             "parent_response": parent_input,
-            "child_response": self.conversation_trace.get_latest_child_message(),
+            "child_response": session.conversation_trace.get_latest_child_message(),
             # "child_response": child_response,
-            "interaction_history": self.conversation_trace.get_pretty_trace_full(
+            "interaction_history": session.conversation_trace.get_pretty_trace_full(
                 exclude_latest_child=True
             ),
             "scenario_description": self.config.get("scenario", "description"),
             "scenario_objectives": self.config.get("scenario", "objectives"),
-            "previous_coaching": self.conversation_trace.get_previous_coaching(),
+            "previous_coaching": session.conversation_trace.get_previous_coaching(),
             "reasoning": reasoning,
         }
 
-        if self.debug_mode:
-            constructed_prompt = (
-                self.facilitator_positive_reinforcement_system_prompt.format(
-                    **prompt_inputs
-                )
-            )
-            self._debug_print(
-                "Facilitator Positive Reinforcement Prompt", constructed_prompt
-            )
-
         facilitator_coaching_feedback = (
-            self.facilitator_positive_reinforcement_pipeline.invoke(prompt_inputs)
+            self._invoke(session, "facilitator_positive_reinforcement", prompt_inputs)
         )
         if facilitator_only_response:
             return (
@@ -300,14 +857,15 @@ class Framework:
             )
         return facilitator_coaching_feedback.content
 
+    @traced("coaching.help")
     def generate_negative_coaching(
-        self, parent_input, reasoning, facilitator_only_response=False
+        self, session: Session, parent_input, reasoning, facilitator_only_response=False
     ):
         prompt_inputs = {
             "parent_response": parent_input,
-            "child_response": self.conversation_trace.get_latest_child_message(),
+            "child_response": session.conversation_trace.get_latest_child_message(),
             # "child_response": child_response,
-            "interaction_history": self.conversation_trace.get_pretty_trace_full(
+            "interaction_history": session.conversation_trace.get_pretty_trace_full(
                 exclude_latest_child=True
             ),
             "scenario_description": self.config.get("scenario", "description"),
@@ -315,14 +873,8 @@ class Framework:
             "reasoning": reasoning,
         }
 
-        if self.debug_mode:
-            constructed_prompt = self.facilitator_help_system_prompt.format(
-                **prompt_inputs
-            )
-            self._debug_print("Facilitator Help Prompt", constructed_prompt)
-
-        facilitator_coaching_feedback = self.facilitator_help_pipeline.invoke(
-            prompt_inputs
+        facilitator_coaching_feedback = self._invoke(
+            session, "facilitator_help", prompt_inputs
         )
         if facilitator_only_response:
             return (
@@ -332,46 +884,93 @@ class Framework:
             )
         return facilitator_coaching_feedback.content
 
-    def generate_end_coaching(self, parent_input, reasoning):
+    @traced("coaching.end")
+    def generate_end_coaching(self, session: Session, parent_input, reasoning):
         """Generate coaching feedback when the conversation is ending."""
+        if self.budgets.daily_state() == BUDGET_HARD:
+            current_span().set_attribute("coaching.source", "budget")
+            return self.config.get(
+                "static_messages",
+                "budget_end_coaching",
+                default="The daily budget for coaching has been used up, so this "
+                "conversation ends here.",
+            )
+
         prompt_inputs = {
             "parent_response": parent_input,
-            "child_response": self.conversation_trace.get_latest_child_message(),
-            "interaction_history": self.conversation_trace.get_pretty_trace_full(
+            "child_response": session.conversation_trace.get_latest_child_message(),
+            "interaction_history": session.conversation_trace.get_pretty_trace_full(
                 exclude_latest_child=True
             ),
             "scenario_description": self.config.get("scenario", "description"),
             "scenario_objectives": self.config.get("scenario", "objectives"),
-            "previous_coaching": self.conversation_trace.get_previous_coaching(),
+            "previous_coaching": session.conversation_trace.get_previous_coaching(),
             "reasoning": reasoning,
         }
 
-        if self.debug_mode:
-            constructed_prompt = self.facilitator_end_coaching_system_prompt.format(
-                **prompt_inputs
-            )
-            self._debug_print("Facilitator End Coaching Prompt", constructed_prompt)
-
         # Use the pre-defined pipeline
-        facilitator_coaching_feedback = self.facilitator_end_coaching_pipeline.invoke(
-            prompt_inputs
+        facilitator_coaching_feedback = self._invoke(
+            session, "facilitator_end_coaching", prompt_inputs
         )
         return facilitator_coaching_feedback.content
 
-    def generate_summary(self, parent_feedback_positive, parent_feedback_negative):
+    @traced("summary")
+    def generate_summary(
+        self, session: Session, parent_feedback_positive, parent_feedback_negative
+    ):
+        if self.budgets.daily_state() == BUDGET_HARD:
+            current_span().set_attribute("summary.source", "budget")
+            return self.config.get(
+                "static_messages",
+                "budget_summary",
+                default="No summary was generated because the daily budget has been "
+                "used up.",
+            )
+
         prompt_inputs = {
-            "interaction_history": self.conversation_trace.get_pretty_trace_full(),
+            "interaction_history": session.conversation_trace.get_pretty_trace_full(),
             "scenario_description": self.config.get("scenario", "description"),
             "scenario_objectives": self.config.get("scenario", "objectives"),
             "parent_feedback_positive": parent_feedback_positive,
             "parent_feedback_negative": parent_feedback_negative,
         }
 
-        if self.debug_mode:
-            constructed_prompt = self.facilitator_summary_system_prompt.format(
-                **prompt_inputs
-            )
-            self._debug_print("Facilitator Summary Prompt", constructed_prompt)
-
-        facilitator_summary = self.facilitator_summary_pipeline.invoke(prompt_inputs)
+        facilitator_summary = self._invoke(session, "facilitator_summary", prompt_inputs)
         return facilitator_summary.content
+
+    @traced("judge")
+    def generate_judgement(
+        self, session: Session, interaction: str, text: str, context: str
+    ) -> Tuple[Optional[int], str]:
+        """Score one annotation CSV row with the judge prompt from the `judge` config section.
+
+        Returns the score (None if the judge gave no valid 1-5 score) and its comment.
+        """
+        if "judge" not in self.pipelines:
+            raise ValueError("No judge prompt configured. Add judge.prompt to the config.")
+
+        prompt_inputs = {
+            "interaction": interaction,
+            "text": text,
+            "context": context,
+            "scenario_description": self.config.get("scenario", "description"),
+            "scenario_objectives": self.config.get("scenario", "objectives"),
+        }
+
+        judgement = self._invoke(session, "judge", prompt_inputs).content
+        score = None
+        comment = ""
+        for line in judgement.split("\n"):
+            if line.startswith("SCORE:"):
+                try:
+                    score = int(line.split(":", 1)[1].strip())
+                except ValueError:
+                    score = None
+            elif line.startswith("COMMENT:"):
+                comment = line.replace("COMMENT:", "", 1).strip()
+
+        if score is not None and not 1 <= score <= 5:
+            score = None
+        if score is None and not comment:
+            comment = judgement.strip()
+        return score, comment
@@ -0,0 +1,438 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+import json
+import math
+import random
+import threading
+import time
+from rich.table import Table
+from src.framework import Framework
+from src.main import play_turn
+from src.session import Session
+from src.spans import (
+    STATUS_ERROR,
+    SpanTracer,
+    attribute_values,
+    payload_spans,
+    percentile,
+    set_span_tracer,
+    span_stats,
+)
+
+DEFAULT_SCRIPT = [
+    "Hi! How was your day at school?",
+    "That sounds great, well done for trying so hard.",
+    "Can you tell me more about what happened?",
+    "I'm really proud of how you handled that.",
+    "What would you like to do differently next time?",
+    "Thank you for telling me about it.",
+]
+
+DEFAULT_DECISION_WEIGHTS = {0: 2.0, 1: 3.0, 2: 2.0, 3: 2.0, 4: 1.0, 5: 0.5}
+
+
+class LatencyDistribution:
+    """A latency distribution parsed from a spec such as `lognormal:0.3,0.5`.
+
+    Supported specs are `fixed:<seconds>`, `uniform:<low>,<high>`,
+    `exponential:<mean>` and `lognormal:<median>,<sigma>`.
+    """
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, _, arguments = spec.partition(":")
+        self.kind = kind.strip().lower()
+        try:
+            self.arguments = [float(value) for value in arguments.split(",") if value]
+        except ValueError:
+            raise ValueError(f"Invalid latency distribution: {spec}")
+
+        expected = {"fixed": 1, "uniform": 2, "exponential": 1, "lognormal": 2}
+        if expected.get(self.kind) != len(self.arguments):
+            raise ValueError(
+                f"Invalid latency distribution: {spec}. Use fixed:<s>, "
+                "uniform:<low>,<high>, exponential:<mean> or lognormal:<median>,<sigma>"
+            )
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.arguments[0]
+        if self.kind == "uniform":
+            return rng.uniform(*self.arguments)
+        if self.kind == "exponential":
+            return rng.expovariate(1 / self.arguments[0])
+        median, sigma = self.arguments
+        return rng.lognormvariate(math.log(median), sigma)
+
+
+@dataclass
+class StubSettings:
+    """How the stub model server behaves"""
+
+    latency: LatencyDistribution
+    decision_latency: Optional[LatencyDistribution] = None
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    capacity: Optional[int] = None
+    decision_weights: Dict[int, float] = field(
+        default_factory=lambda: dict(DEFAULT_DECISION_WEIGHTS)
+    )
+    seed: Optional[int] = None
+
+
+class StubLLMServer:
+    """A local OpenAI-compatible chat completions endpoint for load tests.
+
+    Replies after a latency drawn from the configured distribution, fails a
+    share of requests with 500s or 429s, and answers decision prompts with a
+    decision drawn from `decision_weights`. With `capacity`, at most that many
+    requests are served at once and the rest queue, like a saturated provider.
+    """
+
+    def __init__(self, settings: StubSettings, host: str = "127.0.0.1", port: int = 0):
+        self.settings = settings
+        self._rng = random.Random(settings.seed)
+        self._rng_lock = threading.Lock()
+        self._capacity = (
+            threading.Semaphore(settings.capacity) if settings.capacity else None
+        )
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.queue_waits: List[float] = []
+        self.service_times: List[float] = []
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                status, headers, payload = server.respond(self.path, body)
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1/"
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="stub-llm-server", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _draw(self, function):
+        with self._rng_lock:
+            return function(self._rng)
+
+    def respond(self, path: str, body: dict):
+        if not path.rstrip("/").endswith("/chat/completions"):
+            return 404, {}, {"error": {"message": f"Unknown path {path}"}}
+
+        messages = body.get("messages") or []
+        prompt = "\n".join(str(message.get("content", "")) for message in messages)
+        is_decision = "DECISION: [" in prompt
+
+        queued = time.perf_counter()
+        if self._capacity is not None:
+            self._capacity.acquire()
+        started = time.perf_counter()
+        try:
+            distribution = (
+                self.settings.decision_latency if is_decision else None
+            ) or self.settings.latency
+            time.sleep(max(0.0, self._draw(distribution.sample)))
+            roll = self._draw(lambda rng: rng.random())
+        finally:
+            if self._capacity is not None:
+                self._capacity.release()
+
+        with self._stats_lock:
+            self.requests += 1
+            self.queue_waits.append(started - queued)
+            self.service_times.append(time.perf_counter() - started)
+
+        if roll < self.settings.rate_limit_rate:
+            with self._stats_lock:
+                self.rate_limited += 1
+            return (
+                429,
+                {"Retry-After": "0.1"},
+                {"error": {"message": "Rate limit exceeded", "type": "rate_limit"}},
+            )
+        if roll < self.settings.rate_limit_rate + self.settings.error_rate:
+            with self._stats_lock:
+                self.errors += 1
+            return 500, {}, {"error": {"message": "Stub error", "type": "server_error"}}
+
+        if is_decision:
+            decisions = list(self.settings.decision_weights)
+            weights = list(self.settings.decision_weights.values())
+            decision = self._draw(lambda rng: rng.choices(decisions, weights)[0])
+            content = (
+                f"DECISION: {decision}\n"
+                f"REASONING: Stub reasoning for decision {decision}."
+            )
+        else:
+            content = "This is a stub reply from the load test server."
+
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 4
+        return (
+            200,
+            {},
+            {
+                "id": f"stub-{time.time_ns()}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            },
+        )
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            queue_waits = list(self.queue_waits)
+            service_times = list(self.service_times)
+            stats = {
+                "requests": self.requests,
+                "errors": self.errors,
+                "rate_limited": self.rate_limited,
+            }
+        for name, values in [("queue", queue_waits), ("service", service_times)]:
+            for percent in [50, 95, 99]:
+                stats[f"{name}_p{percent}"] = (
+                    percentile(values, percent) if values else 0.0
+                )
+        return stats
+
+
+class MemorySpanExporter:
+    """Keeps exported spans in memory so the load test can summarise them"""
+
+    def __init__(self):
+        self.spans: List[dict] = []
+        self._lock = threading.Lock()
+
+    def export(self, payload: dict):
+        spans = payload_spans(payload)
+        with self._lock:
+            self.spans.extend(spans)
+
+
+class SilentUI:
+    """Discards everything a conversation would display"""
+
+    def __getattr__(self, name):
+        if name.startswith("display_"):
+            return lambda *args, **kwargs: None
+        raise AttributeError(name)
+
+
+@dataclass
+class LoadTestResult:
+    sessions: int
+    completed_sessions: int
+    turns: int
+    wall_seconds: float
+    errors: List[str]
+    spans: List[dict]
+    server: dict
+
+    @property
+    def throughput(self) -> float:
+        """Completed turns per second"""
+        return self.turns / self.wall_seconds if self.wall_seconds else 0.0
+
+    def stage_stats(self) -> Dict[str, dict]:
+        """Latency percentiles of every span name (turn, decision, child, ...)"""
+        return span_stats(self.spans)
+
+    def queueing(self) -> Dict[str, dict]:
+        """Per pipeline: model call latency and time spent waiting on the rate limiter"""
+        calls: Dict[str, List[float]] = {}
+        waits: Dict[str, List[float]] = {}
+        for span in self.spans:
+            if span["name"] != "llm":
+                continue
+            pipeline = attribute_values(span).get("llm.pipeline", "unknown")
+            calls.setdefault(pipeline, []).append(span["duration_seconds"])
+            waits.setdefault(pipeline, []).append(
+                sum(
+                    attribute_values(event).get("seconds", 0.0)
+                    for event in span.get("events", [])
+                    if event["name"] == "rate_limiter.wait"
+                )
+            )
+        return {
+            pipeline: {
+                "calls": len(durations),
+                "p50": percentile(durations, 50),
+                "p95": percentile(durations, 95),
+                "rate_limiter_wait_mean": sum(waits[pipeline]) / len(waits[pipeline]),
+                "rate_limiter_wait_p95": percentile(waits[pipeline], 95),
+            }
+            for pipeline, durations in sorted(calls.items())
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "sessions": self.sessions,
+            "completed_sessions": self.completed_sessions,
+            "turns": self.turns,
+            "wall_seconds": self.wall_seconds,
+            "throughput_turns_per_second": self.throughput,
+            "stages": self.stage_stats(),
+            "queueing": self.queueing(),
+            "server": self.server,
+            "errors": self.errors,
+        }
+
+    def to_tables(self) -> List[Table]:
+        stages = Table(title="Latency per stage (ms)")
+        stages.add_column("Stage")
+        for column in ["Count", "p50", "p95", "p99", "Max"]:
+            stages.add_column(column, justify="right")
+        for name, stat in self.stage_stats().items():
+            stages.add_row(
+                name,
+                str(stat["count"]),
+                *[f"{stat[key] * 1000:.1f}" for key in ["p50", "p95", "p99", "max"]],
+            )
+
+        queueing = Table(title="Model calls and rate limiter queueing per pipeline (ms)")
+        queueing.add_column("Pipeline")
+        for column in ["Calls", "Call p50", "Call p95", "Wait mean", "Wait p95"]:
+            queueing.add_column(column, justify="right")
+        for pipeline, stat in self.queueing().items():
+            queueing.add_row(
+                pipeline,
+                str(stat["calls"]),
+                f"{stat['p50'] * 1000:.1f}",
+                f"{stat['p95'] * 1000:.1f}",
+                f"{stat['rate_limiter_wait_mean'] * 1000:.1f}",
+                f"{stat['rate_limiter_wait_p95'] * 1000:.1f}",
+            )
+        return [stages, queueing]
+
+
+def run_session(
+    framework, script: List[str], retry_message: str, tracer: SpanTracer, think_time: float
+) -> None:
+    """Play one scripted session to its end, then generate its summary"""
+    session = Session()
+    ui = SilentUI()
+    for parent_input in script:
+        with tracer.span("turn", **{"turn.count": session.turn_count}):
+            ended = play_turn(framework, session, ui, parent_input, retry_message)
+        if ended:
+            break
+        if think_time:
+            time.sleep(think_time)
+    framework.generate_summary(session, "Load test", "Load test")
+
+
+def run_load_test(
+    config,
+    sessions: int,
+    settings: StubSettings,
+    script: Optional[List[str]] = None,
+    think_time: float = 0.0,
+    on_session=None,
+) -> LoadTestResult:
+    """Drive `sessions` concurrent scripted sessions against a local stub server.
+
+    Every model call goes through the normal Framework path (routing, rate
+    limiting, single-flight); only the provider endpoint is replaced.
+    """
+    server = StubLLMServer(settings)
+    server.start()
+
+    exporter = MemorySpanExporter()
+    tracer = SpanTracer(exporter, service_name="load-test")
+    set_span_tracer(tracer)
+
+    try:
+        # Stub usage must not count towards the real daily budget
+        # Only this framework's model clients talk to the stub; the process
+        # environment is left alone for any framework built afterwards
+        framework = Framework(
+            config=config,
+            track_daily_usage=False,
+            api_base=server.base_url,
+            api_key="load-test",
+        )
+        retry_message = config.get("static_messages", "retry_message")
+        script = script or DEFAULT_SCRIPT
+
+        completed = 0
+        errors = []
+        start = time.perf_counter()
+        with ThreadPoolExecutor(
+            max_workers=sessions, thread_name_prefix="load-session"
+        ) as executor:
+            futures = [
+                executor.submit(
+                    run_session, framework, script, retry_message, tracer, think_time
+                )
+                for _ in range(sessions)
+            ]
+            for future in futures:
+                try:
+                    future.result()
+                    completed += 1
+                except Exception as e:
+                    errors.append(f"{type(e).__name__}: {e}")
+                if on_session is not None:
+                    on_session()
+        wall_seconds = time.perf_counter() - start
+    finally:
+        tracer.shutdown()
+        server.stop()
+
+    return LoadTestResult(
+        sessions=sessions,
+        completed_sessions=completed,
+        turns=sum(
+            1
+            for span in exporter.spans
+            if span["name"] == "turn" and span["status"]["code"] != STATUS_ERROR
+        ),
+        wall_seconds=wall_seconds,
+        errors=errors,
+        spans=exporter.spans,
+        server=server.stats(),
+    )
@@ -1,23 +1,33 @@
 from rich.console import Console
 from rich.rule import Rule
 from rich.text import Text
+from contextlib import nullcontext
 import argparse
+import os
 import sys
 from src.config import Config, ConfigValidationError
 from src.framework import Framework
 from src.formatter import ConversationFormatter, ConversationStyles, ConversationUI
 from src.trace_csv_exporter import TraceExporter
+from src.post_conversation import PostConversationPipeline
+from src.protocol import JsonlUI
+from src.session import Session
+from src.profiler import SessionProfiler
+from src.spans import current_span
 from src.decision_types import DecisionType
+from src.experiment import Experiment
+from src.warmup import WarmUp
 import traceback
 
 console = Console()
 
 
 def log_conversation_interaction(
-    framework, parent_input, child_response, decision, decision_reasoning, coaching
+    framework, session, parent_input, child_response, decision, decision_reasoning, coaching
 ):
     """Log the interaction between parent and child with additional context"""
     framework.log_interaction(
+        session,
         parent=parent_input,
         child=child_response,
         decision=decision,
@@ -26,10 +36,156 @@ def log_conversation_interaction(
     )
 
 
-def run_conversation(framework, console: Console) -> None:
-    """Run the parenting simulation conversation loop"""
+def show_child_response(framework, session, ui, parent_input: str) -> str:
+    """Generate and display the child's reply, token by token when the UI streams"""
+    if getattr(ui, "streams", False):
+        return ui.stream_child_response(
+            framework.stream_child_response(session, parent_input)
+        )
+    child_response = framework.generate_child_response(session, parent_input)
+    ui.display_child_response(child_response)
+    return child_response
+
+
+def show_coaching(ui, generate, stream, *args, **kwargs) -> str:
+    """Generate and display a facilitator message with a generate_* method, or
+    its stream_* counterpart when the UI streams"""
+    if getattr(ui, "streams", False):
+        return ui.stream_facilitator_message(stream(*args, **kwargs))
+    coaching = generate(*args, **kwargs)
+    ui.display_facilitator_message(coaching)
+    return coaching
+
+
+def play_turn(framework, session, ui, parent_input: str, retry_message: str) -> bool:
+    """Decide, respond to and log one parent message.
+
+    Returns True when the facilitator ended the conversation.
+    """
+    with SessionProfiler.turn():
+        return _play_turn(framework, session, ui, parent_input, retry_message)
+
+
+def _play_turn(framework, session, ui, parent_input: str, retry_message: str) -> bool:
+    decision, decision_reasoning = framework.generate_decision(session, parent_input)
+    current_span().set_attribute("decision.value", decision)
+    ui.display_decision(decision, decision_reasoning)
+    coaching = None
+    child_response = None
+
+    ui.display_newline()
+
+    # TODO: Duplicate stuff here
+    match decision:
+        case DecisionType.CHILD_ONLY_NEUTRAL.value:
+            child_response = show_child_response(framework, session, ui, parent_input)
+
+        case DecisionType.CHILD_ONLY_POSITIVE.value:
+            child_response = show_child_response(framework, session, ui, parent_input)
+
+        # Coaching is shown above the child's reply, so it is generated first
+        # (it is written from the previous child message, not this reply)
+        case DecisionType.CHILD_AND_FACILITATOR_POSITIVE_REINFORCEMENT.value:
+            # Positive reinforcement is optional and is dropped while the
+            # coaching model is over its latency SLO
+            if not framework.should_skip_optional_coaching():
+                coaching = show_coaching(
+                    ui,
+                    framework.generate_positive_coaching,
+                    framework.stream_positive_coaching,
+                    session,
+                    parent_input,
+                    reasoning=decision_reasoning,
+                )
+            child_response = show_child_response(framework, session, ui, parent_input)
+
+        case DecisionType.CHILD_AND_FACILITATOR_HELP.value:
+            coaching = show_coaching(
+                ui,
+                framework.generate_positive_coaching,
+                framework.stream_positive_coaching,
+                session,
+                parent_input,
+                reasoning=decision_reasoning,
+            )
+            child_response = show_child_response(framework, session, ui, parent_input)
+
+        case DecisionType.FACILITATOR_ONLY_HELP.value:
+            if getattr(ui, "streams", False):
+                coaching = ui.stream_facilitator_message(
+                    framework.stream_negative_coaching(
+                        session, parent_input, decision_reasoning, facilitator_only_response=True
+                    )
+                )
+            else:
+                coaching = framework.generate_negative_coaching(
+                    session, parent_input, decision_reasoning, facilitator_only_response=True
+                )
+                # Only prepend the retry message if it's not already in the response
+                if retry_message and not coaching.lower().startswith(
+                    retry_message.lower()
+                ):
+                    coaching = f"{retry_message}\n\n{coaching}"
+                ui.display_facilitator_message(coaching)
+
+        case DecisionType.END_CONVERSATION.value:
+            # Generate end coaching before breaking the loop
+            end_coaching = show_coaching(
+                ui,
+                framework.generate_end_coaching,
+                framework.stream_end_coaching,
+                session,
+                parent_input,
+                decision_reasoning,
+            )
+            # Update the coaching variable to include it in the log
+            coaching = end_coaching
+            # Log interaction here with the end_coaching included
+            log_conversation_interaction(
+                framework,
+                session,
+                parent_input,
+                child_response,
+                decision,
+                decision_reasoning,
+                coaching,
+            )
+            return True
+
+    ui.display_newline()
+
+    # Only increment turn count if the message was not blocked
+    if decision != DecisionType.FACILITATOR_ONLY_HELP.value:
+        session.turn_count += 1
+
+    log_conversation_interaction(
+        framework,
+        session,
+        parent_input,
+        child_response,
+        decision,
+        decision_reasoning,
+        coaching,
+    )
+    return False
+
+
+def run_conversation(
+    framework, console: Console, ui=None, session=None, experiment=None
+) -> None:
+    """Run the parenting simulation conversation loop.
+
+    `ui` defaults to the Rich ConversationUI; pass a JsonlUI to drive the
+    conversation through the JSON lines protocol instead. A new Session is
+    started unless one is given. With an `experiment`, every turn is
+    recorded under the session's arm.
+    """
     config = framework.config
-    ui = ConversationUI(console)
+    if ui is None:
+        ui = ConversationUI(console)
+    # Its id names the trace files and the trace store session of this conversation
+    if session is None:
+        session = Session()
 
     # Get static messages from config - no defaults
     scenario_label = config.get("static_messages", "scenario")
@@ -57,7 +213,7 @@ def run_conversation(framework, console: Console) -> None:
         ui.display_conversation_initiator(
             config.get("scenario", "conversation_initiator")
         )
-        framework.conversation_trace.add_conversation_initiator(
+        session.conversation_trace.add_conversation_initiator(
             config.get("scenario", "conversation_initiator")
         )
 
@@ -66,16 +222,20 @@ def run_conversation(framework, console: Console) -> None:
 
         # Handle special commands
         if parent_input.lower() == "trace":
-            ui.display_trace(framework.conversation_trace.get_pretty_trace_full())
+            ui.display_trace(session.conversation_trace.get_pretty_trace_full())
+            continue
+
+        elif parent_input.lower() == "tokens":
+            ui.display_prompt_sizes(session.prompt_sizes)
             continue
 
         elif parent_input.lower() == "save":
-            trace_file = framework.conversation_trace.save_trace("full")
+            trace_file = session.conversation_trace.save_trace("full")
             ui.display_save_confirmation(trace_file)
             continue
 
         elif parent_input.lower() == "export":
-            exporter = TraceExporter(framework.conversation_trace)
+            exporter = TraceExporter(session.conversation_trace)
             csv_file = exporter.export_to_csv()
             ui.display_export_confirmation(csv_file)
             continue
@@ -85,111 +245,62 @@ def run_conversation(framework, console: Console) -> None:
             break
 
         # ----- Core conversation logic -----
-        decision, decision_reasoning = framework.generate_decision(parent_input)
-        coaching = None
-        child_response = None
-
-        ui.display_newline()
-
-        # TODO: Duplicate stuff here
-        match decision:
-            case DecisionType.CHILD_ONLY_NEUTRAL.value:
-                child_response = framework.generate_child_response(parent_input)
-                ui.display_child_response(child_response)
-
-            case DecisionType.CHILD_ONLY_POSITIVE.value:
-                child_response = framework.generate_child_response(parent_input)
-                ui.display_child_response(child_response)
-
-            case DecisionType.CHILD_AND_FACILITATOR_POSITIVE_REINFORCEMENT.value:
-                child_response = framework.generate_child_response(parent_input)
-                coaching = framework.generate_positive_coaching(
-                    parent_input, child_response, decision_reasoning
-                )
-                ui.display_facilitator_message(coaching)
-                ui.display_child_response(child_response)
-
-            case DecisionType.CHILD_AND_FACILITATOR_HELP.value:
-                child_response = framework.generate_child_response(parent_input)
-                coaching = framework.generate_positive_coaching(
-                    parent_input, child_response, decision_reasoning
-                )
-                ui.display_facilitator_message(coaching)
-                ui.display_child_response(child_response)
+        with framework.spans.span(
+            "turn", **{"turn.count": session.turn_count, "session.id": session.session_id}
+        ), (experiment.measure(session) if experiment is not None else nullcontext()):
+            conversation_ended = play_turn(
+                framework, session, ui, parent_input, retry_message
+            )
+        if conversation_ended:
+            break
 
-            case DecisionType.FACILITATOR_ONLY_HELP.value:
-                coaching = framework.generate_negative_coaching(
-                    parent_input, decision_reasoning, facilitator_only_response=True
-                )
-                # Only prepend the retry message if it's not already in the response
-                if retry_message and not coaching.lower().startswith(
-                    retry_message.lower()
-                ):
-                    coaching = f"{retry_message}\n\n{coaching}"
-                ui.display_facilitator_message(coaching)
+    ui.display_end_separator()
 
-            case DecisionType.END_CONVERSATION.value:
-                # Generate end coaching before breaking the loop
-                end_coaching = framework.generate_end_coaching(
-                    parent_input, decision_reasoning
-                )
-                # Update the coaching variable to include it in the log
-                coaching = end_coaching
-                ui.display_facilitator_message(end_coaching)
-                # Log interaction here with the end_coaching included
-                log_conversation_interaction(
-                    framework,
-                    parent_input,
-                    child_response,
-                    decision,
-                    decision_reasoning,
-                    coaching,
-                )
-                break
+    # Flush the trace in the background as soon as the loop ends, so nothing is
+    # lost while the parent answers the reflection questions
+    post_conversation = PostConversationPipeline(framework, session)
+    post_conversation.flush()
 
-        ui.display_newline()
+    try:
+        # Post-conversation feedback
+        ui.display_facilitator_question(positive_question)
+        parent_feedback_positive = ui.get_parent_input()
 
-        # Only increment turn count if the message was not blocked
-        if decision != DecisionType.FACILITATOR_ONLY_HELP.value:
-            framework.turn_count += 1
+        ui.display_facilitator_question(negative_question)
+        parent_feedback_negative = ui.get_parent_input()
 
-        log_conversation_interaction(
-            framework,
-            parent_input,
-            child_response,
-            decision,
-            decision_reasoning,
-            coaching,
+        # Store parent feedback in the conversation trace
+        session.conversation_trace.set_parent_feedback(
+            parent_feedback_positive, parent_feedback_negative
         )
 
-    ui.display_end_separator()
-
-    # Post-conversation feedback
-    ui.display_facilitator_question(positive_question)
-    parent_feedback_positive = ui.get_parent_input()
-
-    ui.display_facilitator_question(negative_question)
-    parent_feedback_negative = ui.get_parent_input()
+        summary_future = post_conversation.generate_summary(
+            parent_feedback_positive, parent_feedback_negative
+        )
 
-    # Store parent feedback in the conversation trace
-    framework.conversation_trace.set_parent_feedback(
-        parent_feedback_positive, parent_feedback_negative
-    )
+        summary = summary_future.result()
+        session.conversation_trace.set_summary(summary)
+        ui.display_summary_panel(summary)
 
-    # Generate and display summary
-    summary = framework.generate_summary(
-        parent_feedback_positive, parent_feedback_negative
-    )
-    framework.conversation_trace.set_summary(summary)
-    ui.display_summary_panel(summary)
+        # Export the final trace to both YAML and CSV formats concurrently
+        trace_future, csv_future = post_conversation.flush()
+    finally:
+        errors = post_conversation.shutdown()
 
-    # Export the trace to both YAML and CSV formats
-    trace_file = framework.conversation_trace.save_trace("full")
-    ui.display_save_confirmation(trace_file)
-
-    exporter = TraceExporter(framework.conversation_trace)
-    csv_file = exporter.export_to_csv()
-    ui.display_export_confirmation(csv_file)
+    for error in errors:
+        ui.display_error_message(
+            f"Saving the conversation failed: {type(error).__name__}: {error}"
+        )
+    if not trace_future.exception():
+        ui.display_save_confirmation(trace_future.result())
+    if not csv_future.exception():
+        ui.display_export_confirmation(csv_future.result())
+    store_future = post_conversation.store_future
+    if store_future is not None and not store_future.exception():
+        ui.display_system_message(
+            f"Trace stored in {post_conversation.trace_store.path} as session "
+            f"{store_future.result()}"
+        )
 
 
 def main() -> None:
@@ -208,12 +319,30 @@ def main() -> None:
         "--debug",
         "-d",
         action="store_true",
-        help="Enable debug mode to print all prompts",
+        help="Write every rendered prompt and raw model reply to the debug log",
+        default=False,
+    )
+    parser.add_argument(
+        "--protocol",
+        choices=["rich", "jsonl"],
+        help="'rich' renders the conversation in the terminal (default). 'jsonl' "
+        "reads parent messages as JSON lines on stdin and writes events as JSON "
+        "lines on stdout",
+        default="rich",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Profile the session and write pstats, collapsed stacks and per-turn "
+        "timings to the profiles folder",
         default=False,
     )
 
     args = parser.parse_args()
-    ui = ConversationUI(console)
+    if args.protocol == "jsonl":
+        ui = JsonlUI()
+    else:
+        ui = ConversationUI(console)
 
     try:
         if args.config:
@@ -222,7 +351,36 @@ def main() -> None:
             ui.display_system_message("No config file provided, using default config")
         config = Config(config_path=args.config)
         framework = Framework(config=config, debug_mode=args.debug)
-        run_conversation(framework, console)
+        session = Session()
+        # The session is played with the config of its arm when an experiment is running
+        experiment = Experiment.from_config(config, framework)
+        if experiment is not None:
+            framework = experiment.framework(session.session_id)
+        if args.debug:
+            ui.display_system_message(
+                f"Debug records are written to {framework.debug_log.path}"
+            )
+        # Open the provider connection while the header renders and the parent types
+        WarmUp.from_config(config.get()).start(framework)
+
+        if not args.profile:
+            run_conversation(framework, console, ui, session, experiment)
+            return
+
+        profiler = SessionProfiler()
+        profiler.start()
+        try:
+            run_conversation(framework, console, ui, session, experiment)
+        finally:
+            profile_files = profiler.stop()
+            summary_console = (
+                Console(stderr=True) if args.protocol == "jsonl" else console
+            )
+            profiler.print_summary(summary_console)
+            ui.display_system_message(
+                f"Profile saved to: {profiler.output_dir} "
+                f"({', '.join(os.path.basename(path) for path in profile_files.values())})"
+            )
     except FileNotFoundError as e:
         ui.display_error_message(str(e))
         sys.exit(1)
@@ -0,0 +1,135 @@
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Tuple
+import threading
+import time
+
+# Which routing role each Framework pipeline belongs to
+PIPELINE_ROLES = {
+    "child": "child",
+    "facilitator_decision": "decision",
+    "facilitator_positive_reinforcement": "coaching",
+    "facilitator_help": "coaching",
+    "facilitator_end_coaching": "coaching",
+    "facilitator_summary": "summary",
+    "judge": "judge",
+}
+
+ROLES = ["child", "decision", "coaching", "summary", "judge"]
+
+
+class LatencyMonitor:
+    """Rolling per-model latency samples from the last `window_seconds`"""
+
+    MAX_SAMPLES = 500
+
+    def __init__(self, window_seconds: float = 300.0):
+        self.window_seconds = window_seconds
+        self._samples: Dict[str, Deque[Tuple[float, float]]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, seconds: float):
+        with self._lock:
+            samples = self._samples.setdefault(
+                model, deque(maxlen=self.MAX_SAMPLES)
+            )
+            samples.append((time.monotonic(), seconds))
+
+    def _recent(self, model: str):
+        cutoff = time.monotonic() - self.window_seconds
+        samples = self._samples.get(model) or deque()
+        while samples and samples[0][0] < cutoff:
+            samples.popleft()
+        return [seconds for _, seconds in samples]
+
+    def percentile(self, model: str, percentile: float) -> Optional[float]:
+        with self._lock:
+            latencies = sorted(self._recent(model))
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(round(percentile / 100 * (len(latencies) - 1))))
+        return latencies[index]
+
+    def sample_count(self, model: str) -> int:
+        with self._lock:
+            return len(self._recent(model))
+
+
+class ModelRouter:
+    """Chooses the model for each pipeline call from the optional `routing` config section.
+
+    Each role (child, decision, coaching, summary) can name its own `model` and
+    `temperature`, and a smaller `fallback_model` that is used while the rolling
+    p95 latency of the role's model is above `latency_slo_seconds`. With
+    `skip_optional_coaching`, positive reinforcement coaching is dropped while
+    the coaching model is over the SLO.
+    """
+
+    MIN_SAMPLES = 5
+
+    def __init__(self, config_data: dict, llm_factory: Callable):
+        routing = config_data.get("routing") or {}
+        self.latency_slo_seconds = routing.get("latency_slo_seconds")
+        self.skip_optional_coaching_enabled = routing.get(
+            "skip_optional_coaching", False
+        )
+        self.monitor = get_latency_monitor(routing.get("window_seconds", 300))
+        self.llm_factory = llm_factory
+        self.role_settings = {role: routing.get(role) or {} for role in ROLES}
+
+        # Built by primary_llm, since a fallback defaults to its primary's temperature
+        self.fallbacks = {}
+
+    def primary_llm(self, role: str, default_llm):
+        """The configured model for a role, or `default_llm` when the role has no override.
+
+        Also builds the role's fallback model, if it has one.
+        """
+        settings = self.role_settings.get(role) or {}
+        llm = default_llm
+        if "model" in settings or "temperature" in settings:
+            llm = self.llm_factory(
+                settings.get("model", default_llm.model_name),
+                settings.get("temperature", default_llm.temperature),
+            )
+        if settings.get("fallback_model"):
+            self.fallbacks[role] = self.llm_factory(
+                settings["fallback_model"],
+                settings.get("fallback_temperature", llm.temperature),
+            )
+        return llm
+
+    def is_degraded(self, model: str) -> bool:
+        if self.latency_slo_seconds is None:
+            return False
+        if self.monitor.sample_count(model) < self.MIN_SAMPLES:
+            return False
+        return self.monitor.percentile(model, 95) > self.latency_slo_seconds
+
+    def route(self, pipeline_name: str, primary_llm, prefer_fallback: bool = False):
+        """The model to call for a pipeline: its primary, or the role's fallback while
+        degraded or when `prefer_fallback` asks for the cheaper model"""
+        fallback = self.fallbacks.get(PIPELINE_ROLES[pipeline_name])
+        if fallback is not None and (
+            prefer_fallback or self.is_degraded(primary_llm.model_name)
+        ):
+            return fallback
+        return primary_llm
+
+    def record_latency(self, model: str, seconds: float):
+        self.monitor.record(model, seconds)
+
+    def skip_optional_coaching(self, coaching_model: str) -> bool:
+        return self.skip_optional_coaching_enabled and self.is_degraded(coaching_model)
+
+
+_latency_monitor: Optional[LatencyMonitor] = None
+_latency_monitor_lock = threading.Lock()
+
+
+def get_latency_monitor(window_seconds: float = 300.0) -> LatencyMonitor:
+    """Return the latency monitor shared by every Framework in this process"""
+    global _latency_monitor
+    with _latency_monitor_lock:
+        if _latency_monitor is None:
+            _latency_monitor = LatencyMonitor(window_seconds)
+        return _latency_monitor
@@ -0,0 +1,156 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import yaml
+from src.decision_types import DecisionType
+from src.session import Session
+
+
+class OpeningPool:
+    """Precomputed first turns of a scenario, keyed by the parent's opening message.
+
+    Every session of a config starts from the same state, so the decision and
+    child response to a common opening message can be generated ahead of time.
+    Each opening keeps several samples and one is picked at random, so sessions
+    do not all see the same reply. Pools are stored per config fingerprint and
+    are ignored once the scenario, conditions, prompts or models change.
+    """
+
+    DEFAULT_DIRECTORY = "warm_cache"
+
+    def __init__(self, fingerprint: str, openings: Optional[Dict[str, List[dict]]] = None):
+        self.fingerprint = fingerprint
+        self.openings: Dict[str, List[dict]] = openings or {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def config_fingerprint(config_data: dict) -> str:
+        """Hash of everything in a config that can change a first turn"""
+        relevant = {
+            "models": config_data.get("models"),
+            # Per-role models replace the `models` ones for the child and decision
+            "routing": config_data.get("routing"),
+            "scenario": config_data.get("scenario"),
+            "conditions": config_data.get("conditions"),
+            "system_prompts": {
+                name: (config_data.get("system_prompts") or {}).get(name)
+                for name in ["child", "facilitator_decision"]
+            },
+        }
+        payload = json.dumps(relevant, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def normalize(message: str) -> str:
+        """Lower-case a message and drop the punctuation and spacing that do not change it"""
+        message = re.sub(r"\s+", " ", message.strip().lower())
+        return message.rstrip(".!?, ")
+
+    @classmethod
+    def path_for(cls, config_data: dict, directory: Optional[str] = None) -> str:
+        fingerprint = cls.config_fingerprint(config_data)
+        return os.path.join(directory or cls.DEFAULT_DIRECTORY, f"{fingerprint[:16]}.yaml")
+
+    @classmethod
+    def load(
+        cls, config_data: dict, directory: Optional[str] = None
+    ) -> Optional["OpeningPool"]:
+        """Load the pool built for this exact config, if there is one"""
+        path = cls.path_for(config_data, directory)
+        if not os.path.exists(path):
+            return None
+
+        with open(path, "r", encoding="utf-8") as f:
+            data = yaml.safe_load(f) or {}
+        fingerprint = cls.config_fingerprint(config_data)
+        if data.get("fingerprint") != fingerprint:
+            return None
+        return cls(fingerprint, data.get("openings"))
+
+    def save(self, config_data: dict, directory: Optional[str] = None) -> str:
+        path = self.path_for(config_data, directory)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            yaml.safe_dump(
+                {
+                    "scenario": (config_data.get("scenario") or {}).get("name"),
+                    "fingerprint": self.fingerprint,
+                    "openings": self.openings,
+                },
+                f,
+                sort_keys=False,
+                allow_unicode=True,
+                width=10000,
+            )
+        return path
+
+    def add(self, parent_message: str, sample: dict):
+        with self._lock:
+            self.openings.setdefault(self.normalize(parent_message), []).append(sample)
+
+    def lookup(self, parent_message: str) -> Optional[dict]:
+        """A random precomputed first turn for this opening message, or None"""
+        samples = self.openings.get(self.normalize(parent_message))
+        with self._lock:
+            if not samples:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return random.choice(samples)
+
+
+def common_openers(trace_files: List[str], top: int) -> List[str]:
+    """The most frequent first parent messages across saved traces"""
+    counts = Counter()
+    originals = {}
+    for trace_file in trace_files:
+        with open(trace_file, "r", encoding="utf-8") as f:
+            data = yaml.safe_load(f) or {}
+        entries = data.get("trace") or []
+        if not entries or not entries[0].get("parent"):
+            continue
+        opener = entries[0]["parent"]
+        key = OpeningPool.normalize(opener)
+        counts[key] += 1
+        originals.setdefault(key, opener)
+    return [originals[key] for key, _ in counts.most_common(top)]
+
+
+def generate_opening(framework, parent_message: str) -> dict:
+    """Generate one first turn from a fresh conversation state"""
+    session = Session(priority="batch")
+    initiator = framework.config.get("scenario", "conversation_initiator")
+    if initiator:
+        session.conversation_trace.add_conversation_initiator(initiator)
+
+    decision, reasoning = framework.generate_decision(session, parent_message)
+    child = None
+    if decision not in (
+        DecisionType.FACILITATOR_ONLY_HELP.value,
+        DecisionType.END_CONVERSATION.value,
+    ):
+        child = framework.generate_child_response(session, parent_message)
+    return {"decision": decision, "decision_reasoning": reasoning, "child": child}
+
+
+def build_opening_pool(
+    framework, openers: List[str], pool_size: int = 3, concurrency: int = 4
+) -> OpeningPool:
+    """Generate `pool_size` first turns for every opening message"""
+    pool = OpeningPool(OpeningPool.config_fingerprint(framework.config.get()))
+    jobs = [opener for opener in openers for _ in range(pool_size)]
+
+    def run(opener):
+        pool.add(opener, generate_opening(framework, opener))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(run, jobs))
+    return pool
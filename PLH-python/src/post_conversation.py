@@ -0,0 +1,100 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional, Tuple
+import contextvars
+from src.session import Session
+from src.trace_csv_exporter import TraceExporter
+from src.trace_store import get_trace_store
+
+
+class PostConversationPipeline:
+    """Runs trace persistence and summary generation off the UI thread.
+
+    YAML and CSV writes each go through their own single worker, so they run
+    concurrently with each other while later flushes of the same file always
+    land after earlier ones. The summary is generated on a third worker. When
+    the trace store is enabled, each flush also stores the session there.
+    Work runs in a copy of the caller's context, so its spans stay under the
+    caller's span, and every future is kept so `shutdown` can report errors.
+    """
+
+    def __init__(self, framework, session: Session):
+        self.framework = framework
+        self.session = session
+        self.conversation_trace = session.conversation_trace
+
+        self.session_id = session.session_id
+        self.scenario = framework.config.get("scenario", "name")
+        self.trace_filename = f"trace_{self.session_id}.yaml"
+        self.csv_filename = f"full_unfiltered_trace_{self.session_id}.csv"
+        self.trace_store = get_trace_store(framework.config.get())
+        self.store_future: Optional[Future] = None
+        self._futures: List[Future] = []
+
+        self._trace_writer = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="trace-yaml"
+        )
+        self._csv_writer = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="trace-csv"
+        )
+        self._summary_worker = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="summary"
+        )
+        self._store_writer = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="trace-store"
+        )
+
+    def flush(self) -> Tuple[Future, Future]:
+        """Write the trace in its current state to YAML and CSV in the background.
+
+        Returns:
+          Futures resolving to the YAML and CSV file paths.
+        """
+        trace_future = self._submit(
+            self._trace_writer,
+            self.conversation_trace.save_trace,
+            "full",
+            self.trace_filename,
+        )
+        csv_future = self._submit(
+            self._csv_writer,
+            TraceExporter(self.conversation_trace).export_to_csv,
+            self.csv_filename,
+        )
+        if self.trace_store is not None:
+            self.store_future = self._submit(
+                self._store_writer,
+                self.trace_store.save,
+                self.session_id,
+                self.conversation_trace,
+                self.scenario,
+            )
+        return trace_future, csv_future
+
+    def generate_summary(
+        self, parent_feedback_positive: str, parent_feedback_negative: str
+    ) -> Future:
+        """Start generating the conversation summary. Returns a future of the text."""
+        return self._submit(
+            self._summary_worker,
+            self.framework.generate_summary,
+            self.session,
+            parent_feedback_positive,
+            parent_feedback_negative,
+        )
+
+    def _submit(self, executor: ThreadPoolExecutor, function, *args) -> Future:
+        future = executor.submit(contextvars.copy_context().run, function, *args)
+        self._futures.append(future)
+        return future
+
+    def shutdown(self) -> List[Exception]:
+        """Wait for every pending write and release the workers.
+
+        Returns the errors raised by any write or the summary, including
+        those of earlier flushes nobody waited on.
+        """
+        self._summary_worker.shutdown(wait=True)
+        self._trace_writer.shutdown(wait=True)
+        self._csv_writer.shutdown(wait=True)
+        self._store_writer.shutdown(wait=True)
+        return [future.exception() for future in self._futures if future.exception()]
@@ -0,0 +1,174 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import csv
+import os
+from src.session import Session
+
+SCORE_COLUMN = "Judge Score (1-5)"
+COMMENT_COLUMN = "Judge Comment"
+FLAG_PREFIX = "FLAG: "
+ERROR_PREFIX = "Judge error: "
+
+# Rows of the annotation CSV the judge scores
+JUDGED_INTERACTIONS = ["Facilitator", "Reasoning"]
+
+
+@dataclass
+class PrescoreRow:
+    index: int
+    interaction: str
+    text: str
+    context: str
+
+
+@dataclass
+class PrescoreSummary:
+    output_path: str
+    scored: int = 0
+    resumed: int = 0
+    flagged: int = 0
+    errors: int = 0
+
+
+def prescored_path(input_path: str) -> str:
+    base, extension = os.path.splitext(input_path)
+    return f"{base}_prescored{extension or '.csv'}"
+
+
+def read_rows(path: str) -> Tuple[List[str], List[List[str]]]:
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    if not rows:
+        return [], []
+    return rows[0], rows[1:]
+
+
+def turn_context(rows: List[List[str]], index: int) -> str:
+    """The other rows of the same turn, so the judge sees what the row responds to"""
+    turn = rows[index][0]
+    if turn == "":
+        return ""
+    return "\n".join(
+        f"{row[1]}: {row[2]}"
+        for position, row in enumerate(rows)
+        if position != index and len(row) > 2 and row[0] == turn
+    )
+
+
+def judged_rows(rows: List[List[str]]) -> List[PrescoreRow]:
+    return [
+        PrescoreRow(
+            index=index,
+            interaction=row[1],
+            text=row[2],
+            context=turn_context(rows, index),
+        )
+        for index, row in enumerate(rows)
+        if len(row) > 2 and row[1] in JUDGED_INTERACTIONS and row[2].strip()
+    ]
+
+
+def previous_scores(path: str) -> Dict[Tuple[int, str], Tuple[str, str]]:
+    """Scores already written to an earlier (possibly interrupted) output file"""
+    if not os.path.exists(path):
+        return {}
+    header, rows = read_rows(path)
+    if SCORE_COLUMN not in header or COMMENT_COLUMN not in header:
+        return {}
+    score_index = header.index(SCORE_COLUMN)
+    comment_index = header.index(COMMENT_COLUMN)
+    return {
+        (index, row[2]): (row[score_index], row[comment_index])
+        for index, row in enumerate(rows)
+        if len(row) > comment_index and (row[score_index] or row[comment_index])
+    }
+
+
+def write_rows(path: str, header: List[str], rows: List[List[str]]):
+    """Write to a temporary file first, so an interrupted run never leaves half a CSV"""
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    os.replace(temporary_path, path)
+
+
+def prescore_file(
+    framework,
+    input_path: str,
+    output_path: Optional[str] = None,
+    concurrency: int = 8,
+    batch_size: int = 50,
+    flag_below: int = 3,
+    resume: bool = True,
+    on_row=None,
+) -> PrescoreSummary:
+    """Score the Facilitator and Reasoning rows of an annotation CSV with the judge.
+
+    Writes a copy of the CSV with a judge score and comment column pair.
+    Rows scored at or below `flag_below`, or that the judge could not score,
+    get comments starting with `FLAG: ` so experts can review just those.
+    The output is rewritten after every batch, and with `resume` rows already
+    scored in an existing output file are kept rather than sent again.
+    """
+    output_path = output_path or prescored_path(input_path)
+    summary = PrescoreSummary(output_path=output_path)
+
+    header, rows = read_rows(input_path)
+    if SCORE_COLUMN in header:
+        score_index = header.index(SCORE_COLUMN)
+        comment_index = header.index(COMMENT_COLUMN)
+    else:
+        header = header + [SCORE_COLUMN, COMMENT_COLUMN]
+        score_index, comment_index = len(header) - 2, len(header) - 1
+    rows = [row + [""] * (len(header) - len(row)) for row in rows]
+
+    done = previous_scores(output_path) if resume else {}
+    pending = []
+    for row in judged_rows(rows):
+        previous = done.get((row.index, row.text))
+        # Rows the judge failed on last time are sent again
+        failed = previous is not None and previous[1].startswith(FLAG_PREFIX + ERROR_PREFIX)
+        if previous is not None and not failed:
+            rows[row.index][score_index], rows[row.index][comment_index] = previous
+            summary.resumed += 1
+            if previous[1].startswith(FLAG_PREFIX):
+                summary.flagged += 1
+        else:
+            pending.append(row)
+
+    def score(row: PrescoreRow):
+        try:
+            # Every row is judged on its own, with the file's share of batch capacity
+            session = Session(session_id=os.path.basename(input_path), priority="batch")
+            judgement = framework.generate_judgement(
+                session, row.interaction, row.text, row.context
+            )
+            return row, judgement, None
+        except Exception as e:
+            return row, (None, ""), str(e)
+
+    with ThreadPoolExecutor(
+        max_workers=concurrency, thread_name_prefix="judge"
+    ) as executor:
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            for row, (value, comment), error in executor.map(score, batch):
+                if error is not None:
+                    summary.errors += 1
+                    comment = ERROR_PREFIX + error
+                if value is None or value <= flag_below:
+                    comment = FLAG_PREFIX + comment
+                    summary.flagged += 1
+                rows[row.index][score_index] = "" if value is None else str(value)
+                rows[row.index][comment_index] = comment
+                summary.scored += 1
+                if on_row is not None:
+                    on_row()
+            write_rows(output_path, header, rows)
+
+    if not pending:
+        write_rows(output_path, header, rows)
+    return summary
@@ -0,0 +1,320 @@
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+import contextvars
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+import yaml
+from rich.table import Table
+
+# Where time is spent, by the path of the file a function lives in
+CATEGORIES = [
+    ("langchain", ["langchain"]),
+    ("rich", [f"{os.sep}rich{os.sep}"]),
+    ("conversation_tracer", [f"src{os.sep}conversation_tracer.py"]),
+    ("framework", [f"src{os.sep}"]),
+    ("network", ["httpx", "httpcore", "ssl.py", "socket.py", "openai", "h11", "h2"]),
+    ("yaml", [f"{os.sep}yaml{os.sep}"]),
+]
+
+
+@dataclass
+class TurnTiming:
+    turn: int
+    wall_seconds: float
+    cpu_seconds: float
+    model_seconds: float
+
+    @property
+    def other_seconds(self) -> float:
+        return max(0.0, self.wall_seconds - self.cpu_seconds - self.model_seconds)
+
+
+class StackSampler(threading.Thread):
+    """Samples the stacks of every thread and counts them in collapsed-stack form"""
+
+    def __init__(self, interval: float = 0.005):
+        super().__init__(name="stack-sampler", daemon=True)
+        self.interval = interval
+        self.stacks = Counter()
+        # CPU time of the sampler itself, left out of the profiled CPU time
+        self.cpu_seconds = 0.0
+        self._stop_event = threading.Event()
+
+    @staticmethod
+    def frame_label(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop_event.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(self.frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(labels))] += 1
+            self.cpu_seconds = time.thread_time()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class _TurnClock:
+    """Model time, and CPU time of helper threads, of the turn running in the current context"""
+
+    def __init__(self):
+        self.model_seconds = 0.0
+        self.helper_cpu_seconds = 0.0
+
+
+_turn_clock: contextvars.ContextVar[Optional[_TurnClock]] = contextvars.ContextVar(
+    "turn_clock", default=None
+)
+
+
+class SessionProfiler:
+    """Profiles a conversation or batch run.
+
+    Runs cProfile on the calling thread and a stack sampler over all threads.
+    Turns played on other threads, such as the workers of a batch run, get a
+    cProfile of their own for the length of the turn, merged into the session
+    profile on `stop`. Every turn's time is split into CPU (of the thread
+    playing it and of helper threads such as a streamed reply's), awaiting the model (requests made by the turn itself) and
+    the rest. `stop` writes `session.pstats`, `session.collapsed` (for flame
+    graph tools such as flamegraph.pl or speedscope) and `turns.yaml`.
+    """
+
+    active: Optional["SessionProfiler"] = None
+    _model_seconds = 0.0
+    _model_lock = threading.Lock()
+
+    def __init__(
+        self,
+        output_dir: Optional[str] = None,
+        sample_interval: float = 0.005,
+        top: int = 20,
+    ):
+        if output_dir is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            output_dir = os.path.join("profiles", timestamp)
+        self.output_dir = output_dir
+        self.top = top
+        self.turns: List[TurnTiming] = []
+        self._profile = cProfile.Profile()
+        self._thread_profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+        self._sampler = StackSampler(sample_interval)
+        self._stats: Optional[pstats.Stats] = None
+
+    def start(self):
+        SessionProfiler.active = self
+        self._thread_id = threading.get_ident()
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self._start_model = self.model_seconds()
+        self._sampler.start()
+        self._profile.enable()
+
+    def stop(self) -> dict:
+        """Stop profiling and write the output files. Returns their paths."""
+        self._profile.disable()
+        self._sampler.stop()
+        SessionProfiler.active = None
+        self.wall_seconds = time.perf_counter() - self._start_wall
+        self.cpu_seconds = (
+            time.process_time() - self._start_cpu - self._sampler.cpu_seconds
+        )
+        self.total_model_seconds = self.model_seconds() - self._start_model
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        paths = {
+            "pstats": os.path.join(self.output_dir, "session.pstats"),
+            "collapsed": os.path.join(self.output_dir, "session.collapsed"),
+            "turns": os.path.join(self.output_dir, "turns.yaml"),
+        }
+        self._stats = pstats.Stats(self._profile)
+        with self._lock:
+            for profile in self._thread_profiles:
+                self._stats.add(profile)
+        self._stats.dump_stats(paths["pstats"])
+
+        with open(paths["collapsed"], "w", encoding="utf-8") as f:
+            for stack, count in self._sampler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        with open(paths["turns"], "w", encoding="utf-8") as f:
+            yaml.safe_dump(
+                {
+                    "wall_seconds": self.wall_seconds,
+                    "cpu_seconds": self.cpu_seconds,
+                    "model_seconds": self.total_model_seconds,
+                    "turns": [
+                        {
+                            "turn": timing.turn,
+                            "wall_seconds": timing.wall_seconds,
+                            "cpu_seconds": timing.cpu_seconds,
+                            "model_seconds": timing.model_seconds,
+                            "other_seconds": timing.other_seconds,
+                        }
+                        for timing in self.turns
+                    ],
+                    "categories": self.category_seconds(),
+                },
+                f,
+                sort_keys=False,
+            )
+        return paths
+
+    @classmethod
+    def model_seconds(cls) -> float:
+        with cls._model_lock:
+            return cls._model_seconds
+
+    @classmethod
+    def record_model_wait(cls, seconds: float):
+        """Called by Framework for every model request, whether or not profiling is on"""
+        with cls._model_lock:
+            cls._model_seconds += seconds
+        clock = _turn_clock.get()
+        if clock is not None:
+            clock.model_seconds += seconds
+
+    @classmethod
+    @contextmanager
+    def turn(cls):
+        """Time (and, off the profiled thread, profile) one turn when a profiler is active"""
+        profiler = cls.active
+        if profiler is None or _turn_clock.get() is not None:
+            yield
+            return
+
+        profile = None
+        if threading.get_ident() != profiler._thread_id:
+            profile = cProfile.Profile()
+        turn_clock = _TurnClock()
+        clock = _turn_clock.set(turn_clock)
+        start_wall = time.perf_counter()
+        start_cpu = time.thread_time()
+        if profile is not None:
+            try:
+                profile.enable()
+            except ValueError:
+                # Python 3.12+ profiles every thread from the session profile
+                # and refuses a second one
+                profile = None
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            cpu_seconds = time.thread_time() - start_cpu
+            wall_seconds = time.perf_counter() - start_wall
+            _turn_clock.reset(clock)
+            with profiler._lock:
+                if profile is not None:
+                    profiler._thread_profiles.append(profile)
+                profiler.turns.append(
+                    TurnTiming(
+                        turn=len(profiler.turns) + 1,
+                        wall_seconds=wall_seconds,
+                        cpu_seconds=cpu_seconds + turn_clock.helper_cpu_seconds,
+                        model_seconds=turn_clock.model_seconds,
+                    )
+                )
+
+    @classmethod
+    @contextmanager
+    def helper_thread(cls):
+        """Profile work a turn hands to another thread, run in a copy of the turn's context"""
+        profiler = cls.active
+        turn_clock = _turn_clock.get()
+        if profiler is None or turn_clock is None:
+            yield
+            return
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            profile = None
+        start_cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            with profiler._lock:
+                turn_clock.helper_cpu_seconds += time.thread_time() - start_cpu
+                if profile is not None:
+                    profiler._thread_profiles.append(profile)
+
+    def category_seconds(self) -> dict:
+        """Own time (tottime) of the profiled threads, grouped by library"""
+        totals = Counter()
+        for (filename, _, _), (_, _, tottime, _, _) in self._stats.stats.items():
+            for category, patterns in CATEGORIES:
+                if any(pattern in filename for pattern in patterns):
+                    totals[category] += tottime
+                    break
+            else:
+                totals["other"] += tottime
+        return {category: round(seconds, 4) for category, seconds in totals.most_common()}
+
+    def print_summary(self, console):
+        """Print the per-turn split, time per library and the hottest functions"""
+        turns_table = Table(title="Time per turn (seconds)")
+        for column in ["Turn", "Wall", "CPU", "Awaiting model", "Other"]:
+            turns_table.add_column(column, justify="right")
+        for timing in self.turns:
+            turns_table.add_row(
+                str(timing.turn),
+                f"{timing.wall_seconds:.3f}",
+                f"{timing.cpu_seconds:.3f}",
+                f"{timing.model_seconds:.3f}",
+                f"{timing.other_seconds:.3f}",
+            )
+        turns_table.add_row(
+            "[bold]Session[/bold]",
+            f"{self.wall_seconds:.3f}",
+            f"{self.cpu_seconds:.3f}",
+            f"{self.total_model_seconds:.3f}",
+            "",
+        )
+        console.print(turns_table)
+
+        categories_table = Table(title="Own CPU time by library (profiled threads)")
+        categories_table.add_column("Library")
+        categories_table.add_column("Seconds", justify="right")
+        for category, seconds in self.category_seconds().items():
+            categories_table.add_row(category, f"{seconds:.3f}")
+        console.print(categories_table)
+
+        hot_table = Table(title=f"Top {self.top} functions by own time")
+        for column in ["Function", "Calls", "Own", "Cumulative"]:
+            hot_table.add_column(column, justify="right" if column != "Function" else "left")
+        rows = sorted(
+            self._stats.stats.items(), key=lambda item: item[1][2], reverse=True
+        )[: self.top]
+        for (filename, line, name), (_, calls, tottime, cumtime, _) in rows:
+            hot_table.add_row(
+                f"{name} ({os.path.basename(filename)}:{line})",
+                str(calls),
+                f"{tottime:.4f}",
+                f"{cumtime:.4f}",
+            )
+        console.print(hot_table)
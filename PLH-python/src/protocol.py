@@ -0,0 +1,143 @@
+from typing import Optional, TextIO
+import json
+import sys
+
+
+class JsonlUI:
+    """Drop-in replacement for ConversationUI that speaks JSON lines instead of rendering.
+
+    Parent messages are read from `input_stream`, one per line, either as a
+    JSON object with a `text` field or as a JSON string. Everything the Rich UI
+    would display is written to `output_stream` as one JSON event per line and
+    flushed immediately, so another process can drive the simulation.
+
+    Child and coaching replies are streamed as `child_delta` and
+    `coaching_delta` events carrying the new text, followed by the usual
+    `child` or `coaching` event with the complete text.
+    """
+
+    streams = True
+
+    def __init__(
+        self, input_stream: Optional[TextIO] = None, output_stream: Optional[TextIO] = None
+    ):
+        self.input_stream = input_stream or sys.stdin
+        self.output_stream = output_stream or sys.stdout
+        self.parent_label = None
+        self.child_label = None
+        self.facilitator_label = None
+        self.scenario_label = None
+        self.summary_label = None
+
+    def emit(self, event: str, **fields):
+        """Write one event and flush it straight away"""
+        record = {"event": event}
+        record.update(fields)
+        self.output_stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.output_stream.flush()
+
+    def set_labels(self, parent=None, child=None, facilitator=None, scenario=None, summary=None):
+        self.parent_label = parent
+        self.child_label = child
+        self.facilitator_label = facilitator
+        self.scenario_label = scenario
+        self.summary_label = summary
+
+    def display_header(self, scenario_name, scenario_description):
+        self.emit("scenario", name=scenario_name, description=scenario_description)
+
+    def display_conversation_initiator(self, message):
+        self.emit("child", text=message, initiator=True)
+
+    def display_decision(self, decision, reasoning):
+        self.emit("decision", decision=decision, reasoning=reasoning)
+
+    def display_trace(self, trace):
+        self.emit("trace", text=trace)
+
+    def display_prompt_sizes(self, prompt_sizes):
+        self.emit(
+            "prompt_sizes",
+            prompts=[
+                {
+                    "pipeline": prompt_size.pipeline,
+                    "total": prompt_size.total,
+                    "sections": prompt_size.sections,
+                }
+                for prompt_size in prompt_sizes
+            ],
+        )
+
+    def display_save_confirmation(self, file_path):
+        self.emit("saved", path=file_path)
+
+    def display_export_confirmation(self, file_path):
+        self.emit("exported", path=file_path)
+
+    def display_system_message(self, message):
+        self.emit("system", text=message)
+
+    def display_exit_message(self):
+        self.emit("exit")
+
+    def display_error_message(self, message):
+        self.emit("error", text=message)
+
+    def display_child_response(self, message):
+        self.emit("child", text=message)
+
+    def display_facilitator_message(self, message):
+        self.emit("coaching", text=message)
+
+    def _emit_streaming(self, tokens, event: str) -> str:
+        text = ""
+        for token in tokens:
+            text += token
+            self.emit(f"{event}_delta", text=token)
+        return text
+
+    def stream_child_response(self, tokens):
+        message = self._emit_streaming(tokens, "child")
+        self.display_child_response(message)
+        return message
+
+    def stream_facilitator_message(self, tokens):
+        message = self._emit_streaming(tokens, "coaching")
+        self.display_facilitator_message(message)
+        return message
+
+    def display_end_separator(self):
+        self.emit("conversation_ended")
+
+    def display_summary_panel(self, summary):
+        self.emit("summary", text=summary)
+
+    def display_facilitator_question(self, question):
+        self.emit("question", text=question)
+
+    def display_newline(self):
+        pass
+
+    def get_parent_input(self):
+        """Read the next parent message. End of input is treated as `exit`."""
+        self.emit("awaiting_input")
+        while True:
+            line = self.input_stream.readline()
+            if not line:
+                self.emit("input_closed")
+                return "exit"
+            if not line.strip():
+                continue
+
+            try:
+                message = json.loads(line)
+            except json.JSONDecodeError as e:
+                self.emit("error", text=f"Invalid JSON input: {e}")
+                continue
+
+            if isinstance(message, dict):
+                message = message.get("text")
+            if not isinstance(message, str):
+                self.emit("error", text="Input must be a JSON string or an object with a 'text' field")
+                continue
+            return message
@@ -0,0 +1,198 @@
+from dataclasses import dataclass
+from typing import Dict, Optional
+import threading
+import time
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """True if a provider error is an HTTP 429 / rate limit response"""
+    if getattr(error, "status_code", None) == 429:
+        return True
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) == 429:
+        return True
+    return type(error).__name__ == "RateLimitError"
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """The Retry-After header of a rate limit error, if the provider sent one"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """A token bucket that hands out reservations instead of blocking.
+
+    `reserve` always takes the tokens, letting the balance go negative, and
+    returns how long the caller must wait before its reservation is covered.
+    Callers are therefore served in arrival order and never starve.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: float, now: float, rate_factor: float = 1.0) -> float:
+        rate = self.rate * rate_factor
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / rate
+
+
+@dataclass
+class ModelLimiter:
+    """Request and token buckets for one model, plus its adaptive state"""
+
+    requests: Optional[TokenBucket] = None
+    tokens: Optional[TokenBucket] = None
+    rate_factor: float = 1.0
+    paused_until: float = 0.0
+    consecutive_rate_limits: int = 0
+    # Running totals of the waits handed out, kept bounded for a process-wide limiter
+    reservations: int = 0
+    waited: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+    rate_limited: int = 0
+
+
+class RateLimiter:
+    """Process-wide limiter for requests per second and tokens per minute.
+
+    Every model gets its own buckets. When the provider answers with a 429, the
+    model's rate is halved and new requests are paused (for Retry-After, or an
+    exponential backoff); each successful call then restores a little of the rate.
+    """
+
+    MIN_RATE_FACTOR = 0.1
+    RECOVERY_STEP = 0.05
+    BASE_BACKOFF_SECONDS = 1.0
+    MAX_BACKOFF_SECONDS = 60.0
+
+    def __init__(
+        self,
+        requests_per_second: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        model_limits: Optional[Dict[str, dict]] = None,
+        max_retries: int = 5,
+    ):
+        self.requests_per_second = requests_per_second
+        self.tokens_per_minute = tokens_per_minute
+        self.model_limits = model_limits or {}
+        self.max_retries = max_retries
+        self._models: Dict[str, ModelLimiter] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config_data: dict) -> "RateLimiter":
+        limits = config_data.get("rate_limits") or {}
+        return cls(
+            requests_per_second=limits.get("requests_per_second"),
+            tokens_per_minute=limits.get("tokens_per_minute"),
+            model_limits=limits.get("models"),
+            max_retries=limits.get("max_retries", 5),
+        )
+
+    def _model(self, model: str) -> ModelLimiter:
+        limiter = self._models.get(model)
+        if limiter is None:
+            limits = self.model_limits.get(model) or {}
+            rps = limits.get("requests_per_second", self.requests_per_second)
+            tpm = limits.get("tokens_per_minute", self.tokens_per_minute)
+            limiter = ModelLimiter(
+                requests=TokenBucket(rps, max(1.0, rps)) if rps else None,
+                tokens=TokenBucket(tpm / 60.0, tpm) if tpm else None,
+            )
+            self._models[model] = limiter
+        return limiter
+
+    def _reserve(self, model: str, tokens: int) -> float:
+        """Take a slot for one request and return how long to wait before sending it"""
+        with self._lock:
+            limiter = self._model(model)
+            now = time.monotonic()
+            wait = max(0.0, limiter.paused_until - now)
+            if limiter.requests is not None:
+                wait = max(wait, limiter.requests.reserve(1, now, limiter.rate_factor))
+            if limiter.tokens is not None:
+                wait = max(
+                    wait, limiter.tokens.reserve(tokens, now, limiter.rate_factor)
+                )
+            limiter.reservations += 1
+            if wait > 0:
+                limiter.waited += 1
+                limiter.total_wait += wait
+                limiter.max_wait = max(limiter.max_wait, wait)
+            return wait
+
+    def acquire(self, model: str, tokens: int = 0) -> float:
+        """Block until a request of `tokens` tokens may be sent. Returns the time waited."""
+        wait = self._reserve(model, tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def record_success(self, model: str):
+        with self._lock:
+            limiter = self._model(model)
+            limiter.consecutive_rate_limits = 0
+            limiter.rate_factor = min(1.0, limiter.rate_factor + self.RECOVERY_STEP)
+
+    def record_rate_limited(self, model: str, retry_after: Optional[float] = None):
+        """Slow a model down after the provider answered with a 429"""
+        with self._lock:
+            limiter = self._model(model)
+            limiter.rate_limited += 1
+            limiter.consecutive_rate_limits += 1
+            limiter.rate_factor = max(
+                self.MIN_RATE_FACTOR, limiter.rate_factor / 2
+            )
+            if retry_after is None:
+                retry_after = min(
+                    self.MAX_BACKOFF_SECONDS,
+                    self.BASE_BACKOFF_SECONDS
+                    * 2 ** (limiter.consecutive_rate_limits - 1),
+                )
+            limiter.paused_until = max(
+                limiter.paused_until, time.monotonic() + retry_after
+            )
+
+    def stats(self) -> Dict[str, dict]:
+        """Queue wait and 429 counts per model"""
+        with self._lock:
+            return {
+                model: {
+                    "requests": limiter.reservations,
+                    "waited": limiter.waited,
+                    "total_wait": limiter.total_wait,
+                    "max_wait": limiter.max_wait,
+                    "rate_limited": limiter.rate_limited,
+                    "rate_factor": limiter.rate_factor,
+                }
+                for model, limiter in self._models.items()
+            }
+
+
+_rate_limiter: Optional[RateLimiter] = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter(config_data: Optional[dict] = None) -> RateLimiter:
+    """Return the limiter shared by every Framework in this process.
+
+    The first call configures it from the `rate_limits` config section.
+    """
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter.from_config(config_data or {})
+        return _rate_limiter
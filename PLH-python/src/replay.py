@@ -0,0 +1,184 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import glob
+import os
+import yaml
+from rich.table import Table
+from src.conversation_tracer import ConversationTracer
+from src.decision_types import DecisionType
+from src.profiler import SessionProfiler
+from src.session import Session
+
+
+@dataclass
+class ReplayTurn:
+    """A recorded parent turn together with the conversation state it was decided in"""
+
+    trace_file: str
+    turn_index: int
+    parent: str
+    expected_decision: int
+    conversation_trace: ConversationTracer
+    turn_count: int
+    recorded_reasoning: Optional[str] = None
+
+
+@dataclass
+class ReplayResult:
+    turn: ReplayTurn
+    decision: Optional[int] = None
+    reasoning: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def agrees(self) -> bool:
+        return self.error is None and self.decision == self.turn.expected_decision
+
+
+def find_trace_files(paths: List[str]) -> List[str]:
+    """Expand directories and glob patterns into a sorted list of trace files"""
+    trace_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            trace_files.extend(glob.glob(os.path.join(path, "*.yaml")))
+        else:
+            trace_files.extend(glob.glob(path) or [path])
+    return sorted(set(trace_files))
+
+
+def load_replay_turns(trace_files: List[str]) -> List[ReplayTurn]:
+    """Rebuild, for every recorded parent turn, the state the decision was made in.
+
+    The turn count follows `run_conversation`: it only advances for turns that
+    were not blocked by FACILITATOR_ONLY_HELP.
+    """
+    turns = []
+    for trace_file in trace_files:
+        with open(trace_file, "r", encoding="utf-8") as f:
+            data = yaml.safe_load(f) or {}
+
+        entries = data.get("trace") or []
+        # Every turn's state is a checkpoint sharing the recorded entries
+        recorded = ConversationTracer.from_dict(
+            {"conversation_initiator": data.get("conversation_initiator"), "trace": entries}
+        )
+        turn_count = 1
+        for index, entry in enumerate(entries):
+            if entry.get("parent") is None or entry.get("decision") is None:
+                continue
+
+            prefix = recorded.checkpoint(index)
+            turns.append(
+                ReplayTurn(
+                    trace_file=trace_file,
+                    turn_index=index,
+                    parent=entry["parent"],
+                    expected_decision=entry["decision"],
+                    conversation_trace=prefix,
+                    turn_count=turn_count,
+                    recorded_reasoning=entry.get("decision_reasoning"),
+                )
+            )
+
+            if entry["decision"] != DecisionType.FACILITATOR_ONLY_HELP.value:
+                turn_count += 1
+    return turns
+
+
+def replay_turn(framework, turn: ReplayTurn) -> ReplayResult:
+    # Each recorded conversation gets a fair share of the batch capacity
+    session = Session(
+        session_id=turn.trace_file,
+        conversation_trace=turn.conversation_trace,
+        turn_count=turn.turn_count,
+        priority="batch",
+    )
+    try:
+        with SessionProfiler.turn():
+            decision, reasoning = framework.generate_decision(session, turn.parent)
+    except Exception as e:
+        return ReplayResult(turn=turn, error=str(e))
+    return ReplayResult(turn=turn, decision=decision, reasoning=reasoning)
+
+
+def run_replay(
+    framework, turns: List[ReplayTurn], concurrency: int = 8, on_result=None
+) -> List[ReplayResult]:
+    """Re-decide every turn with the given framework, at most `concurrency` at a time.
+
+    With a batch backend on the framework, the turns are sent as one batch instead.
+    """
+    if framework.batch_backend is not None:
+        futures = framework.batch_backend.run(
+            [lambda turn=turn: replay_turn(framework, turn) for turn in turns],
+            on_result=None if on_result is None else lambda done: on_result(done.result()),
+        )
+        return [future.result() for future in futures]
+
+    results = []
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for result in executor.map(lambda turn: replay_turn(framework, turn), turns):
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+    return results
+
+
+class AgreementMatrix:
+    """Counts of recorded decision (rows) against replayed decision (columns)"""
+
+    def __init__(self, results: List[ReplayResult]):
+        self.decisions = [decision.value for decision in DecisionType]
+        self.counts: Dict[int, Dict[int, int]] = {
+            expected: {actual: 0 for actual in self.decisions}
+            for expected in self.decisions
+        }
+        self.errors = 0
+        self.total = len(results)
+
+        for result in results:
+            if result.error is not None or result.decision not in self.decisions:
+                self.errors += 1
+                continue
+            if result.turn.expected_decision in self.counts:
+                self.counts[result.turn.expected_decision][result.decision] += 1
+
+    @property
+    def agreement(self) -> float:
+        agreed = sum(self.counts[decision][decision] for decision in self.decisions)
+        return agreed / self.total if self.total else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "total": self.total,
+            "errors": self.errors,
+            "agreement": self.agreement,
+            "matrix": {
+                DecisionType(expected).name: {
+                    DecisionType(actual).name: count
+                    for actual, count in row.items()
+                }
+                for expected, row in self.counts.items()
+            },
+        }
+
+    def to_table(self) -> Table:
+        table = Table(title="Decision agreement (rows: recorded, columns: replayed)")
+        table.add_column("Recorded")
+        for decision in self.decisions:
+            table.add_column(str(decision), justify="right")
+        table.add_column("Total", justify="right")
+
+        for expected in self.decisions:
+            row = self.counts[expected]
+            cells = [
+                f"[bold]{count}[/bold]" if actual == expected else str(count)
+                for actual, count in row.items()
+            ]
+            table.add_row(
+                f"{expected} - {DecisionType(expected).name}",
+                *cells,
+                str(sum(row.values())),
+            )
+        return table
@@ -0,0 +1,70 @@
+from typing import List, Optional
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+
+class ResponseCache:
+    """On-disk cache of model responses keyed by model, temperature and rendered prompt.
+
+    Used by offline jobs such as replay, where the same prompt is sent again
+    whenever the part of the config it depends on has not changed.
+    """
+
+    DEFAULT_PATH = os.path.join("cache", "responses.sqlite")
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or self.DEFAULT_PATH
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, temperature REAL, content TEXT)"
+        )
+        self._connection.commit()
+
+    @staticmethod
+    def make_key(model: str, temperature: float, messages: List) -> str:
+        payload = json.dumps(
+            {
+                "model": model,
+                "temperature": temperature,
+                "messages": [[message.type, message.content] for message in messages],
+            },
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, model: str, temperature: float, messages: List) -> Optional[str]:
+        key = self.make_key(model, temperature, messages)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT content FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, model: str, temperature: float, messages: List, content: str):
+        key = self.make_key(model, temperature, messages)
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, model, temperature, content) "
+                "VALUES (?, ?, ?, ?)",
+                (key, model, temperature, content),
+            )
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,278 @@
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import heapq
+import itertools
+import threading
+import time
+
+# Priority classes, most urgent first
+PRIORITY_CLASSES = ["interactive", "summary", "batch"]
+
+# How often a call past its deadline looks again for batch work to preempt
+PREEMPT_RETRY_SECONDS = 0.05
+
+# Sessions whose fair-queuing finish tags are kept per class while it is busy
+MAX_TRACKED_SESSIONS = 4096
+
+
+@dataclass(order=True)
+class Ticket:
+    """One model call waiting for, or holding, a scheduler slot"""
+
+    finish_tag: float
+    sequence: int
+    start_tag: float = field(compare=False)
+    priority: str = field(compare=False)
+    session_id: str = field(compare=False)
+    deadline: Optional[float] = field(compare=False, default=None)
+    enqueued_at: float = field(compare=False, default_factory=time.monotonic)
+    granted: threading.Event = field(compare=False, default_factory=threading.Event)
+    started: bool = field(compare=False, default=False)
+    preempted: bool = field(compare=False, default=False)
+
+
+class Scheduler:
+    """Admits model calls by priority class, fairly across sessions.
+
+    Classes are served in strict priority order (interactive, then summary,
+    then batch), each with an optional concurrency limit, under an optional
+    overall limit. Within a class, sessions share slots by weighted fair
+    queuing on prompt tokens, so one long batch job cannot crowd out others.
+
+    An interactive or summary call still queued after its class's
+    `max_wait_seconds` preempts batch work: the most recent batch call that
+    has not been sent yet gives up its slot to it and queues again. While
+    every running batch call has already been sent, the late call keeps
+    waiting for a free slot. Without a `scheduler` config section no limits
+    apply.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        classes: Optional[Dict[str, dict]] = None,
+        session_weights: Optional[Dict[str, float]] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        classes = classes or {}
+        self.class_settings = {name: classes.get(name) or {} for name in PRIORITY_CLASSES}
+        self.session_weights = session_weights or {}
+        self.enabled = max_concurrency is not None or any(
+            settings.get("max_concurrency") is not None
+            for settings in self.class_settings.values()
+        )
+
+        self._waiting: Dict[str, List[Ticket]] = {name: [] for name in PRIORITY_CLASSES}
+        self._running: Dict[str, List[Ticket]] = {name: [] for name in PRIORITY_CLASSES}
+        self._virtual_time = {name: 0.0 for name in PRIORITY_CLASSES}
+        self._last_finish: Dict[str, Dict[str, float]] = {
+            name: {} for name in PRIORITY_CLASSES
+        }
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+        self.waits: Dict[str, List[float]] = {name: [] for name in PRIORITY_CLASSES}
+        self.preemptions = 0
+
+    @classmethod
+    def from_config(cls, config_data: dict) -> "Scheduler":
+        settings = config_data.get("scheduler") or {}
+        return cls(
+            max_concurrency=settings.get("max_concurrency"),
+            classes=settings.get("classes"),
+            session_weights=settings.get("session_weights"),
+        )
+
+    def _total_running(self) -> int:
+        return sum(len(tickets) for tickets in self._running.values())
+
+    def _has_capacity(self, priority: str) -> bool:
+        limit = self.class_settings[priority].get("max_concurrency")
+        if limit is not None and len(self._running[priority]) >= limit:
+            return False
+        return self.max_concurrency is None or self._total_running() < self.max_concurrency
+
+    def _grant(self, ticket: Ticket):
+        self._virtual_time[ticket.priority] = max(
+            self._virtual_time[ticket.priority], ticket.start_tag
+        )
+        self._running[ticket.priority].append(ticket)
+        ticket.granted.set()
+
+    def _dispatch(self):
+        for priority in PRIORITY_CLASSES:
+            queue = self._waiting[priority]
+            while queue and self._has_capacity(priority):
+                self._grant(heapq.heappop(queue))
+            # Lower classes must not take the slots this class is waiting for
+            if queue and not (
+                self.max_concurrency is None
+                or self._total_running() < self.max_concurrency
+            ):
+                break
+
+    def _preempt_for(self, ticket: Ticket):
+        """Admit a call past its deadline by taking the slot of a batch call not sent yet"""
+        if ticket.priority == "batch":
+            ticket.deadline = None
+            return
+
+        limit = self.class_settings[ticket.priority].get("max_concurrency")
+        not_sent = [
+            batch_ticket for batch_ticket in self._running["batch"] if not batch_ticket.started
+        ]
+        if not not_sent or (limit is not None and len(self._running[ticket.priority]) >= limit):
+            # Nothing to take a slot from; wait for one to free up and look again
+            ticket.deadline = time.monotonic() + PREEMPT_RETRY_SECONDS
+            return
+
+        ticket.deadline = None
+        victim = not_sent[-1]
+        victim.preempted = True
+        self._running["batch"].remove(victim)
+        queue = self._waiting[ticket.priority]
+        queue.remove(ticket)
+        heapq.heapify(queue)
+        self._grant(ticket)
+        self.preemptions += 1
+
+    def _prune_finish_tags(self, priority: str):
+        """Keep the finish tags of at most MAX_TRACKED_SESSIONS sessions of a class.
+
+        Tags the virtual time has passed go first, as such a session's next
+        call would start at the virtual time anyway; then those of the idle
+        sessions furthest behind, which only lose a little of their debt.
+        """
+        last_finish = self._last_finish[priority]
+        if len(last_finish) <= MAX_TRACKED_SESSIONS:
+            return
+        virtual_time = self._virtual_time[priority]
+        active = {
+            ticket.session_id
+            for ticket in self._waiting[priority] + self._running[priority]
+        }
+        idle = sorted(
+            (finish_tag, session_id)
+            for session_id, finish_tag in last_finish.items()
+            if session_id not in active
+        )
+        excess = len(last_finish) - MAX_TRACKED_SESSIONS // 2
+        for finish_tag, session_id in idle:
+            if excess <= 0 and finish_tag > virtual_time:
+                break
+            del last_finish[session_id]
+            excess -= 1
+
+    def acquire(
+        self, priority: str, session_id: Optional[str] = None, cost: float = 1.0
+    ) -> Ticket:
+        """Block until a call of the given class may start. Returns its ticket."""
+        session_id = session_id or "default"
+        now = time.monotonic()
+        if not self.enabled:
+            ticket = Ticket(0.0, 0, 0.0, priority, session_id)
+            ticket.granted.set()
+            return ticket
+
+        max_wait = self.class_settings[priority].get("max_wait_seconds")
+        with self._lock:
+            weight = self.session_weights.get(session_id, 1.0)
+            start_tag = max(
+                self._virtual_time[priority],
+                self._last_finish[priority].get(session_id, 0.0),
+            )
+            finish_tag = start_tag + max(cost, 1.0) / weight
+            self._last_finish[priority][session_id] = finish_tag
+            self._prune_finish_tags(priority)
+            ticket = Ticket(
+                finish_tag=finish_tag,
+                sequence=next(self._sequence),
+                start_tag=start_tag,
+                priority=priority,
+                session_id=session_id,
+                deadline=None if max_wait is None else now + max_wait,
+                enqueued_at=now,
+            )
+            heapq.heappush(self._waiting[priority], ticket)
+            self._dispatch()
+
+        while not ticket.granted.wait(
+            None if ticket.deadline is None else max(0.0, ticket.deadline - time.monotonic())
+        ):
+            with self._lock:
+                if not ticket.granted.is_set():
+                    self._preempt_for(ticket)
+
+        with self._lock:
+            waits = self.waits[priority]
+            waits.append(time.monotonic() - ticket.enqueued_at)
+            if len(waits) > 1000:
+                del waits[:-1000]
+        return ticket
+
+    def start(self, ticket: Ticket) -> bool:
+        """Mark a call as sent. False if it was preempted and must queue again."""
+        with self._lock:
+            if ticket.preempted:
+                return False
+            ticket.started = True
+            return True
+
+    def release(self, ticket: Ticket):
+        if not self.enabled:
+            return
+        with self._lock:
+            # A preempted call already gave its slot away
+            if not ticket.preempted:
+                self._running[ticket.priority].remove(ticket)
+            if not self._running[ticket.priority] and not self._waiting[ticket.priority]:
+                # An idle class starts afresh: every session is even again
+                last_finish = self._last_finish[ticket.priority]
+                if last_finish:
+                    self._virtual_time[ticket.priority] = max(
+                        self._virtual_time[ticket.priority], max(last_finish.values())
+                    )
+                    last_finish.clear()
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, priority: str, session_id: Optional[str] = None, cost: float = 1.0):
+        """Hold a slot for the duration of the block"""
+        ticket = self.acquire(priority, session_id, cost)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> Dict[str, dict]:
+        """Queue length, running calls and wait times per class"""
+        with self._lock:
+            stats = {}
+            for priority in PRIORITY_CLASSES:
+                waits = sorted(self.waits[priority])
+                stats[priority] = {
+                    "waiting": len(self._waiting[priority]),
+                    "running": len(self._running[priority]),
+                    "calls": len(waits),
+                    "mean_wait": sum(waits) / len(waits) if waits else 0.0,
+                    "p95_wait": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+                }
+            stats["preemptions"] = self.preemptions
+            return stats
+
+
+_scheduler: Optional[Scheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler(config_data: Optional[dict] = None) -> Scheduler:
+    """Return the scheduler shared by every Framework in this process.
+
+    The first call configures it from the `scheduler` config section.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler.from_config(config_data or {})
+        return _scheduler
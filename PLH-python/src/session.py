@@ -0,0 +1,60 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import re
+from src.conversation_tracer import ConversationTracer, new_session_id
+from src.token_counter import PromptSize
+
+# Session ids name spill and trace files, so they are kept to safe file name characters
+SESSION_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+def is_valid_session_id(session_id) -> bool:
+    return isinstance(session_id, str) and SESSION_ID_PATTERN.fullmatch(session_id) is not None
+
+
+@dataclass
+class Session:
+    """The state of one conversation.
+
+    A Framework only holds what every conversation shares (models, prompts,
+    caches, limits) and takes the session to work on as the first argument of
+    each generate_* call, so one Framework serves any number of concurrent
+    sessions and creating a session costs next to nothing.
+    """
+
+    session_id: str = field(default_factory=new_session_id)
+    conversation_trace: ConversationTracer = field(default_factory=ConversationTracer)
+    turn_count: int = 1
+    # Scheduler class of the session's model calls: "interactive" or "batch"
+    priority: str = "interactive"
+    # Precomputed first turn picked by generate_decision, served by generate_child_response
+    opening: Optional[dict] = None
+    # Model used by each pipeline in the current turn, stored with the turn
+    turn_models: Dict[str, str] = field(default_factory=dict)
+    # Size of every prompt sent for this session, shown by the `tokens` command
+    prompt_sizes: List[PromptSize] = field(default_factory=list)
+
+    @property
+    def turn_id(self) -> str:
+        """Names the turn in progress: the session id and the trace entry it will log"""
+        return f"{self.session_id}:{len(self.conversation_trace.get_full_trace()) + 1}"
+
+    def fork(self, turn: int) -> "Session":
+        """Branch a new session off this one, just before its `turn`-th trace entry (from 1).
+
+        The branch shares the earlier entries with this session through a
+        ConversationTracer checkpoint, so only its own turns cost model calls,
+        and since every branch renders the same earlier conversation, repeated
+        calls are answered by the response cache.
+        """
+        entries = len(self.conversation_trace.get_full_trace())
+        if not 1 <= turn <= entries + 1:
+            raise ValueError(f"Turn must be between 1 and {entries + 1}, got {turn}")
+        conversation_trace = self.conversation_trace.checkpoint(turn - 1)
+        conversation_trace.forked_from = {"session_id": self.session_id, "turn": turn}
+        return Session(
+            conversation_trace=conversation_trace,
+            # Blocked turns do not advance the turn count
+            turn_count=1 + len(conversation_trace.get_filtered_trace()),
+            priority=self.priority,
+        )
@@ -0,0 +1,228 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+import os
+import threading
+import time
+import yaml
+from src.conversation_tracer import ConversationTracer
+from src.session import Session, is_valid_session_id
+from src.spans import traced
+from src.trace_store import get_trace_store
+
+
+@dataclass
+class SessionMetrics:
+    """Counters describing how well the resident session set is working"""
+
+    hits: int = 0
+    misses: int = 0
+    created: int = 0
+    spills: int = 0
+    restores: int = 0
+    expirations: int = 0
+    total_restore_latency: float = 0.0
+    max_restore_latency: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    @property
+    def mean_restore_latency(self) -> float:
+        return self.total_restore_latency / self.restores if self.restores else 0.0
+
+    def record_restore(self, latency: float):
+        self.restores += 1
+        self.total_restore_latency += latency
+        self.max_restore_latency = max(self.max_restore_latency, latency)
+
+    def to_dict(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "created": self.created,
+            "spills": self.spills,
+            "restores": self.restores,
+            "expirations": self.expirations,
+            "mean_restore_latency": self.mean_restore_latency,
+            "max_restore_latency": self.max_restore_latency,
+        }
+
+
+class SessionManager:
+    """Keeps a bounded number of conversations in memory.
+
+    Resident sessions are kept in least-recently-used order. When more than
+    `max_resident` sessions are open, the least recently used one is spilled
+    to `spill_dir` as YAML and faulted back in on its next message. Sessions
+    idle for longer than `idle_ttl_seconds` are finalised with `save_trace`.
+    """
+
+    DEFAULT_MAX_RESIDENT = 100
+    DEFAULT_IDLE_TTL_SECONDS = 1800
+    DEFAULT_SPILL_DIR = "sessions"
+
+    def __init__(
+        self,
+        session_factory: Callable,
+        config=None,
+        max_resident: Optional[int] = None,
+        idle_ttl_seconds: Optional[float] = None,
+        spill_dir: Optional[str] = None,
+    ):
+        def setting(name, value, default):
+            if value is not None:
+                return value
+            if config is not None:
+                return config.get("sessions", name, default=default)
+            return default
+
+        self.session_factory = session_factory
+        self.config = config
+        self.max_resident = setting(
+            "max_resident", max_resident, self.DEFAULT_MAX_RESIDENT
+        )
+        self.idle_ttl_seconds = setting(
+            "idle_ttl_seconds", idle_ttl_seconds, self.DEFAULT_IDLE_TTL_SECONDS
+        )
+        self.spill_dir = setting("spill_dir", spill_dir, self.DEFAULT_SPILL_DIR)
+
+        if self.max_resident < 1:
+            raise ValueError("max_resident must be at least 1")
+
+        self.metrics = SessionMetrics()
+        self._resident: "OrderedDict[str, Session]" = OrderedDict()
+        self._last_active: Dict[str, float] = {}
+        self._spilled: Dict[str, float] = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _check_session_id(session_id: str):
+        if not is_valid_session_id(session_id):
+            raise ValueError(
+                "Session ids must be 1 to 64 letters, digits, underscores or hyphens"
+            )
+
+    def get(self, session_id: str):
+        """Return the Session for a session id, restoring or creating it if needed"""
+        self._check_session_id(session_id)
+        with self._lock:
+            self._last_active[session_id] = time.monotonic()
+
+            if session_id in self._resident:
+                self.metrics.hits += 1
+                self._resident.move_to_end(session_id)
+                return self._resident[session_id]
+
+            self.metrics.misses += 1
+            if session_id in self._spilled:
+                session = self._restore(session_id)
+            else:
+                session = self.session_factory()
+                session.session_id = session_id
+                self.metrics.created += 1
+
+            self._resident[session_id] = session
+            self._evict_overflow()
+            return session
+
+    def close(self, session_id: str) -> Optional[str]:
+        """Finalise a session: save its trace and forget it. Returns the trace path."""
+        self._check_session_id(session_id)
+        with self._lock:
+            session = self._take(session_id)
+            if session is None:
+                return None
+            return self._finalise(session_id, session)
+
+    def expire_idle(self, now: Optional[float] = None) -> List[str]:
+        """Finalise every session idle for longer than the TTL. Returns the trace paths."""
+        if now is None:
+            now = time.monotonic()
+
+        saved = []
+        with self._lock:
+            expired = [
+                session_id
+                for session_id, last_active in self._last_active.items()
+                if now - last_active > self.idle_ttl_seconds
+            ]
+            for session_id in expired:
+                trace_file = self.close(session_id)
+                if trace_file:
+                    saved.append(trace_file)
+                self.metrics.expirations += 1
+        return saved
+
+    def resident_sessions(self) -> List[str]:
+        with self._lock:
+            return list(self._resident.keys())
+
+    def spilled_sessions(self) -> List[str]:
+        with self._lock:
+            return list(self._spilled.keys())
+
+    def _evict_overflow(self):
+        while len(self._resident) > self.max_resident:
+            session_id, session = self._resident.popitem(last=False)
+            self._spill(session_id, session)
+
+    def _spill_path(self, session_id: str) -> str:
+        return os.path.join(self.spill_dir, f"{session_id}.yaml")
+
+    @traced("session.spill")
+    def _spill(self, session_id: str, session: Session):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        data = {
+            "session_id": session_id,
+            "turn_count": session.turn_count,
+            "conversation_trace": session.conversation_trace.to_dict("full"),
+        }
+        with open(self._spill_path(session_id), "w", encoding="utf-8") as f:
+            yaml.safe_dump(data, f, sort_keys=False, width=10000)
+        self._spilled[session_id] = time.monotonic()
+        self.metrics.spills += 1
+
+    @traced("session.restore")
+    def _restore(self, session_id: str):
+        start = time.perf_counter()
+        path = self._spill_path(session_id)
+        with open(path, "r", encoding="utf-8") as f:
+            data = yaml.safe_load(f)
+
+        session = self.session_factory()
+        session.conversation_trace = ConversationTracer.from_dict(
+            data["conversation_trace"]
+        )
+        session.turn_count = data["turn_count"]
+        session.session_id = session_id
+
+        os.remove(path)
+        del self._spilled[session_id]
+        self.metrics.record_restore(time.perf_counter() - start)
+        return session
+
+    def _take(self, session_id: str):
+        """Remove a session from the manager, restoring it first if it was spilled"""
+        self._last_active.pop(session_id, None)
+        if session_id in self._resident:
+            return self._resident.pop(session_id)
+        if session_id in self._spilled:
+            return self._restore(session_id)
+        return None
+
+    def _finalise(self, session_id: str, session: Session) -> str:
+        trace_store = get_trace_store(self.config.get()) if self.config is not None else None
+        if trace_store is not None:
+            trace_store.save(
+                session_id,
+                session.conversation_trace,
+                self.config.get("scenario", "name"),
+            )
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
+        return session.conversation_trace.save_trace(
+            "full", filename=f"trace_{timestamp}_{session_id}.yaml"
+        )
@@ -0,0 +1,428 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Set
+import atexit
+import functools
+import json
+import os
+import secrets
+import threading
+import time
+import urllib.request
+
+DEFAULT_SPANS_PATH = os.path.join("spans", "spans.jsonl")
+DEFAULT_COLLECTOR_ENDPOINT = "http://localhost:4318/v1/traces"
+
+# OTLP status codes
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+def otlp_value(value) -> dict:
+    """An attribute value in OTLP JSON form"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # OTLP JSON encodes 64-bit integers as strings
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_attributes(attributes: dict) -> List[dict]:
+    return [
+        {"key": key, "value": otlp_value(value)}
+        for key, value in attributes.items()
+        if value is not None
+    ]
+
+
+@dataclass
+class Span:
+    """A timed operation. Spans of one turn share a trace id and form a tree."""
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: Optional[str] = None
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: Optional[int] = None
+    attributes: Dict[str, object] = field(default_factory=dict)
+    events: List[dict] = field(default_factory=list)
+    status_code: int = STATUS_UNSET
+    status_message: str = ""
+
+    @property
+    def duration_seconds(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes):
+        self.events.append(
+            {"name": name, "time_ns": time.time_ns(), "attributes": attributes}
+        )
+
+    def record_error(self, error: BaseException):
+        self.status_code = STATUS_ERROR
+        self.status_message = str(error)
+        self.add_event(
+            "exception",
+            **{"exception.type": type(error).__name__, "exception.message": str(error)},
+        )
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": otlp_attributes(self.attributes),
+            "events": [
+                {
+                    "timeUnixNano": str(event["time_ns"]),
+                    "name": event["name"],
+                    "attributes": otlp_attributes(event["attributes"]),
+                }
+                for event in self.events
+            ],
+            "status": {"code": self.status_code},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        return span
+
+
+class _NoopSpan:
+    """Stands in for a span while tracing is disabled"""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def add_event(self, name, **attributes):
+        pass
+
+    def record_error(self, error):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def otlp_payload(spans: List[Span], service_name: str) -> dict:
+    """An OTLP/JSON ExportTraceServiceRequest holding the given spans"""
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": otlp_attributes({"service.name": service_name})
+                },
+                "scopeSpans": [
+                    {
+                        "scope": {"name": "src.spans"},
+                        "spans": [span.to_otlp() for span in spans],
+                    }
+                ],
+            }
+        ]
+    }
+
+
+class FileSpanExporter:
+    """Appends one OTLP/JSON export request per line, like the collector's file exporter"""
+
+    def __init__(self, path: str = DEFAULT_SPANS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, payload: dict):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        line = json.dumps(payload, ensure_ascii=False) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+class HttpSpanExporter:
+    """Posts OTLP/JSON to a collector's /v1/traces endpoint.
+
+    Export failures are counted and otherwise ignored, so an unreachable
+    collector never interrupts a conversation.
+    """
+
+    def __init__(self, endpoint: str = DEFAULT_COLLECTOR_ENDPOINT, timeout: float = 5.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.failures = 0
+
+    def export(self, payload: dict):
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+        except OSError:
+            self.failures += 1
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class SpanTracer:
+    """Records nested spans and hands each finished turn to an exporter.
+
+    The current span is tracked per thread (and per asyncio task) with a
+    context variable, so nested `span` blocks form a tree without passing
+    spans around. Spans are buffered until the root span of their trace ends,
+    then the whole tree is exported on a background worker. A span that ends
+    after its root, such as background work started by a turn, is exported
+    on its own; collectors join it to the rest of the trace by its trace id.
+    """
+
+    def __init__(self, exporter=None, service_name: str = "parenting-simulation"):
+        self.exporter = exporter
+        self.service_name = service_name
+        self._pending: Dict[str, List[Span]] = {}
+        # Traces whose root span is still open
+        self._open_traces: Set[str] = set()
+        self._lock = threading.Lock()
+        self._export_worker = None
+        if exporter is not None:
+            self._export_worker = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="span-export"
+            )
+
+    @classmethod
+    def from_config(cls, config_data: dict) -> "SpanTracer":
+        """Build a tracer from the optional `tracing` config section. Disabled by default."""
+        settings = config_data.get("tracing") or {}
+        if not settings.get("enabled"):
+            return cls()
+
+        if settings.get("exporter", "file") == "http":
+            exporter = HttpSpanExporter(
+                settings.get("endpoint", DEFAULT_COLLECTOR_ENDPOINT)
+            )
+        else:
+            exporter = FileSpanExporter(settings.get("path", DEFAULT_SPANS_PATH))
+        return cls(
+            exporter, settings.get("service_name", "parenting-simulation")
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Time a block as a child of the current span, or as a new trace's root"""
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+
+        parent = _current_span.get()
+        span = Span(
+            name=name,
+            trace_id=parent.trace_id if parent else secrets.token_hex(16),
+            span_id=secrets.token_hex(8),
+            parent_span_id=parent.span_id if parent else None,
+            attributes=attributes,
+        )
+        if parent is None:
+            with self._lock:
+                self._open_traces.add(span.trace_id)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            self._finish(span)
+
+    def _finish(self, span: Span):
+        with self._lock:
+            if span.parent_span_id is None:
+                self._open_traces.discard(span.trace_id)
+                spans = self._pending.pop(span.trace_id, []) + [span]
+            elif span.trace_id in self._open_traces:
+                self._pending.setdefault(span.trace_id, []).append(span)
+                return
+            else:
+                spans = [span]
+        self._export_worker.submit(
+            self.exporter.export, otlp_payload(spans, self.service_name)
+        )
+
+    def shutdown(self):
+        """Export the spans of unfinished traces and wait for every pending export"""
+        if not self.enabled:
+            return
+        with self._lock:
+            spans = [span for trace in self._pending.values() for span in trace]
+            self._pending.clear()
+            self._open_traces.clear()
+        if spans:
+            self._export_worker.submit(
+                self.exporter.export, otlp_payload(spans, self.service_name)
+            )
+        self._export_worker.shutdown(wait=True)
+
+
+def current_span():
+    """The innermost open span of this thread, or a no-op span"""
+    return _current_span.get() or NOOP_SPAN
+
+
+def traced(name: str):
+    """Decorator that runs a function inside a span of the shared tracer"""
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with get_span_tracer().span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+_span_tracer: Optional[SpanTracer] = None
+_span_tracer_lock = threading.Lock()
+
+
+def get_span_tracer(config_data: Optional[dict] = None) -> SpanTracer:
+    """Return the span tracer shared by every Framework in this process.
+
+    The first call that passes a config decides how spans are exported.
+    """
+    global _span_tracer
+    with _span_tracer_lock:
+        if _span_tracer is None or (
+            config_data is not None and not _span_tracer.enabled
+        ):
+            _span_tracer = SpanTracer.from_config(config_data or {})
+            if _span_tracer.enabled:
+                atexit.register(_span_tracer.shutdown)
+        return _span_tracer
+
+
+def set_span_tracer(tracer: SpanTracer):
+    """Replace the shared span tracer, e.g. with one that collects spans in memory"""
+    global _span_tracer
+    with _span_tracer_lock:
+        _span_tracer = tracer
+
+
+class CollectorHandler(BaseHTTPRequestHandler):
+    """Accepts OTLP/JSON on /v1/traces and appends each request to a file"""
+
+    exporter: FileSpanExporter = None
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/v1/traces":
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self.send_error(400, "Body must be OTLP/JSON")
+            return
+
+        self.exporter.export(payload)
+        body = b"{}"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_collector(host: str, port: int, path: str):
+    """Serve a minimal local stand-in for an OpenTelemetry collector until interrupted"""
+    handler = type(
+        "BoundCollectorHandler", (CollectorHandler,), {"exporter": FileSpanExporter(path)}
+    )
+    server = ThreadingHTTPServer((host, port), handler)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def attribute_values(span: dict) -> dict:
+    """The attributes of an OTLP/JSON span (or event) as a plain dict"""
+    values = {}
+    for attribute in span.get("attributes", []):
+        (kind, value), = attribute["value"].items()
+        values[attribute["key"]] = int(value) if kind == "intValue" else value
+    return values
+
+
+def payload_spans(payload: dict) -> List[dict]:
+    """The spans of one OTLP/JSON export request, with durations in seconds"""
+    spans = []
+    for resource_spans in payload.get("resourceSpans", []):
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for span in scope_spans.get("spans", []):
+                span["duration_seconds"] = (
+                    int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])
+                ) / 1e9
+                spans.append(span)
+    return spans
+
+
+def load_spans(paths: List[str]) -> List[dict]:
+    """Read the spans of OTLP/JSON lines files"""
+    spans = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    spans.extend(payload_spans(json.loads(line)))
+    return spans
+
+
+def percentile(values: List[float], percent: float) -> float:
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def span_stats(spans: List[dict]) -> Dict[str, dict]:
+    """Count and latency percentiles (in seconds) for every span name"""
+    durations: Dict[str, List[float]] = {}
+    for span in spans:
+        durations.setdefault(span["name"], []).append(span["duration_seconds"])
+    return {
+        name: {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "max": max(values),
+        }
+        for name, values in sorted(durations.items())
+    }
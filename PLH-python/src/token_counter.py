@@ -0,0 +1,192 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import math
+import re
+import threading
+from langchain.prompts import PromptTemplate
+
+CONDITION_NAMES = [
+    "child_only_neutral",
+    "child_only_positive",
+    "child_and_facilitator_positive_reinforcement",
+    "child_and_facilitator_help",
+    "facilitator_only_help",
+    "end_conversation",
+]
+
+PIPELINE_NAMES = [
+    "child",
+    "facilitator_decision",
+    "facilitator_positive_reinforcement",
+    "facilitator_help",
+    "facilitator_end_coaching",
+    "facilitator_summary",
+]
+
+# Prompt inputs whose size depends on the conversation, reported as their own sections
+DYNAMIC_SECTIONS = ["interaction_history", "previous_coaching"]
+
+
+class TokenCounter:
+    """Counts tokens locally, without calling the provider.
+
+    Uses tiktoken when it is installed and its encoding is available offline,
+    otherwise falls back to an approximation of roughly four characters per
+    word piece. The counts are meant for comparing prompt sections, not billing.
+    """
+
+    def __init__(self, encoding_name: str = "cl100k_base"):
+        self._encoding = None
+        self.method = "approximate"
+        try:
+            import tiktoken
+
+            self._encoding = tiktoken.get_encoding(encoding_name)
+            self.method = f"tiktoken:{encoding_name}"
+        except Exception:
+            pass
+
+    def count(self, text: Optional[str]) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return sum(
+            max(1, math.ceil(len(piece) / 4))
+            for piece in re.findall(r"\w+|[^\w\s]", text)
+        )
+
+    def count_messages(self, messages: List) -> int:
+        return sum(self.count(message.content) for message in messages)
+
+
+def static_prompt_inputs(config_data: dict) -> Dict[str, str]:
+    """The prompt inputs that only depend on the config, not on the conversation"""
+    scenario = config_data.get("scenario") or {}
+    conditions = config_data.get("conditions") or {}
+    inputs = {
+        "scenario_description": scenario.get("description") or "",
+        "scenario_objectives": scenario.get("objectives") or "",
+    }
+    for name in CONDITION_NAMES:
+        inputs[name] = conditions.get(name) or ""
+    return inputs
+
+
+def render_static_prompt(template: str, config_data: dict) -> str:
+    """Render a system prompt with its static inputs filled in and everything else empty"""
+    prompt = PromptTemplate.from_template(template)
+    static_inputs = static_prompt_inputs(config_data)
+    return prompt.format(
+        **{name: static_inputs.get(name, "") for name in prompt.input_variables}
+    )
+
+
+def config_static_sizes(config_data: dict, counter: TokenCounter) -> Dict[str, dict]:
+    """Static token cost of every pipeline prompt in a config, split by source"""
+    system_prompts = config_data.get("system_prompts") or {}
+    static_inputs = static_prompt_inputs(config_data)
+    sizes = {}
+    for pipeline in PIPELINE_NAMES:
+        template = system_prompts.get(pipeline)
+        if not template:
+            continue
+        variables = PromptTemplate.from_template(template).input_variables
+        objectives = (
+            counter.count(static_inputs["scenario_objectives"])
+            if "scenario_objectives" in variables
+            else 0
+        )
+        description = (
+            counter.count(static_inputs["scenario_description"])
+            if "scenario_description" in variables
+            else 0
+        )
+        conditions = sum(
+            counter.count(static_inputs[name])
+            for name in CONDITION_NAMES
+            if name in variables
+        )
+        total = counter.count(render_static_prompt(template, config_data))
+        sizes[pipeline] = {
+            "instructions": total - objectives - description - conditions,
+            "objectives": objectives,
+            "description": description,
+            "conditions": conditions,
+            "total": total,
+        }
+    return sizes
+
+
+@dataclass
+class PromptSize:
+    """Token count of one rendered prompt, split by section"""
+
+    pipeline: str
+    total: int
+    sections: Dict[str, int] = field(default_factory=dict)
+    budget: Optional[int] = None
+
+    @property
+    def over_budget(self) -> bool:
+        return self.budget is not None and self.total > self.budget
+
+    def describe(self) -> str:
+        sections = ", ".join(f"{name}={count}" for name, count in self.sections.items())
+        return f"{self.pipeline}: {self.total} tokens ({sections})"
+
+
+class PromptSizeTracker:
+    """Measures every prompt a Framework sends against its budget.
+
+    Budgets come from the optional `token_budget` config section:
+    `max_prompt_tokens` applies to every pipeline and `pipelines.<name>`
+    overrides it for a single pipeline. The sizes themselves are kept on each
+    Session; the tracker only keeps running totals per pipeline, so a shared
+    Framework does not grow with every call.
+    """
+
+    def __init__(self, config_data: dict, counter: Optional[TokenCounter] = None):
+        self.counter = counter or TokenCounter()
+        budget_config = config_data.get("token_budget") or {}
+        self.default_budget = budget_config.get("max_prompt_tokens")
+        self.pipeline_budgets = budget_config.get("pipelines") or {}
+
+        self.static_tokens = {
+            pipeline: size["total"]
+            for pipeline, size in config_static_sizes(config_data, self.counter).items()
+        }
+        self._totals: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def budget_for(self, pipeline: str) -> Optional[int]:
+        return self.pipeline_budgets.get(pipeline, self.default_budget)
+
+    def measure(self, pipeline: str, messages: List, prompt_inputs: dict) -> PromptSize:
+        total = self.counter.count_messages(messages)
+        sections = {"static": self.static_tokens.get(pipeline, 0)}
+        for name in DYNAMIC_SECTIONS:
+            if name in prompt_inputs:
+                sections[name] = self.counter.count(str(prompt_inputs[name] or ""))
+        sections["other"] = max(0, total - sum(sections.values()))
+
+        size = PromptSize(
+            pipeline=pipeline,
+            total=total,
+            sections=sections,
+            budget=self.budget_for(pipeline),
+        )
+        with self._lock:
+            totals = self._totals.setdefault(pipeline, {"calls": 0, "total": 0, "max": 0})
+            totals["calls"] += 1
+            totals["total"] += total
+            totals["max"] = max(totals["max"], total)
+        return size
+
+    def summary(self) -> Dict[str, dict]:
+        """Calls, mean and max prompt tokens per pipeline"""
+        with self._lock:
+            summary = {pipeline: dict(totals) for pipeline, totals in self._totals.items()}
+        for stats in summary.values():
+            stats["mean"] = stats["total"] / stats["calls"]
+        return summary
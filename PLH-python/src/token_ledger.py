@@ -0,0 +1,295 @@
+from dataclasses import asdict, dataclass
+from datetime import date
+from typing import Dict, Optional, Tuple
+import atexit
+import os
+import sqlite3
+import threading
+
+# Budget states, from least to most restrictive
+BUDGET_OK = "ok"
+BUDGET_SOFT = "soft"
+BUDGET_HARD = "hard"
+
+DEFAULT_LEDGER_DIRECTORY = "ledger"
+
+
+@dataclass
+class RoleUsage:
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+
+
+class TokenLedger:
+    """Prompt and completion tokens and estimated cost per routing role.
+
+    Each conversation keeps one on its ConversationTracer, so the totals are
+    saved with the trace and survive a spill to disk.
+    """
+
+    def __init__(self):
+        self.roles: Dict[str, RoleUsage] = {}
+        self._lock = threading.Lock()
+
+    def record(self, role: str, prompt_tokens: int, completion_tokens: int, cost: float):
+        with self._lock:
+            usage = self.roles.setdefault(role, RoleUsage())
+            usage.calls += 1
+            usage.prompt_tokens += prompt_tokens
+            usage.completion_tokens += completion_tokens
+            usage.cost += cost
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(
+            usage.prompt_tokens + usage.completion_tokens for usage in self.roles.values()
+        )
+
+    @property
+    def total_cost(self) -> float:
+        return sum(usage.cost for usage in self.roles.values())
+
+    def to_dict(self) -> dict:
+        return {
+            "prompt_tokens": sum(usage.prompt_tokens for usage in self.roles.values()),
+            "completion_tokens": sum(
+                usage.completion_tokens for usage in self.roles.values()
+            ),
+            "total_tokens": self.total_tokens,
+            "cost": round(self.total_cost, 6),
+            "roles": {
+                role: dict(asdict(usage), cost=round(usage.cost, 6))
+                for role, usage in sorted(self.roles.items())
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[dict]) -> "TokenLedger":
+        ledger = cls()
+        for role, usage in ((data or {}).get("roles") or {}).items():
+            ledger.roles[role] = RoleUsage(**usage)
+        return ledger
+
+
+class DailyUsage:
+    """Tokens and cost of every session today, shared by every process.
+
+    Totals are kept per day in `<directory>/usage.sqlite`. `record` only adds
+    to an in-memory buffer; a background thread adds the buffer to the
+    stored totals with an atomic increment every `flush_seconds` and reads
+    back the totals of every process writing to the same directory, so daily
+    limits hold across processes and survive a restart the same day.
+    """
+
+    def __init__(self, directory: str = DEFAULT_LEDGER_DIRECTORY, flush_seconds: float = 1.0):
+        self.directory = directory
+        self.path = os.path.join(directory, "usage.sqlite")
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._connection = None
+        self._flusher = None
+        self._stop_event = threading.Event()
+        # Not yet stored, per day
+        self._pending: Dict[str, Tuple[int, float]] = {}
+        # Stored totals of the day, as last read back
+        self._stored_day = None
+        self._stored = (0, 0.0)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.path, timeout=30, check_same_thread=False
+            )
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            with self._connection:
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS daily_usage ("
+                    "day TEXT PRIMARY KEY, tokens INTEGER NOT NULL, cost REAL NOT NULL)"
+                )
+        return self._connection
+
+    def _ensure_flusher(self):
+        if self._flusher is None:
+            self._flusher = threading.Thread(
+                target=self._flush_loop, name="daily-usage", daemon=True
+            )
+            self._flusher.start()
+            atexit.register(self.shutdown)
+
+    def record(self, tokens: int, cost: float):
+        with self._lock:
+            today = date.today().isoformat()
+            pending_tokens, pending_cost = self._pending.get(today, (0, 0.0))
+            self._pending[today] = (pending_tokens + tokens, pending_cost + cost)
+            self._ensure_flusher()
+
+    def flush(self):
+        """Add the buffered usage to the stored totals and read back today's"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            today = date.today().isoformat()
+            connection = self._connect()
+            try:
+                with connection:
+                    connection.executemany(
+                        "INSERT INTO daily_usage (day, tokens, cost) VALUES (?, ?, ?) "
+                        "ON CONFLICT(day) DO UPDATE SET "
+                        "tokens = tokens + excluded.tokens, cost = cost + excluded.cost",
+                        [(day, tokens, cost) for day, (tokens, cost) in pending.items()],
+                    )
+                row = connection.execute(
+                    "SELECT tokens, cost FROM daily_usage WHERE day = ?", (today,)
+                ).fetchone()
+            except sqlite3.Error:
+                # Keep the usage for the next flush rather than lose it
+                with self._lock:
+                    for day, (tokens, cost) in pending.items():
+                        pending_tokens, pending_cost = self._pending.get(day, (0, 0.0))
+                        self._pending[day] = (pending_tokens + tokens, pending_cost + cost)
+                raise
+            with self._lock:
+                self._stored_day = today
+                self._stored = tuple(row) if row else (0, 0.0)
+
+    def _flush_loop(self):
+        while not self._stop_event.wait(self.flush_seconds):
+            try:
+                self.flush()
+            except sqlite3.Error:
+                pass
+
+    def totals(self):
+        """Today's tokens and cost, including usage not stored yet"""
+        today = date.today().isoformat()
+        if self._stored_day != today:
+            self.flush()
+        with self._lock:
+            pending_tokens, pending_cost = self._pending.get(today, (0, 0.0))
+            stored_tokens, stored_cost = (
+                self._stored if self._stored_day == today else (0, 0.0)
+            )
+            return stored_tokens + pending_tokens, stored_cost + pending_cost
+
+    def shutdown(self):
+        """Stop the background thread and store what is left in the buffer"""
+        self._stop_event.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=5)
+        self.flush()
+
+
+def _limit_state(tokens: int, cost: float, limits: dict) -> str:
+    def over(kind: str) -> bool:
+        max_tokens = limits.get(f"{kind}_tokens")
+        max_cost = limits.get(f"{kind}_cost")
+        return (max_tokens is not None and tokens >= max_tokens) or (
+            max_cost is not None and cost >= max_cost
+        )
+
+    if over("hard"):
+        return BUDGET_HARD
+    if over("soft"):
+        return BUDGET_SOFT
+    return BUDGET_OK
+
+
+class BudgetPolicy:
+    """Prices model calls and checks them against the optional `budgets` config section.
+
+    Prices are in USD per million tokens, per model. Session and daily limits
+    can be set in tokens, cost or both. Past a soft limit the framework uses
+    the routing fallback models and trims the interaction history; past a
+    hard limit it ends the conversation with end coaching and the summary.
+    Past the daily hard limit no further calls are made at all: end coaching
+    and summaries are replaced by a static message. Runs against a stub
+    model pass `track_daily=False`, so their usage neither counts towards nor
+    is limited by the real daily totals.
+    """
+
+    def __init__(self, config_data: dict, track_daily: bool = True):
+        settings = config_data.get("budgets") or {}
+        self.prices = settings.get("prices") or {}
+        self.session_limits = settings.get("session") or {}
+        self.daily_limits = settings.get("daily") or {}
+        soft_limit = settings.get("soft_limit") or {}
+        self.use_fallback_models = soft_limit.get("use_fallback_models", True)
+        self.history_tokens = soft_limit.get("history_tokens")
+        self.daily_usage = (
+            get_daily_usage(
+                settings.get("directory", DEFAULT_LEDGER_DIRECTORY),
+                settings.get("flush_seconds", 1.0),
+            )
+            if self.daily_limits and track_daily
+            else None
+        )
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        price = self.prices.get(model) or self.prices.get("default") or {}
+        return (
+            prompt_tokens * price.get("prompt", 0.0)
+            + completion_tokens * price.get("completion", 0.0)
+        ) / 1_000_000
+
+    def record(
+        self, ledger: TokenLedger, role: str, model: str, prompt_tokens: int, completion_tokens: int
+    ):
+        cost = self.cost(model, prompt_tokens, completion_tokens)
+        ledger.record(role, prompt_tokens, completion_tokens, cost)
+        if self.daily_usage is not None:
+            self.daily_usage.record(prompt_tokens + completion_tokens, cost)
+
+    def daily_state(self) -> str:
+        """The budget state of all conversations of the day"""
+        if self.daily_usage is None:
+            return BUDGET_OK
+        return _limit_state(*self.daily_usage.totals(), self.daily_limits)
+
+    def state(self, ledger: TokenLedger) -> str:
+        """The most restrictive of the session and daily budget states"""
+        states = [_limit_state(ledger.total_tokens, ledger.total_cost, self.session_limits)]
+        states.append(self.daily_state())
+        for state in (BUDGET_HARD, BUDGET_SOFT):
+            if state in states:
+                return state
+        return BUDGET_OK
+
+
+def compress_history(history: str, max_tokens: int, counter) -> str:
+    """Keep the opening line and as many of the latest turns as fit in `max_tokens`"""
+    separator = "\n\n" if "\n\n" in history else "\n"
+    blocks = history.split(separator)
+    if len(blocks) < 3 or counter.count(history) <= max_tokens:
+        return history
+
+    kept = []
+    used = counter.count(blocks[0])
+    for block in reversed(blocks[1:]):
+        used += counter.count(block)
+        if used > max_tokens and kept:
+            break
+        kept.insert(0, block)
+    omitted = len(blocks) - 1 - len(kept)
+    if omitted == 0:
+        return history
+    return separator.join(
+        [blocks[0], f"[... {omitted} earlier entries omitted ...]"] + kept
+    )
+
+
+_daily_usage: Dict[str, DailyUsage] = {}
+_daily_usage_lock = threading.Lock()
+
+
+def get_daily_usage(
+    directory: str = DEFAULT_LEDGER_DIRECTORY, flush_seconds: float = 1.0
+) -> DailyUsage:
+    """Return the daily usage totals shared by every Framework in this process"""
+    with _daily_usage_lock:
+        if directory not in _daily_usage:
+            _daily_usage[directory] = DailyUsage(directory, flush_seconds)
+        return _daily_usage[directory]
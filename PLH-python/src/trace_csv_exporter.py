@@ -1,19 +1,19 @@
 import csv
 import os
 from typing import List, Optional
-from src.conversation_tracer import TraceEntry, ConversationTracer
+from src.conversation_tracer import TraceEntry, ConversationTracer, new_session_id
 from src.decision_types import DecisionType
-from datetime import datetime
+from src.spans import traced
 
 
 class TraceExporter:
     def __init__(self, conversation_tracer: ConversationTracer):
         self.conversation_tracer = conversation_tracer
 
+    @traced("trace.export_csv")
     def export_to_csv(self, filename: Optional[str] = None) -> str:
         if not filename:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"full_unfiltered_trace_{timestamp}.csv"
+            filename = f"full_unfiltered_trace_{new_session_id()}.csv"
 
         os.makedirs("csv", exist_ok=True)
         file_path = os.path.join("csv", filename)
@@ -0,0 +1,414 @@
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+import json
+import os
+import sqlite3
+import threading
+import time
+from src.conversation_tracer import ConversationTracer
+from src.spans import traced
+from src.token_ledger import TokenLedger
+
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS sessions (
+        session_id TEXT PRIMARY KEY,
+        scenario TEXT,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        conversation_initiator TEXT,
+        parent_feedback_positive TEXT,
+        parent_feedback_negative TEXT,
+        summary TEXT,
+        total_tokens INTEGER,
+        cost REAL,
+        usage TEXT,
+        forked_from_session TEXT,
+        forked_from_turn INTEGER
+    )""",
+    """CREATE TABLE IF NOT EXISTS turns (
+        id INTEGER PRIMARY KEY,
+        session_id TEXT NOT NULL REFERENCES sessions(session_id),
+        turn_index INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        parent TEXT,
+        child TEXT,
+        coaching TEXT,
+        decision INTEGER,
+        decision_reasoning TEXT,
+        models TEXT,
+        UNIQUE (session_id, turn_index)
+    )""",
+    "CREATE INDEX IF NOT EXISTS sessions_scenario ON sessions(scenario)",
+    "CREATE INDEX IF NOT EXISTS sessions_created_at ON sessions(created_at)",
+    "CREATE INDEX IF NOT EXISTS sessions_forked_from ON sessions(forked_from_session)",
+    "CREATE INDEX IF NOT EXISTS turns_decision ON turns(decision)",
+    "CREATE INDEX IF NOT EXISTS turns_created_at ON turns(created_at)",
+]
+
+# Session columns added after the first release, added to older databases on open
+SESSION_COLUMNS = {
+    "total_tokens": "INTEGER",
+    "cost": "REAL",
+    "usage": "TEXT",
+    "forked_from_session": "TEXT",
+    "forked_from_turn": "INTEGER",
+}
+
+# Full-text index over the turn texts, kept in sync by triggers
+FTS_SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS turns_fts USING fts5(
+        parent, child, coaching, content='turns', content_rowid='id'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS turns_fts_insert AFTER INSERT ON turns BEGIN
+        INSERT INTO turns_fts(rowid, parent, child, coaching)
+        VALUES (new.id, new.parent, new.child, new.coaching);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS turns_fts_delete AFTER DELETE ON turns BEGIN
+        INSERT INTO turns_fts(turns_fts, rowid, parent, child, coaching)
+        VALUES ('delete', old.id, old.parent, old.child, old.coaching);
+    END""",
+]
+
+
+@dataclass
+class SearchHit:
+    session_id: str
+    scenario: Optional[str]
+    turn_index: int
+    decision: Optional[int]
+    snippet: str
+
+
+class TraceStore:
+    """SQLite store for conversation traces, indexed for search.
+
+    Sessions and their turns are stored in separate tables, indexed by
+    session, scenario, decision and time, with an FTS5 index over the parent,
+    child and coaching text. Each session also keeps its token usage and cost
+    and the session and turn it was forked from, so cost and lineage can be
+    queried without the YAML files. Turns are append-only, so saving a session
+    again only inserts its new turns; every save is one transaction. When the
+    stored turns are not a prefix of the saved trace, the session id has been
+    reused for a new conversation (callers pick their own ids), and the new
+    conversation replaces the stored one. YAML and CSV files can be produced
+    from any stored session with `load`.
+    """
+
+    DEFAULT_PATH = os.path.join("traces", "traces.sqlite")
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or self.DEFAULT_PATH
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        with self._connection:
+            self._connection.execute(SCHEMA[0])
+            existing = {
+                row[1]
+                for row in self._connection.execute("PRAGMA table_info(sessions)")
+            }
+            for column, kind in SESSION_COLUMNS.items():
+                if column not in existing:
+                    self._connection.execute(
+                        f"ALTER TABLE sessions ADD COLUMN {column} {kind}"
+                    )
+            for statement in SCHEMA[1:]:
+                self._connection.execute(statement)
+            try:
+                for statement in FTS_SCHEMA:
+                    self._connection.execute(statement)
+                self.full_text = True
+            except sqlite3.OperationalError:
+                # SQLite built without FTS5: search falls back to LIKE
+                self.full_text = False
+
+    @classmethod
+    def from_config(cls, config_data: dict) -> Optional["TraceStore"]:
+        """The store named in the optional `trace_store` section, if enabled"""
+        settings = config_data.get("trace_store") or {}
+        if not settings.get("enabled"):
+            return None
+        return cls(settings.get("path"))
+
+    def _stored_prefix_matches(self, session_id: str, entries: list) -> bool:
+        stored = self._connection.execute(
+            "SELECT parent, child, coaching, decision FROM turns "
+            "WHERE session_id = ? ORDER BY turn_index",
+            (session_id,),
+        ).fetchall()
+        return len(stored) <= len(entries) and all(
+            row == (entry.parent, entry.child, entry.coaching, entry.decision)
+            for row, entry in zip(stored, entries)
+        )
+
+    def _save(self, session_id: str, tracer: ConversationTracer, scenario: Optional[str]):
+        now = time.time()
+        full_trace = tracer.get_full_trace()
+        if not self._stored_prefix_matches(session_id, full_trace):
+            # A new conversation under a reused id: forget the old one
+            self._connection.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+            self._connection.execute(
+                "UPDATE sessions SET created_at = ? WHERE session_id = ?", (now, session_id)
+            )
+        usage = tracer.ledger.to_dict()
+        forked_from = tracer.forked_from or {}
+        self._connection.execute(
+            "INSERT INTO sessions (session_id, scenario, created_at, updated_at, "
+            "conversation_initiator, parent_feedback_positive, "
+            "parent_feedback_negative, summary, total_tokens, cost, usage, "
+            "forked_from_session, forked_from_turn) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET "
+            "scenario = coalesce(excluded.scenario, sessions.scenario), "
+            "updated_at = excluded.updated_at, "
+            "conversation_initiator = excluded.conversation_initiator, "
+            "parent_feedback_positive = excluded.parent_feedback_positive, "
+            "parent_feedback_negative = excluded.parent_feedback_negative, "
+            "summary = excluded.summary, "
+            "total_tokens = excluded.total_tokens, "
+            "cost = excluded.cost, "
+            "usage = excluded.usage, "
+            "forked_from_session = excluded.forked_from_session, "
+            "forked_from_turn = excluded.forked_from_turn",
+            (
+                session_id,
+                scenario,
+                now,
+                now,
+                tracer.conversation_initiator,
+                tracer.parent_feedback_positive,
+                tracer.parent_feedback_negative,
+                tracer.summary,
+                usage["total_tokens"],
+                usage["cost"],
+                json.dumps(usage),
+                forked_from.get("session_id"),
+                forked_from.get("turn"),
+            ),
+        )
+        stored = self._connection.execute(
+            "SELECT COUNT(*) FROM turns WHERE session_id = ?", (session_id,)
+        ).fetchone()[0]
+        entries = full_trace[stored:]
+        self._connection.executemany(
+            "INSERT INTO turns (session_id, turn_index, created_at, parent, child, "
+            "coaching, decision, decision_reasoning, models) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    session_id,
+                    stored + offset,
+                    now,
+                    entry.parent,
+                    entry.child,
+                    entry.coaching,
+                    entry.decision,
+                    entry.decision_reasoning,
+                    json.dumps(entry.models) if entry.models else None,
+                )
+                for offset, entry in enumerate(entries)
+            ],
+        )
+
+    @traced("trace_store.save")
+    def save(
+        self, session_id: str, tracer: ConversationTracer, scenario: Optional[str] = None
+    ) -> str:
+        """Store a session's trace, inserting only turns not stored yet. Returns the session id."""
+        with self._lock, self._connection:
+            self._save(session_id, tracer, scenario)
+        return session_id
+
+    def save_many(
+        self, sessions: Iterable[Tuple[str, ConversationTracer, Optional[str]]]
+    ) -> int:
+        """Store many sessions in a single transaction. Returns how many were stored."""
+        count = 0
+        with self._lock, self._connection:
+            for session_id, tracer, scenario in sessions:
+                self._save(session_id, tracer, scenario)
+                count += 1
+        return count
+
+    def load(self, session_id: str) -> Optional[ConversationTracer]:
+        """Rebuild a stored session's tracer, e.g. to write it out as YAML or CSV"""
+        with self._lock:
+            session = self._connection.execute(
+                "SELECT conversation_initiator, parent_feedback_positive, "
+                "parent_feedback_negative, summary, usage, forked_from_session, "
+                "forked_from_turn FROM sessions WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+            if session is None:
+                return None
+            turns = self._connection.execute(
+                "SELECT parent, child, coaching, decision, decision_reasoning, models "
+                "FROM turns WHERE session_id = ? ORDER BY turn_index",
+                (session_id,),
+            ).fetchall()
+
+        return ConversationTracer.from_dict(
+            {
+                "conversation_initiator": session[0],
+                "parent_feedback_positive": session[1],
+                "parent_feedback_negative": session[2],
+                "summary": session[3],
+                "usage": json.loads(session[4]) if session[4] else None,
+                "forked_from": (
+                    {"session_id": session[5], "turn": session[6]}
+                    if session[5] is not None
+                    else None
+                ),
+                "trace": [
+                    {
+                        "parent": parent,
+                        "child": child,
+                        "coaching": coaching,
+                        "decision": decision,
+                        "decision_reasoning": decision_reasoning,
+                        "models": json.loads(models) if models else None,
+                    }
+                    for parent, child, coaching, decision, decision_reasoning, models in turns
+                ],
+            }
+        )
+
+    def search(
+        self,
+        query: str,
+        decision: Optional[int] = None,
+        scenario: Optional[str] = None,
+        limit: int = 50,
+    ) -> List[SearchHit]:
+        """Turns whose parent, child or coaching text matches `query`, best matches first.
+
+        With FTS5 the query uses its syntax: words, "exact phrases", OR, NOT,
+        prefix* and column filters such as `coaching: siblings`. Raises
+        ValueError for a query FTS5 cannot parse.
+        """
+        filters = []
+        parameters = []
+        if decision is not None:
+            filters.append("turns.decision = ?")
+            parameters.append(decision)
+        if scenario is not None:
+            filters.append("sessions.scenario = ?")
+            parameters.append(scenario)
+        conditions = "".join(f" AND {condition}" for condition in filters)
+
+        if self.full_text:
+            sql = (
+                "SELECT turns.session_id, sessions.scenario, turns.turn_index, "
+                "turns.decision, snippet(turns_fts, -1, '[', ']', '...', 12) "
+                "FROM turns_fts JOIN turns ON turns.id = turns_fts.rowid "
+                "JOIN sessions ON sessions.session_id = turns.session_id "
+                f"WHERE turns_fts MATCH ?{conditions} ORDER BY rank LIMIT ?"
+            )
+            parameters = [query] + parameters + [limit]
+        else:
+            pattern = f"%{query}%"
+            sql = (
+                "SELECT turns.session_id, sessions.scenario, turns.turn_index, "
+                "turns.decision, coalesce(turns.coaching, turns.parent, turns.child) "
+                "FROM turns JOIN sessions ON sessions.session_id = turns.session_id "
+                "WHERE (turns.parent LIKE ? OR turns.child LIKE ? OR turns.coaching LIKE ?)"
+                f"{conditions} ORDER BY turns.created_at DESC LIMIT ?"
+            )
+            parameters = [pattern, pattern, pattern] + parameters + [limit]
+
+        try:
+            with self._lock:
+                rows = self._connection.execute(sql, parameters).fetchall()
+        except sqlite3.OperationalError as e:
+            raise ValueError(f"Invalid search query {query!r}: {e}") from e
+        return [SearchHit(*row) for row in rows]
+
+    def sessions(
+        self, scenario: Optional[str] = None, since: Optional[float] = None
+    ) -> List[dict]:
+        """Stored sessions, newest first, with their number of turns, usage and origin"""
+        filters = []
+        parameters = []
+        if scenario is not None:
+            filters.append("sessions.scenario = ?")
+            parameters.append(scenario)
+        if since is not None:
+            filters.append("sessions.created_at >= ?")
+            parameters.append(since)
+        where = f" WHERE {' AND '.join(filters)}" if filters else ""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT sessions.session_id, sessions.scenario, sessions.created_at, "
+                "(SELECT COUNT(*) FROM turns WHERE turns.session_id = sessions.session_id), "
+                "sessions.total_tokens, sessions.cost, sessions.forked_from_session, "
+                "sessions.forked_from_turn "
+                f"FROM sessions{where} ORDER BY sessions.created_at DESC",
+                parameters,
+            ).fetchall()
+        return [
+            {
+                "session_id": row[0],
+                "scenario": row[1],
+                "created_at": row[2],
+                "turns": row[3],
+                "total_tokens": row[4],
+                "cost": row[5],
+                "forked_from": (
+                    {"session_id": row[6], "turn": row[7]} if row[6] is not None else None
+                ),
+            }
+            for row in rows
+        ]
+
+    def forks(self, session_id: str) -> List[dict]:
+        """Sessions forked from `session_id`, directly or through other forks"""
+        with self._lock:
+            rows = self._connection.execute(
+                "WITH RECURSIVE lineage(session_id, forked_from_session, forked_from_turn, "
+                "depth) AS ("
+                "SELECT session_id, forked_from_session, forked_from_turn, 1 FROM sessions "
+                "WHERE forked_from_session = ? "
+                "UNION ALL "
+                "SELECT sessions.session_id, sessions.forked_from_session, "
+                "sessions.forked_from_turn, lineage.depth + 1 FROM sessions "
+                "JOIN lineage ON sessions.forked_from_session = lineage.session_id) "
+                "SELECT lineage.session_id, lineage.forked_from_session, "
+                "lineage.forked_from_turn, lineage.depth, sessions.total_tokens, "
+                "sessions.cost FROM lineage "
+                "JOIN sessions ON sessions.session_id = lineage.session_id "
+                "ORDER BY lineage.depth, lineage.session_id",
+                (session_id,),
+            ).fetchall()
+        return [
+            {
+                "session_id": row[0],
+                "forked_from": {"session_id": row[1], "turn": row[2]},
+                "depth": row[3],
+                "total_tokens": row[4],
+                "cost": row[5],
+            }
+            for row in rows
+        ]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+_trace_store: Optional[TraceStore] = None
+_trace_store_lock = threading.Lock()
+
+
+def get_trace_store(config_data: dict) -> Optional[TraceStore]:
+    """Return the trace store shared by every session in this process, if enabled"""
+    global _trace_store
+    with _trace_store_lock:
+        if _trace_store is None:
+            _trace_store = TraceStore.from_config(config_data)
+        return _trace_store
@@ -0,0 +1,429 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from contextlib import nullcontext
+from dataclasses import asdict, dataclass, replace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+import json
+import threading
+import time
+from src.main import play_turn
+from src.session import is_valid_session_id
+
+TURN_PENDING = "pending"
+TURN_COMPLETE = "complete"
+TURN_ERROR = "error"
+
+# Longest a long-poll request is held open
+MAX_WAIT_SECONDS = 60.0
+
+INVALID_SESSION_ID = "session_id must be 1 to 64 letters, digits, underscores or hyphens"
+
+
+@dataclass
+class TurnResult:
+    """What one parent message produced, filled in as the turn progresses"""
+
+    session_id: str
+    sequence: int
+    parent: str
+    status: str = TURN_PENDING
+    decision: Optional[int] = None
+    decision_reasoning: Optional[str] = None
+    child: Optional[str] = None
+    coaching: Optional[str] = None
+    conversation_ended: bool = False
+    error: Optional[str] = None
+    completed_at: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class TurnRecorder:
+    """A UI for play_turn that records each part of the turn as it is displayed"""
+
+    def __init__(self, result: TurnResult):
+        self.result = result
+
+    def display_decision(self, decision, reasoning):
+        self.result.decision = decision
+        self.result.decision_reasoning = reasoning
+
+    def display_child_response(self, message):
+        self.result.child = message
+
+    def display_facilitator_message(self, message):
+        self.result.coaching = message
+
+    def __getattr__(self, name):
+        if name.startswith("display_"):
+            return lambda *args, **kwargs: None
+        raise AttributeError(name)
+
+
+class ResultStore:
+    """Turns of every session, kept until they expire, with long-polling.
+
+    A request waiting on a turn wakes as soon as it is published, so callers
+    never need to sleep. Turns stay readable by sequence number for
+    `ttl_seconds` after their session's last turn, so none is lost if the
+    caller comes back late.
+    """
+
+    def __init__(self, ttl_seconds: float = 3600.0):
+        self.ttl_seconds = ttl_seconds
+        self._turns: Dict[str, Dict[int, TurnResult]] = {}
+        self._last_active: Dict[str, float] = {}
+        self._condition = threading.Condition()
+
+    def publish(self, result: TurnResult):
+        with self._condition:
+            self._turns.setdefault(result.session_id, {})[result.sequence] = result
+            self._last_active[result.session_id] = time.monotonic()
+            self._condition.notify_all()
+
+    def get(self, session_id: str, sequence: int) -> Optional[TurnResult]:
+        with self._condition:
+            return self._turns.get(session_id, {}).get(sequence)
+
+    def wait(self, session_id: str, sequence: int, timeout: float) -> Optional[TurnResult]:
+        """The turn once it is no longer pending, or its current state after `timeout`"""
+        def finished():
+            result = self._turns.get(session_id, {}).get(sequence)
+            return result is not None and result.status != TURN_PENDING
+
+        with self._condition:
+            self._condition.wait_for(finished, timeout=min(timeout, MAX_WAIT_SECONDS))
+            result = self._turns.get(session_id, {}).get(sequence)
+            return None if result is None else replace(result)
+
+    def wait_after(self, session_id: str, after: int, timeout: float) -> List[TurnResult]:
+        """Finished turns with a sequence above `after`, waiting up to `timeout` for the first"""
+        def finished_after():
+            return [
+                result
+                for sequence, result in sorted(self._turns.get(session_id, {}).items())
+                if sequence > after and result.status != TURN_PENDING
+            ]
+
+        with self._condition:
+            self._condition.wait_for(finished_after, timeout=min(timeout, MAX_WAIT_SECONDS))
+            return [replace(result) for result in finished_after()]
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """Forget sessions idle for longer than the TTL. Returns how many were dropped."""
+        if now is None:
+            now = time.monotonic()
+        with self._condition:
+            expired = [
+                session_id
+                for session_id, last_active in self._last_active.items()
+                if now - last_active > self.ttl_seconds
+            ]
+            for session_id in expired:
+                self._turns.pop(session_id, None)
+                self._last_active.pop(session_id, None)
+            return len(expired)
+
+    def forget(self, session_ids: List[str]):
+        """Drop the turns of sessions that have ended"""
+        with self._condition:
+            for session_id in session_ids:
+                self._turns.pop(session_id, None)
+                self._last_active.pop(session_id, None)
+
+
+class TurnEngine:
+    """Plays turns under a deadline and finishes them in the background.
+
+    `play` returns by `deadline_seconds` with whatever the turn has produced
+    so far, typically the decision with the child reply or coaching still
+    missing, plus a placeholder to show meanwhile. The turn keeps running and
+    is published to the result store when complete. With an `experiment`,
+    each session is played by the Framework of its arm and its turns are
+    recorded for the experiment.
+
+    Turns of one session are queued per session and played in order by at
+    most one worker at a time, so a burst of messages from one session never
+    holds workers that other sessions' turns need. A turn that ends the
+    conversation is followed by the summary, and the session is saved and
+    closed through the session manager.
+
+    At most every `expire_interval_seconds`, a turn also starts a background
+    sweep that finalises the sessions idle for longer than the session
+    manager's TTL and forgets their sequence numbers and results.
+    """
+
+    def __init__(
+        self,
+        framework,
+        sessions,
+        results: Optional[ResultStore] = None,
+        deadline_seconds: float = 12.0,
+        placeholder: str = "...",
+        max_workers: int = 32,
+        experiment=None,
+        expire_interval_seconds: float = 60.0,
+    ):
+        self.framework = framework
+        self.sessions = sessions
+        self.experiment = experiment
+        self.results = results or ResultStore()
+        self.deadline_seconds = deadline_seconds
+        self.placeholder = placeholder
+        self.expire_interval_seconds = expire_interval_seconds
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="turn"
+        )
+        self._sequences: Dict[str, int] = {}
+        # Work waiting for each session's worker, and the sessions that have one
+        self._queues: Dict[str, Deque[Tuple[Callable, Future]]] = {}
+        self._last_played: Dict[str, float] = {}
+        self._last_expiry = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, framework, sessions, config, experiment=None) -> "TurnEngine":
+        """Build an engine from the optional `turn_engine` config section"""
+        return cls(
+            framework,
+            sessions,
+            ResultStore(config.get("turn_engine", "result_ttl_seconds", default=3600)),
+            deadline_seconds=config.get("turn_engine", "deadline_seconds", default=12.0),
+            placeholder=config.get("turn_engine", "placeholder", default="..."),
+            max_workers=config.get("turn_engine", "max_workers", default=32),
+            experiment=experiment,
+            expire_interval_seconds=config.get(
+                "turn_engine", "expire_interval_seconds", default=60.0
+            ),
+        )
+
+    def _enqueue(self, session_id: str, work: Callable) -> Future:
+        """Queue work behind the session's earlier work. Returns a future of its result."""
+        future = Future()
+        with self._lock:
+            queue = self._queues.get(session_id)
+            start_worker = queue is None
+            if start_worker:
+                queue = self._queues[session_id] = deque()
+            queue.append((work, future))
+        if start_worker:
+            self._executor.submit(self._drain, session_id)
+        return future
+
+    def _drain(self, session_id: str):
+        """Do a session's queued work in order, then give the worker back"""
+        while True:
+            with self._lock:
+                queue = self._queues[session_id]
+                if not queue:
+                    del self._queues[session_id]
+                    return
+                work, future = queue.popleft()
+            try:
+                future.set_result(work())
+            except Exception as e:
+                future.set_exception(e)
+
+    def _run(self, result: TurnResult):
+        framework = self.framework
+        session = None
+        try:
+            # Fetched only now, so the turn sees the previous turn of its session
+            session = self.sessions.get(result.session_id)
+            measure = nullcontext()
+            if self.experiment is not None:
+                framework = self.experiment.framework(result.session_id)
+                measure = self.experiment.measure(session)
+            retry_message = framework.config.get("static_messages", "retry_message")
+            with framework.spans.span(
+                "turn",
+                **{"turn.count": session.turn_count, "session.id": result.session_id},
+            ), measure:
+                result.conversation_ended = play_turn(
+                    framework,
+                    session,
+                    TurnRecorder(result),
+                    result.parent,
+                    retry_message,
+                )
+            result.status = TURN_COMPLETE
+        except Exception as e:
+            result.status = TURN_ERROR
+            result.error = f"{type(e).__name__}: {e}"
+        result.completed_at = time.time()
+        self.results.publish(result)
+
+        if result.conversation_ended:
+            self._finalise(framework, session)
+
+    def _finalise(self, framework, session):
+        """Summarise an ended conversation and save and close its session"""
+        try:
+            with framework.spans.span("session.finalise", **{"session.id": session.session_id}):
+                session.conversation_trace.set_summary(
+                    framework.generate_summary(session, "", "")
+                )
+        except Exception:
+            # Recorded on the span; the trace is still saved without a summary
+            pass
+        finally:
+            self.sessions.close(session.session_id)
+
+    def play(
+        self, session_id: str, parent_input: str, deadline_seconds: Optional[float] = None
+    ) -> dict:
+        """Queue a turn and return its state once complete or at the deadline"""
+        now = time.monotonic()
+        with self._lock:
+            sequence = self._sequences.get(session_id, 0) + 1
+            self._sequences[session_id] = sequence
+            self._last_played[session_id] = now
+            sweep = now - self._last_expiry >= self.expire_interval_seconds
+            if sweep:
+                self._last_expiry = now
+
+        if sweep:
+            self._executor.submit(self.expire_idle, now)
+        self.results.expire()
+        result = TurnResult(session_id=session_id, sequence=sequence, parent=parent_input)
+        self.results.publish(result)
+        future = self._enqueue(session_id, lambda: self._run(result))
+
+        deadline = self.deadline_seconds if deadline_seconds is None else deadline_seconds
+        try:
+            future.result(timeout=deadline)
+        except TimeoutError:
+            pass
+
+        response = replace(result).to_dict()
+        if response["status"] == TURN_PENDING:
+            response["placeholder"] = self.placeholder
+        return response
+
+    def expire_idle(self, now: Optional[float] = None) -> List[str]:
+        """Finalise sessions idle for longer than the session TTL. Returns the trace paths."""
+        if now is None:
+            now = time.monotonic()
+        expired = []
+        with self._lock:
+            for session_id, last_played in list(self._last_played.items()):
+                # A session with turns still queued or playing is not idle
+                if (
+                    now - last_played <= self.sessions.idle_ttl_seconds
+                    or session_id in self._queues
+                ):
+                    continue
+                self._last_played.pop(session_id)
+                self._sequences.pop(session_id, None)
+                expired.append(session_id)
+        self.results.forget(expired)
+        return self.sessions.expire_idle(now)
+
+    def close(self, session_id: str) -> Optional[str]:
+        """Save a finished session's trace once its queued turns are done. Returns the trace path."""
+        with self._lock:
+            self._sequences.pop(session_id, None)
+            self._last_played.pop(session_id, None)
+        return self._enqueue(session_id, lambda: self.sessions.close(session_id)).result()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+class TurnHandler(BaseHTTPRequestHandler):
+    """JSON over HTTP for a TurnEngine.
+
+    POST /chat           {"session_id", "message", "deadline_seconds"?}
+    GET  /turns/<session>/<sequence>?timeout=<s>   wait for one turn
+    GET  /turns/<session>?after=<sequence>&timeout=<s>   wait for later turns
+    POST /close          {"session_id"}
+
+    Session ids must be 1 to 64 letters, digits, underscores or hyphens, as
+    they name the session's files; other ids get a 400.
+    """
+
+    engine: TurnEngine = None
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self) -> Optional[dict]:
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            return None
+        return body if isinstance(body, dict) else None
+
+    def do_POST(self):
+        path = urlparse(self.path).path.rstrip("/")
+        body = self._read_json()
+        if body is None or not body.get("session_id"):
+            self._send_json(400, {"error": "Body must be a JSON object with a session_id"})
+            return
+        if not isinstance(body["session_id"], str) or not is_valid_session_id(
+            body["session_id"]
+        ):
+            self._send_json(400, {"error": INVALID_SESSION_ID})
+            return
+
+        if path == "/chat":
+            if not isinstance(body.get("message"), str):
+                self._send_json(400, {"error": "message must be a string"})
+                return
+            self._send_json(
+                200,
+                self.engine.play(
+                    body["session_id"], body["message"], body.get("deadline_seconds")
+                ),
+            )
+        elif path == "/close":
+            self._send_json(200, {"trace_file": self.engine.close(body["session_id"])})
+        else:
+            self._send_json(404, {"error": f"Unknown path {path}"})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        query = parse_qs(url.query)
+        if len(parts) >= 2 and parts[0] == "turns" and not is_valid_session_id(parts[1]):
+            self._send_json(400, {"error": INVALID_SESSION_ID})
+            return
+        try:
+            timeout = float(query.get("timeout", ["0"])[0])
+            if len(parts) == 3 and parts[0] == "turns":
+                result = self.engine.results.wait(parts[1], int(parts[2]), timeout)
+                if result is None:
+                    self._send_json(404, {"error": "Unknown turn"})
+                else:
+                    self._send_json(200, result.to_dict())
+            elif len(parts) == 2 and parts[0] == "turns":
+                after = int(query.get("after", ["0"])[0])
+                turns = self.engine.results.wait_after(parts[1], after, timeout)
+                self._send_json(200, {"turns": [turn.to_dict() for turn in turns]})
+            else:
+                self._send_json(404, {"error": f"Unknown path {url.path}"})
+        except ValueError:
+            self._send_json(400, {"error": "timeout, after and sequence must be numbers"})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_turn_server(engine: TurnEngine, host: str, port: int):
+    """Serve the turn engine over HTTP until interrupted"""
+    handler = type("BoundTurnHandler", (TurnHandler,), {"engine": engine})
+    server = ThreadingHTTPServer((host, port), handler)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        engine.shutdown()
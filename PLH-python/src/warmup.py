@@ -0,0 +1,113 @@
+from typing import Dict, Optional
+import threading
+import time
+import httpx
+from openai import DefaultHttpxClient
+
+# How long an idle provider connection is kept open, long enough to outlast
+# the parent typing their first message
+DEFAULT_KEEPALIVE_SECONDS = 120.0
+
+
+class WarmUp:
+    """Pays the first-call setup costs before the first turn needs them.
+
+    Opens the provider connection (DNS, TLS) with a models request on each
+    distinct client, and renders every pipeline prompt once so LangChain and
+    the SDK load their lazy code paths. Runs on a background thread while the
+    header is displayed and the parent types; every step is best effort. Off
+    unless the optional `warmup` section enables it.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.timings: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+
+    @classmethod
+    def from_config(cls, config_data: dict) -> "WarmUp":
+        settings = config_data.get("warmup") or {}
+        return cls(enabled=settings.get("enabled", False))
+
+    def _step(self, name: str, function):
+        start = time.perf_counter()
+        try:
+            function()
+        except Exception as e:
+            # An error response still leaves the connection open
+            self.errors[name] = type(e).__name__
+        self.timings[name] = time.perf_counter() - start
+
+    def run(self, framework) -> Dict[str, float]:
+        """Warm up a framework's clients and prompts. Returns the seconds per step."""
+        llms = {}
+        for _, llm in framework.pipelines.values():
+            llms.setdefault(llm.model_name, llm)
+        for llm in framework.router.fallbacks.values():
+            llms.setdefault(llm.model_name, llm)
+
+        # Clients sharing one connection pool need only one connection
+        clients = {}
+        for llm in llms.values():
+            client = getattr(llm, "root_client", None)
+            if client is not None:
+                clients.setdefault(id(client._client), client)
+        for index, client in enumerate(clients.values()):
+            self._step(
+                f"connect.{index}", client.with_options(max_retries=0).models.list
+            )
+
+        for name, (prompt, _) in framework.pipelines.items():
+            self._step(
+                f"prompt.{name}",
+                lambda prompt=prompt: prompt.format_messages(
+                    **{variable: "" for variable in prompt.input_variables}
+                ),
+            )
+
+        framework._debug_event(
+            "Warm-up",
+            "\n".join(
+                f"{name}: {seconds * 1000:.0f}ms"
+                + (f" ({self.errors[name]})" if name in self.errors else "")
+                for name, seconds in self.timings.items()
+            ),
+        )
+        return self.timings
+
+    def start(self, framework) -> Optional[threading.Thread]:
+        """Run the warm-up in the background. Returns its thread, or None when disabled."""
+        if not self.enabled:
+            return None
+        thread = threading.Thread(
+            target=self.run, args=(framework,), name="warm-up", daemon=True
+        )
+        thread.start()
+        return thread
+
+
+_http_client: Optional[httpx.Client] = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client(config_data: Optional[dict] = None) -> httpx.Client:
+    """Return the HTTP client shared by every model client in this process.
+
+    One connection pool means a connection opened by the warm-up, or by any
+    earlier call, is reused by every model. The first call configures it from
+    the `warmup` config section.
+    """
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            settings = (config_data or {}).get("warmup") or {}
+            _http_client = DefaultHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=1000,
+                    max_keepalive_connections=100,
+                    keepalive_expiry=settings.get(
+                        "keepalive_seconds", DEFAULT_KEEPALIVE_SECONDS
+                    ),
+                )
+            )
+        return _http_client
@@ -0,0 +1,53 @@
+import os
+import threading
+from langchain_core.messages import AIMessage
+from src.batch_inference import BatchBackend, LocalBatchClient
+from src.config import Config
+from src.framework import Framework
+from src.session import Session
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "config", "config.yaml")
+
+
+class FakeLLM:
+    """Answers every decision prompt the same way, without a provider"""
+
+    def __init__(self, model: str, temperature: float):
+        self.model_name = model
+        self.temperature = temperature
+
+    def invoke(self, messages):
+        return AIMessage(content="DECISION: 1\nREASONING: The parent was supportive.")
+
+
+def test_batch_run_with_duplicate_prompts_completes(tmp_path, monkeypatch):
+    monkeypatch.setenv("TOGETHER_API_KEY", "test")
+    monkeypatch.setattr(Framework, "_create_llm", staticmethod(FakeLLM))
+    config = Config(config_path=CONFIG_PATH)
+    # Coalesce every request, so identical prompts would share one call
+    config.get()["single_flight"] = {"max_temperature": 2.0}
+    framework = Framework(config=config)
+    framework.batch_backend = BatchBackend(
+        LocalBatchClient(str(tmp_path / "local"), FakeLLM),
+        str(tmp_path),
+        poll_seconds=0.01,
+    )
+
+    # New sessions given the same message render exactly the same decision prompt
+    jobs = [
+        lambda: framework.generate_decision(Session(priority="batch"), "Well done!")
+        for _ in range(4)
+    ]
+    results = []
+    runner = threading.Thread(
+        target=lambda: results.extend(framework.batch_backend.run(jobs)), daemon=True
+    )
+    runner.start()
+    runner.join(timeout=30)
+
+    assert not runner.is_alive(), "batch run hung on coalesced duplicate prompts"
+    assert [future.result() for future in results] == [
+        (1, "The parent was supportive.")
+    ] * 4
+    assert framework.batch_backend.rounds == 1
+    assert framework.batch_backend.requests == 4
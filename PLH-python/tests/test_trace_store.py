@@ -0,0 +1,33 @@
+from src.conversation_tracer import ConversationTracer, TraceEntry
+from src.trace_store import TraceStore
+
+
+def tracer_with(parents):
+    tracer = ConversationTracer()
+    for parent in parents:
+        tracer.add_entry(TraceEntry(parent, f"child {parent}", 1, "reasoning"))
+    return tracer
+
+
+def stored_parents(store, session_id):
+    return [entry.parent for entry in store.load(session_id).get_full_trace()]
+
+
+def test_saving_again_only_adds_new_turns(tmp_path):
+    store = TraceStore(str(tmp_path / "traces.sqlite"))
+    tracer = tracer_with(["one", "two"])
+    store.save("alice", tracer)
+    tracer.add_entry(TraceEntry("three", "child three", 1, "reasoning"))
+    store.save("alice", tracer)
+
+    assert stored_parents(store, "alice") == ["one", "two", "three"]
+
+
+def test_new_conversation_under_reused_id_replaces_the_old_one(tmp_path):
+    store = TraceStore(str(tmp_path / "traces.sqlite"))
+    store.save("alice", tracer_with(["old0", "old1", "old2"]))
+    store.save("alice", tracer_with(["new0", "new1"]))
+
+    assert stored_parents(store, "alice") == ["new0", "new1"]
+    assert [hit.session_id for hit in store.search("old0")] == []
+    assert [hit.turn_index for hit in store.search("new1")] == [1]